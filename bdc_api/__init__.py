@@ -1,4 +1,32 @@
 name = "bdc_api"
 
+import importlib
+
 from .bdc_api import BdcApi
 from .bdc_api import BdcApiException
+
+# The other classes are imported on first use, keeping `import bdc_api` fast.
+_LAZY = {'AsyncBdcApi': 'async_bdc_api',
+         'QueryFuture': 'query',
+         'MetadataCache': 'cache',
+         'CatalogIndex': 'catalog',
+         'QueryGroup': 'query',
+         'Metrics': 'metrics',
+         'ZipStreamExtractor': 'archive',
+         'open_query_result': 'archive',
+         'FileStore': 'store',
+         'QueryRegistry': 'registry',
+         'RequestScheduler': 'scheduler',
+         'ConversionPipeline': 'convert'}
+
+__all__ = ['BdcApi', 'BdcApiException'] + list(_LAZY)
+
+def __getattr__(attribute):
+    if attribute not in _LAZY:
+        raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, attribute))
+    value = getattr(importlib.import_module('.' + _LAZY[attribute], __name__), attribute)
+    globals()[attribute] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,24 @@
+import contextlib
+import sqlite3
+
+@contextlib.contextmanager
+def connect(path):
+    """Open a short-lived connection to the database at `path`, committed when
+    the block succeeds and rolled back otherwise, so that the objects keeping
+    their state there can be used from any thread.
+    """
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def create(path, *statements):
+    """Switch the database at `path` to write-ahead logging, which lets other
+    processes read while one writes, and run `statements` creating its schema.
+    """
+    with connect(path) as connection:
+        connection.execute('PRAGMA journal_mode=WAL')
+        for statement in statements:
+            connection.execute(statement)
@@ -0,0 +1,499 @@
+import io
+import mmap
+import os
+import queue
+import struct
+import threading
+import zipfile
+import zlib
+
+from .bdc_api import BdcApiException
+
+class ZipStreamExtractor(object):
+    """Extracts the members of a zip archive while its bytes are still arriving.
+
+    Chunks passed to `feed` are parsed from a background thread, which reads
+    the local file headers in order, decompresses each member into `target`
+    and reports it as soon as it is complete, so that processing can start
+    before the download finishes. Members which cannot be extracted from a
+    stream (encrypted members, compression methods other than stored and
+    deflate, stored members of unknown size) stop the streaming extraction;
+    they are extracted from the complete archive by `extract_remaining`.
+    Other results, e.g. HDF5 files, are passed through without extracting
+    anything, and leave `is_zip` False.
+    """
+    CHUNK_SIZE = 256 * 1024
+    MAX_PENDING_CHUNKS = 16
+    LOCAL_HEADER = b'PK\x03\x04'
+    DATA_DESCRIPTOR = b'PK\x07\x08'
+    END_OF_ENTRIES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06', b'PK\x06\x07')
+
+    def __init__(self, target, on_member=None):
+        """Create an extractor.
+
+        Parameters:
+
+            :target: Directory to extract the members into, created if missing.
+            :on_member: Optional function called with the path of each extracted
+                        file, or a `queue.Queue` the paths are put into. Called
+                        from the extractor thread.
+
+        Returns:
+
+            - New `ZipStreamExtractor` object, whose thread is started.
+
+        Raises:
+
+            - None.
+        """
+        os.makedirs(target, exist_ok=True)
+        self.target = target
+        self.on_member = on_member
+        self.members = []
+        self.names = set()
+        self.fallback = False
+        self.is_zip = False
+        self.error = None
+        self._chunks = queue.Queue(self.MAX_PENDING_CHUNKS)
+        self._buffer = bytearray()
+        self._done = False
+        self._thread = threading.Thread(target=self._run, name='ZipStreamExtractor', daemon=True)
+        self._thread.start()
+
+    def feed(self, chunk):
+        """Pass the next bytes of the archive, blocking while the extractor is
+        `MAX_PENDING_CHUNKS` chunks behind."""
+        if chunk:
+            self._chunks.put(bytes(chunk))
+
+    def feed_file(self, path, stop=None):
+        """Pass the first `stop` bytes (all by default) of the archive saved at `path`."""
+        with open(path, 'rb') as f:
+            remaining = os.path.getsize(path) if stop is None else stop
+            while remaining > 0:
+                chunk = f.read(min(self.CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.feed(chunk)
+                remaining -= len(chunk)
+
+    def close(self):
+        """Signal the end of the archive and wait for the extraction to finish.
+
+        Returns:
+
+            - List of the paths of the extracted files.
+
+        Raises:
+
+            - BdcApiException if the archive could not be extracted.
+        """
+        self._chunks.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise BdcApiException('Error occurred while extracting archive to {0}. '
+                                  'Details: {1}'.format(self.target, self.error))
+        return self.members
+
+    def abort(self):
+        """Stop the extraction of an archive which will not be completed. Members
+        already extracted are kept."""
+        self._chunks.put(None)
+        self._thread.join()
+
+    def extract_remaining(self, path):
+        """Extract the members of the complete archive at `path` which were not
+        extracted while streaming, see `fallback`.
+
+        Returns:
+
+            - List of the paths of all extracted files.
+
+        Raises:
+
+            - BdcApiException if the archive could not be extracted.
+        """
+        try:
+            with zipfile.ZipFile(path) as archive:
+                for info in archive.infolist():
+                    if info.filename in self.names:
+                        continue
+                    member_path = self._member_path(info.filename)
+                    if info.is_dir():
+                        os.makedirs(member_path, exist_ok=True)
+                        continue
+                    os.makedirs(os.path.dirname(member_path), exist_ok=True)
+                    with archive.open(info) as source, open(member_path, 'wb') as f:
+                        while True:
+                            chunk = source.read(self.CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                    self._emit(info.filename, member_path)
+        except (OSError, RuntimeError, zipfile.BadZipFile) as e:
+            raise BdcApiException('Error occurred while extracting {0} to {1}. Details: '
+                                  '{2}'.format(path, self.target, e))
+        return self.members
+
+    def _run(self):
+        try:
+            self._extract_members()
+        except Exception as e:
+            self.error = e
+        # Drain what remains, so that `feed` never blocks.
+        while not self._done:
+            self._done = self._chunks.get() is None
+
+    def _extract_members(self):
+        signature = self._read(4, allow_eof=True)
+        if signature != self.LOCAL_HEADER and signature not in self.END_OF_ENTRIES:
+            # Not a zip archive, e.g. an HDF5 query result: nothing to extract.
+            return
+        self.is_zip = True
+        while signature == self.LOCAL_HEADER:
+            if not self._extract_member():
+                self.fallback = True
+                return
+            signature = self._read(4, allow_eof=True)
+        if signature and signature not in self.END_OF_ENTRIES:
+            raise zipfile.BadZipFile('Unexpected signature {0!r}.'.format(signature))
+
+    def _extract_member(self):
+        """Extract the member whose local header signature was just read.
+        Returns False if it can only be extracted from the complete archive."""
+        (flags, method, crc, compressed_size, size, name_length,
+         extra_length) = struct.unpack('<2xHH4xIIIHH', self._read(26))
+        raw_name = self._read(name_length)
+        extra = self._read(extra_length)
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+        zip64 = False
+        for field_id, data in _extra_fields(extra):
+            if field_id == 0x0001:
+                zip64 = True
+                count = len(data) // 8
+                values = list(struct.unpack('<{0}Q'.format(count), data[:count * 8]))
+                if size == 0xFFFFFFFF and values:
+                    size = values.pop(0)
+                if compressed_size == 0xFFFFFFFF and values:
+                    compressed_size = values.pop(0)
+        descriptor = bool(flags & 0x08)
+        if flags & 0x01 or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or (
+                method == zipfile.ZIP_STORED and descriptor and not compressed_size):
+            return False
+        member_path = self._member_path(name)
+        directory = name.endswith('/')
+        os.makedirs(member_path if directory else os.path.dirname(member_path), exist_ok=True)
+        decompressor = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+        checksum = 0
+        # Directories have no content, but may still hold e.g. an empty deflate stream.
+        with open(os.devnull if directory else member_path, 'wb') as f:
+            remaining = None if descriptor and decompressor else compressed_size
+            while remaining is None or remaining > 0:
+                chunk = self._read_some(remaining)
+                if not chunk:
+                    raise zipfile.BadZipFile('Archive ends inside member "{0}".'.format(name))
+                if remaining is not None:
+                    remaining -= len(chunk)
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                    if decompressor.eof and remaining is None:
+                        # Give back what follows the deflate stream.
+                        self._buffer[0:0] = decompressor.unused_data
+                        remaining = 0
+                f.write(chunk)
+                checksum = zlib.crc32(chunk, checksum)
+            if decompressor is not None:
+                tail = decompressor.flush()
+                f.write(tail)
+                checksum = zlib.crc32(tail, checksum)
+        if descriptor:
+            field = self._read(4)
+            if field == self.DATA_DESCRIPTOR:
+                field = self._read(4)
+            crc = struct.unpack('<I', field)[0]
+            self._read(16 if zip64 else 8)
+        if checksum != crc:
+            raise zipfile.BadZipFile('Bad CRC-32 for member "{0}".'.format(name))
+        if directory:
+            self.names.add(name)
+        else:
+            self._emit(name, member_path)
+        return True
+
+    def _emit(self, name, member_path):
+        self.names.add(name)
+        self.members.append(member_path)
+        if self.on_member is None:
+            return
+        if hasattr(self.on_member, 'put'):
+            self.on_member.put(member_path)
+        else:
+            self.on_member(member_path)
+
+    def _member_path(self, name):
+        """Path of member `name` inside `target`, ignoring absolute paths and `..`
+        components the same way `zipfile.ZipFile.extract` does."""
+        parts = [part for part in name.replace('\\', '/').split('/')
+                 if part not in ('', '.', '..')]
+        return os.path.join(self.target, *parts)
+
+    def _fill(self):
+        """Wait for the next chunk. Returns False at the end of the archive."""
+        if self._done:
+            return False
+        chunk = self._chunks.get()
+        if chunk is None:
+            self._done = True
+            return False
+        self._buffer += chunk
+        return True
+
+    def _read(self, size, allow_eof=False):
+        while len(self._buffer) < size:
+            if not self._fill():
+                if allow_eof and not self._buffer:
+                    return b''
+                raise zipfile.BadZipFile('Archive is truncated.')
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _read_some(self, limit=None):
+        if not self._buffer:
+            self._fill()
+        size = len(self._buffer) if limit is None else min(limit, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+def _extra_fields(extra):
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, length = struct.unpack('<HH', extra[position:position + 4])
+        yield field_id, extra[position + 4:position + 4 + length]
+        position += 4 + length
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+def open_query_result(path):
+    """Open a query result saved by `BdcApi.save_file` without extracting or
+    reading it: the file is memory-mapped and only the bytes actually accessed
+    are read from disk.
+
+    Parameters:
+
+        :path: Path of the saved zip archive or HDF5 file.
+
+    Returns:
+
+        - `ZipQueryResult` or `HdfQueryResult`, both usable as context managers.
+
+    Raises:
+
+        - BdcApiException if the file is neither a zip archive nor an HDF5 file,
+          or cannot be opened.
+    """
+    try:
+        with open(path, 'rb') as f:
+            signature = f.read(len(HDF5_SIGNATURE))
+    except OSError as e:
+        raise BdcApiException('Error occurred while opening {0}. Details: {1}'.format(path, e))
+    if signature == HDF5_SIGNATURE:
+        return HdfQueryResult(path)
+    if signature[:4] in (ZipStreamExtractor.LOCAL_HEADER,) + ZipStreamExtractor.END_OF_ENTRIES:
+        return ZipQueryResult(path)
+    raise BdcApiException('{0} is neither a zip archive nor an HDF5 file.'.format(path))
+
+class ZipQueryResult(object):
+    """Random access to the members of a memory-mapped zip query result.
+
+    Only the central directory is read when opening. Members stored without
+    compression are exposed as `memoryview` slices of the mapping (`view`) or
+    file-like objects over them (`open`), without any copy; compressed members
+    are decompressed lazily as they are read. Views must be released before
+    `close` is called.
+    """
+
+    def __init__(self, path):
+        """Open and memory-map `path`. See `open_query_result`."""
+        self.path = path
+        try:
+            self._file = open(path, 'rb')
+            try:
+                size = os.fstat(self._file.fileno()).st_size
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) \
+                    if size else b''
+                self._zip = zipfile.ZipFile(self._file)
+            except BaseException:
+                self._file.close()
+                raise
+        except (OSError, ValueError, zipfile.BadZipFile) as e:
+            raise BdcApiException('Error occurred while opening {0}. Details: {1}'.format(path, e))
+        self._infos = {info.filename: info for info in self._zip.infolist()
+                       if not info.is_dir()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._infos)
+
+    def __iter__(self):
+        return iter(self._infos)
+
+    def __contains__(self, name):
+        return name in self._infos
+
+    def names(self):
+        """Return the names of the member files, in archive order."""
+        return list(self._infos)
+
+    def info(self, name):
+        """Return the `zipfile.ZipInfo` of member `name`."""
+        try:
+            return self._infos[name]
+        except KeyError:
+            raise BdcApiException('No member "{0}" in {1}.'.format(name, self.path))
+
+    def view(self, name):
+        """Return a read-only `memoryview` of the content of member `name`, which
+        must be stored without compression (see `open` otherwise)."""
+        info = self.info(name)
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x01:
+            raise BdcApiException('Member "{0}" is compressed, use open() to read it.'.format(
+                name))
+        start = self._data_offset(info)
+        return memoryview(self._map)[start:start + info.file_size]
+
+    def open(self, name):
+        """Return a seekable binary file-like object reading member `name`,
+        backed by `view` for stored members."""
+        info = self.info(name)
+        if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x01:
+            return io.BufferedReader(_MemoryReader(self.view(name)))
+        return self._zip.open(info)
+
+    def read(self, name):
+        """Return a copy of the content of member `name` as bytes."""
+        with self.open(name) as f:
+            return f.read()
+
+    def hdf(self, name):
+        """Open member `name`, an HDF5 file, as an `h5py.File` reading it lazily
+        through `open`. Requires the optional `h5py` dependency."""
+        return _h5py().File(self.open(name), 'r')
+
+    def close(self):
+        """Unmap and close the archive."""
+        try:
+            if self._map:
+                self._map.close()
+        except BufferError:
+            raise BdcApiException('Release all member views of {0} before closing it.'.format(
+                self.path))
+        self._zip.close()
+        self._file.close()
+
+    def _data_offset(self, info):
+        """Offset of the data of a member, after its local header."""
+        header = bytes(self._map[info.header_offset:info.header_offset + 30])
+        if header[:4] != ZipStreamExtractor.LOCAL_HEADER:
+            raise BdcApiException('Bad local header for member "{0}" in {1}.'.format(
+                info.filename, self.path))
+        name_length, extra_length = struct.unpack('<HH', header[26:30])
+        return info.header_offset + 30 + name_length + extra_length
+
+class HdfQueryResult(object):
+    """Lazy access to the datasets of an HDF5 query result. Datasets are
+    `h5py.Dataset` handles read only when sliced; `array` maps contiguous
+    uncompressed datasets straight from the file. Requires the optional `h5py`
+    dependency.
+    """
+
+    def __init__(self, path):
+        """Open `path`. See `open_query_result`."""
+        self.path = path
+        try:
+            self.file = _h5py().File(path, 'r')
+        except OSError as e:
+            raise BdcApiException('Error occurred while opening {0}. Details: {1}'.format(path, e))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getitem__(self, name):
+        return self.file[name]
+
+    def __contains__(self, name):
+        return name in self.file
+
+    def names(self):
+        """Return the paths of all datasets in the file."""
+        names = []
+        self.file.visititems(lambda name, item: names.append(name)
+                             if hasattr(item, 'shape') else None)
+        return names
+
+    def array(self, name):
+        """Return dataset `name` as a read-only `numpy.memmap` of the file if it is
+        stored contiguously without filters, else its lazy `h5py.Dataset`."""
+        dataset = self.file[name]
+        offset = dataset.id.get_offset()
+        if dataset.chunks is not None or offset is None or dataset.dtype.hasobject:
+            return dataset
+        import numpy
+        return numpy.memmap(self.path, mode='r', dtype=dataset.dtype, offset=offset,
+                            shape=dataset.shape)
+
+    def close(self):
+        """Close the file. Arrays returned by `array` remain valid."""
+        self.file.close()
+
+class _MemoryReader(io.RawIOBase):
+    """Seekable raw binary stream over a `memoryview`."""
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super(_MemoryReader, self).close()
+
+def _h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError('Reading HDF5 query results requires h5py, install it with '
+                          '`pip install h5py`.')
+    return h5py
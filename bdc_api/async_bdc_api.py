@@ -0,0 +1,283 @@
+import asyncio
+import os
+import time
+
+from .bdc_api import (BdcApi, BdcApiException, b64encode, json_loads, _datacollection_names,
+                      _datacollection_parameters, _decode_json, _error_message,
+                      _file_parameters, _query_id, _query_info, _valid_id)
+
+class AsyncBdcApi(object):
+    """Class responsible for handling all API calls from asyncio code.
+
+    Mirrors the `BdcApi` methods as coroutines, sharing one pooled `aiohttp`
+    client session between them, so that many requests can be outstanding on
+    a single thread. Requires the optional `aiohttp` dependency
+    (`pip install bdc_api[async]`). Use it as an async context manager, or
+    call `close` when done:
+
+    .. code-block:: python
+
+        async with AsyncBdcApi(USERNAME, API_KEY, HOST) as api:
+            query_id = await api.start_datacollection_query(name)
+    """
+    URL_TASK_NUMBERS = BdcApi.URL_TASK_NUMBERS
+    URL_DOMAINS = BdcApi.URL_DOMAINS
+    URL_DATACOLLECTIONS = BdcApi.URL_DATACOLLECTIONS
+    URL_FILELIST = BdcApi.URL_FILELIST
+    URL_QUERY = BdcApi.URL_QUERY
+    URL_PROGRESS = BdcApi.URL_PROGRESS
+    URL_DOWNLOAD = BdcApi.URL_DOWNLOAD
+    COMPLETE_QUERY = BdcApi.COMPLETE_QUERY
+    QUERY_ACCEPT_TYPES = BdcApi.QUERY_ACCEPT_TYPES
+    COMPLETE_QUERY_STATUS = BdcApi.COMPLETE_QUERY_STATUS
+    DOWNLOAD_CHUNK_SIZE = BdcApi.DOWNLOAD_CHUNK_SIZE
+    QueryInfo = BdcApi.QueryInfo
+
+    def __init__(self, username, api_key, hostname, max_connections=100):
+        """Initialize username, API key, and session information.
+
+        Parameters:
+
+            :username: valid API username.
+            :api_key: valid API key generated from the wesbite under `REST API Key Manager`.
+            :hostname: Hostname to be used throughout the session (e.g: `https://minos.lbl.gov`)
+            :max_connections: Size of the connection pool (default 100). Further
+                              requests wait for a free connection.
+
+        Returns:
+
+            - New `AsyncBdcApi` object. The client session is created on first use.
+
+        Raises:
+
+            - None.
+        """
+        self._host = hostname
+        self.username = username
+        self.auth_header = 'Basic {0}'.format(b64encode('{0}:{1}'.format(username, api_key)))
+        self.max_connections = max_connections
+        self.session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying client session and its pooled connections."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def get_task_numbers(self):
+        """Coroutine version of `BdcApi.get_task_numbers`."""
+        return await self._send_get(self.URL_TASK_NUMBERS)
+
+    async def get_domains(self, task_ID=''):
+        """Coroutine version of `BdcApi.get_domains`."""
+        if not _valid_id(task_ID):
+            raise BdcApiException(f'{task_ID} is not a valid ObjectId!')
+        return await self._send_get('{0}/{1}'.format(self.URL_DOMAINS, task_ID))
+
+    async def get_datacollections(self, task_numbers=[], domains=[], time_limits=[], limit=0):
+        """Coroutine version of `BdcApi.get_datacollections`."""
+        parameters = _datacollection_parameters(task_numbers, domains, time_limits, limit)
+        if parameters != {}:
+            document = await self._send_get(self.URL_DATACOLLECTIONS, parameters=parameters,
+                                            required=False)
+        else:
+            document = await self._send_get('{0}/'.format(self.URL_DATACOLLECTIONS),
+                                            required=False)
+        if document is None:
+            raise BdcApiException('No datacollections found.')
+        return _datacollection_names(None, document)
+
+    async def get_files(self, datacollections=[], extensions='', limit=0):
+        """Coroutine version of `BdcApi.get_files`."""
+        parameters = _file_parameters(datacollections, extensions, limit)
+        return await self._send_get(self.URL_FILELIST, parameters=parameters)
+
+    async def start_files_query(self, files):
+        """Coroutine version of `BdcApi.start_files_query`."""
+        if not isinstance(files, list):
+            files = [files]
+        post_data = {'filepaths': ','.join(files)}
+        headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES)}
+        return _query_id(await self._send_post(self.URL_QUERY, post_data, headers=headers))
+
+    async def start_datacollection_query(self, datacollection):
+        """Coroutine version of `BdcApi.start_datacollection_query`."""
+        if not isinstance(datacollection, str):
+            raise BdcApiException('Please use a datacollection name in string form.')
+        post_data = {'datacollection': datacollection}
+        headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES)}
+        return _query_id(await self._send_post(self.URL_QUERY, post_data, headers=headers))
+
+    async def check_query_progress(self, query_id):
+        """Coroutine version of `BdcApi.check_query_progress`."""
+        if not _valid_id(query_id):
+            raise BdcApiException(f'{query_id} is not a valid ObjectId!')
+        return _query_info(await self._send_get('{0}/{1}'.format(self.URL_PROGRESS, query_id)))
+
+    async def save_file(self, query_id, jupyterhub=False, local_path=""):
+        """Coroutine version of `BdcApi.save_file`. Local downloads are streamed in
+        chunks of `DOWNLOAD_CHUNK_SIZE` bytes, with the disk writes handed to the
+        event loop's default executor so they never block the loop. Resumable and
+        segmented downloads are only available from `BdcApi`.
+        """
+        if not _valid_id(query_id):
+            raise BdcApiException(f'{query_id} is not a valid ObjectId!')
+        url = '{0}/{1}'.format(self.URL_DOWNLOAD, str(query_id))
+        if jupyterhub:
+            return await self._send_get(url, parameters={'jupyterhub': 1})
+        if not os.path.exists(local_path) or not os.path.isdir(local_path):
+            raise BdcApiException('Invalid directory "{0}".'.format(local_path))
+        session = await self._get_session()
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        partial_path = os.path.join(local_path, '{0}.partial'.format(query_id))
+        started = time.time()
+        size = 0
+        try:
+            headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES)}
+            async with session.get('{0}/{1}'.format(self._host, url), headers=headers) as response:
+                if response.status >= 400:
+                    raise BdcApiException('Error sending request to host server: {0}'.format(
+                        response.status))
+                body = None
+                if response.content_type.endswith('json'):
+                    # Error messages come as JSON, any other body is the file.
+                    body = await response.read()
+                    self._decode(body, required=False)
+                try:
+                    file_name = response.headers['content-disposition'].split("=")[1].strip()
+                    if not file_name:
+                        raise ValueError('Empty file name {0}.'.format(file_name))
+                except Exception as e:
+                    raise BdcApiException('Error occurred while retrieving file name from '
+                                          'response. Details: {0}'.format(e))
+                f = await loop.run_in_executor(None, open, partial_path, 'wb')
+                try:
+                    if body is not None:
+                        await loop.run_in_executor(None, f.write, body)
+                        size = len(body)
+                    else:
+                        async for chunk in response.content.iter_chunked(
+                                self.DOWNLOAD_CHUNK_SIZE):
+                            await loop.run_in_executor(None, f.write, chunk)
+                            size += len(chunk)
+                finally:
+                    await loop.run_in_executor(None, f.close)
+            full_path = os.path.join(local_path, file_name)
+            await loop.run_in_executor(None, os.replace, partial_path, full_path)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise BdcApiException(
+                'Error occurred while saving file to {0}. Details: {1}'.format(local_path, e))
+        elapsed = time.time() - started
+        return {'message': ('Successfully downloaded query results to "{0}". Filename is: '
+                            '{1}.').format(local_path, file_name),
+                'path': full_path,
+                'bytes': size,
+                'seconds': elapsed,
+                'throughput': size / elapsed if elapsed > 0 else float(size),
+                'resumed_from': 0,
+                'segments': 1}
+
+    async def _get_session(self):
+        """Helper coroutine returning the pooled client session, created on first use
+        since `aiohttp` sessions must be created from a running event loop.
+        """
+        if self.session is None:
+            try:
+                import aiohttp
+            except ImportError:
+                raise ImportError('AsyncBdcApi requires aiohttp, install it with '
+                                  '`pip install bdc_api[async]`.')
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                headers={'Authorization': self.auth_header})
+        return self.session
+
+    def _decode(self, content, required=True):
+        """Helper function decoding a JSON response body, raising BdcApiException if
+        it holds an error message, or if it is not JSON and `required`. Returns None
+        for bodies which are not JSON otherwise."""
+        if required:
+            document = _decode_json(content)
+        else:
+            try:
+                document = json_loads(content)
+            except ValueError:
+                return None
+        message = _error_message(document)
+        if message is not None:
+            raise BdcApiException('Error occurred while making request: {0}'.format(message))
+        return document
+
+    async def _send_get(self, url, parameters=None, headers=None, required=True):
+        """Helper coroutine to send GET requests.
+
+        Parameters:
+
+            :url: URL of API endpoint suffix as a string.
+            :parameters: GET parameters to include.
+            :headers: Request headers to include.
+            :required: Whether the response must be a JSON document (default True).
+
+        Returns:
+
+            - Decoded JSON body of the response, or None if it is not JSON and not
+              `required`.
+
+        Raises:
+
+            - BdcApiException on problematic requests (e.g. malformed inputs or
+                issues reaching the API endpoint), or on bodies which are not
+                JSON if `required`.
+        """
+        session = await self._get_session()
+        import aiohttp
+        try:
+            async with session.get('{0}/{1}'.format(self._host, url), params=parameters,
+                                   headers=headers) as response:
+                content = await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise BdcApiException('Error sending request to host server: {0}'.format(e))
+        if status >= 400:
+            raise BdcApiException('Error sending request to host server: {0}'.format(status))
+        return self._decode(content, required)
+
+    async def _send_post(self, url, post_data, headers=None):
+        """Helper coroutine to send POST requests.
+
+        Parameters:
+
+            :url: of API endpoint suffix as a string.
+            :post_data: Data to attach to POST request.
+            :headers: Request headers to include.
+
+        Returns:
+
+            - Decoded JSON body of the response.
+
+        Raises:
+
+            - BdcApiException on problematic requests (e.g. malformed inputs or
+                issues reaching the API endpoint), or on bodies which are not JSON.
+        """
+        session = await self._get_session()
+        import aiohttp
+        try:
+            async with session.post('{0}/{1}/'.format(self._host, url), data=post_data,
+                                    headers=headers) as response:
+                content = await response.read()
+                status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise BdcApiException('Error sending request to host server: {0}'.format(e))
+        if status >= 400:
+            raise BdcApiException('Error sending request to host server: {0}'.format(status))
+        return self._decode(content)
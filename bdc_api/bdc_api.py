@@ -1,27 +1,294 @@
-import requests
+import functools
 import json
 import os
-import six
 import base64
+import codecs
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
 import urllib
 
-from bson import ObjectId
-from bson.errors import InvalidId
 from collections import namedtuple
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, as_completed, wait
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 def b64encode(source):
-    """Base-64 encoding method compatible with python2 and python3.
+    """Base-64 encode `source`, a str or bytes, into a str.
     """
-    if six.PY3:
+    if isinstance(source, str):
         source = source.encode('utf-8')
     content = base64.b64encode(source).decode('utf-8')
     return content
 
+def json_loads(content):
+    """Decode a JSON document from bytes or str, with `orjson` when it is installed.
+    Documents `orjson` rejects, e.g. holding `NaN` or integers wider than 64 bits,
+    are decoded by `json` like before.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(content)
+
+def _decode_json(content):
+    """Decode a JSON response body, raising BdcApiException if it is not JSON.
+    """
+    try:
+        return json_loads(content)
+    except ValueError as e:
+        raise BdcApiException('Error occurred while decoding response. Details: {0}'.format(e))
+
+_seek_lock = threading.Lock()
+
+def pwrite(fd, data, offset):
+    """Write all of `data` to file descriptor `fd` at position `offset`, without
+    moving the file position where `os.pwrite` is available.
+    """
+    view = memoryview(data)
+    while view:
+        if hasattr(os, 'pwrite'):
+            written = os.pwrite(fd, view, offset)
+        else:
+            with _seek_lock:
+                os.lseek(fd, offset, os.SEEK_SET)
+                written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
 class BdcApiException(Exception):
     pass
 
+@functools.lru_cache(maxsize=None)
+def _jittered_retry():
+    """Return the retry policy class, defined on first use so that `urllib3` is
+    only imported along with `requests`.
+    """
+    from urllib3.util.retry import Retry
+
+    class _JitteredRetry(Retry):
+        """Retry policy drawing each backoff uniformly between zero and the
+        exponential backoff time ("full jitter"), so that clients failing together
+        do not retry together. A `Retry-After` header still takes precedence.
+        """
+
+        def get_backoff_time(self):
+            return random.uniform(0, super(_JitteredRetry, self).get_backoff_time())
+
+    return _JitteredRetry
+
+_OBJECT_ID = re.compile(r'[0-9a-fA-F]{24}')
+
+def _valid_id(to_validate):
+    """Check that `to_validate` is empty or a valid ObjectId: 24 hexadecimal
+    digits, 12 bytes, or an `ObjectId`.
+    """
+    if not to_validate:
+        return True
+    if isinstance(to_validate, bytes):
+        return len(to_validate) == 12
+    if not isinstance(to_validate, str):
+        to_validate = str(to_validate)
+    return _OBJECT_ID.fullmatch(to_validate) is not None
+
+def _datacollection_parameters(task_numbers, domains, time_limits, limit):
+    """Build the GET parameters of a datacollections request.
+    """
+    if not isinstance(task_numbers, list):
+        task_numbers = [task_numbers]
+    if not isinstance(domains, list):
+        domains = [domains]
+
+    parameters = {}
+    if task_numbers:
+        parameters['tasks'] = ','.join(task_numbers)
+    if domains:
+        parameters['domains'] = ','.join(domains)
+    if time_limits: 
+        parameters['time_limits'] = ','.join([str(number) for number in time_limits])
+    if limit:
+        parameters['limit'] = limit
+    return parameters
+
+def _datacollection_names(content, document=None):
+    """Extract the datacollection names from the body of a datacollections response,
+    or from `document` if it was decoded already.
+    """
+    if document is None:
+        try:
+            document = json_loads(content)
+        except ValueError as e:
+            if len(content) == 0:
+                raise BdcApiException('No datacollections found.')
+            else:
+                raise e
+    return [doc['name'] for doc in document]
+
+def _time_windows(time_limits, window):
+    """Split `time_limits` into consecutive windows of at most `window`, sharing
+    their bounds.
+    """
+    if len(time_limits) != 2 or not window or window <= 0:
+        raise BdcApiException('Sharding needs 2 time limits and a positive window.')
+    start, end = time_limits
+    windows = []
+    while start < end:
+        stop = min(start + window, end)
+        windows.append([start, stop])
+        start = stop
+    return windows or [list(time_limits)]
+
+def _file_parameters(datacollections, extensions, limit):
+    """Build the GET parameters of a files request.
+    """
+    if not isinstance(datacollections, list):
+        datacollections = [datacollections]
+    parameters = {'limit': limit}
+    if datacollections:
+        parameters['datacollections'] = ','.join(list(datacollections))
+    if extensions:
+        parameters['extensions'] = extensions
+    return parameters
+
+def _iter_file_listing(chunks):
+    """Incrementally parse the body of a files response, given as an iterable of
+    byte chunks, yielding `(datacollection, filename)` pairs as soon as they are
+    complete. Only the current, unparsed part of the body is held in memory.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    buf, pos, state, datacollection, eof = '', 0, 'start', None, False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+        token = None
+        if pos < len(buf) and buf[pos] == '"':
+            try:
+                token, end = json.decoder.scanstring(buf, pos + 1)
+            except ValueError:
+                if eof:
+                    raise BdcApiException(
+                        'Malformed files listing near "{0}".'.format(buf[pos:pos + 50]))
+        if pos == len(buf) or (buf[pos] == '"' and token is None):
+            if eof:
+                if state not in ('start', 'end'):
+                    raise BdcApiException('Files listing ended unexpectedly.')
+                return
+            chunk = next(chunks, None)
+            eof = chunk is None
+            buf = buf[pos:] + decoder.decode(chunk or b'', final=eof)
+            pos = 0
+            continue
+        char = buf[pos]
+        if state == 'start' and char == '{':
+            state = 'key'
+        elif state == 'key' and token is not None:
+            datacollection, state = token, 'colon'
+        elif state in ('key', 'after_value') and char == '}':
+            state = 'end'
+        elif state == 'colon' and char == ':':
+            state = 'value'
+        elif state == 'value' and char == '[':
+            state = 'item'
+        elif state == 'value' and token is not None and datacollection in ('error_message',
+                                                                           'errormessage'):
+            raise BdcApiException('Error occurred while making request: {0}'.format(token))
+        elif state == 'item' and token is not None:
+            yield datacollection, token
+            state = 'after_item'
+        elif state in ('item', 'after_item') and char == ']':
+            state = 'after_value'
+        elif state == 'after_item' and char == ',':
+            state = 'item'
+        elif state == 'after_value' and char == ',':
+            state = 'key'
+        else:
+            raise BdcApiException('Malformed files listing near "{0}".'.format(buf[pos:pos + 50]))
+        pos = end if token is not None else pos + 1
+
+def _query_id(response):
+    """Extract the query ID from the decoded body of a query request response.
+    """
+    if 'query_id' in response:
+        return response['query_id']
+    elif 'error_message' in response:
+        raise BdcApiException(response['error_message'])
+    else:
+        raise BdcApiException('Unknown response received when requesting files!')
+
+def _query_info(response):
+    """Build a `BdcApi.QueryInfo` from the decoded body of a progress response.
+    """
+    if 'errormessage' in response:
+        raise BdcApiException(response['errormessage'])
+    else:
+        return BdcApi.QueryInfo(progress=response['progress'], 
+                        status=response['job_status'])
+
+def _error_message(document):
+    """Return the error message held by a decoded response body, or None.
+    """
+    if isinstance(document, dict):
+        if 'error_message' in document:
+            return document['error_message']
+        elif 'errormessage' in document:
+            return document['errormessage']
+    return None
+
+def _response_json(response):
+    """Return the decoded body of a response from `BdcApi._send_get` or
+    `BdcApi._send_post`, which were decoded while checking them for errors.
+    """
+    try:
+        return vars(response)['_decoded']
+    except (KeyError, TypeError):
+        return _decode_json(response.content)
+
+def _find_member(members, path, datacollection):
+    """Find the extracted member holding file `path` of `datacollection`, given
+    the members keyed by their name in the archive, which may be prefixed with
+    the datacollection or any other directory. Members prefixed with another
+    datacollection are only used when no member matches more closely.
+    """
+    relative = path.strip('/')
+    for name in ['{0}/{1}'.format(datacollection, relative), relative]:
+        if name in members:
+            return members[name]
+    suffixes = ['/{0}/{1}'.format(datacollection, relative), '/' + relative]
+    for suffix in suffixes:
+        for name, member in members.items():
+            if name.endswith(suffix):
+                return member
+    return None
+
+def _wanted_files(files):
+    """Return the (datacollection, path) pairs of `files`, a dictionary of
+    datacollection names to file paths, and the distinct paths to query.
+    """
+    wanted = list(dict.fromkeys((datacollection, path)
+                                for datacollection, paths in files.items() for path in paths))
+    return wanted, list(dict.fromkeys(path for _, path in wanted))
+
 class BdcApi(object):
     """Class responsible for handling all API calls.
+
+    A `BdcApi` object can be shared by any number of threads: each thread gets
+    its own `requests.Session`, without any request state shared between them,
+    while all sessions use a single thread-safe connection pool sized by
+    `pool_maxsize`.
+
+    It can also be handed to other processes, e.g. through `multiprocessing` or
+    Dask: it pickles down to its configuration, and both unpickled and forked
+    copies open their own connections on first use. Hooks added with
+    `register_hook` are not pickled, and have to be registered again.
     """
     URL_TASK_NUMBERS='minos_restapi/tasks_info'
     URL_DOMAINS='minos_restapi/domains_info'
@@ -32,11 +299,24 @@ class BdcApi(object):
     URL_DOWNLOAD='minos_restapi/download'
     COMPLETE_QUERY = '100%'
     QUERY_ACCEPT_TYPES = ['application/zip', 'application/x-hdf']
+    DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+    LISTING_CHUNK_SIZE = 64 * 1024
+    FILES_QUERY_MAX_BYTES = 256 * 1024
+    CATALOGS_PER_TASK = 256
+    POLL_MIN_INTERVAL = 1
+    POLL_MAX_INTERVAL = 30
+    POLL_BACKOFF = 1.5
+    RETRY_STATUSES = [429, 502, 503, 504]
     COMPLETE_QUERY_STATUS = ['failed', 'cancelled', 'failed (no read access to any data included)',
                              'failed (no data matched all conditions requested)']
     QueryInfo = namedtuple('QueryInfo', 'progress status')
+    DownloadResult = namedtuple('DownloadResult', 'query_id result error')
+    RequestInfo = namedtuple('RequestInfo', 'method endpoint parameters status seconds '
+                             'request_bytes response_bytes retries cached error')
 
-    def __init__(self, username, api_key, hostname):
+    def __init__(self, username, api_key, hostname, cache=None, pool_maxsize=10,
+                 max_retries=3, backoff_factor=0.5, keep_alive=True, pool_block=False,
+                 metrics=None, store=None, registry=None, scheduler=None):
         """Initialize username, API key, and session information.
 
         Parameters:
@@ -44,6 +324,33 @@ class BdcApi(object):
             :username: valid API username.
             :api_key: valid API key generated from the wesbite under `REST API Key Manager`.
             :hostname: Hostname to be used throughout the session (e.g: `https://minos.lbl.gov`)
+            :cache: Optional `MetadataCache` for the responses of `get_task_numbers`,
+                    `get_domains`, `get_datacollections` and `get_files`, or True
+                    for an in-memory cache with default settings.
+            :pool_maxsize: Number of connections kept open per host (default 10).
+                           Should be at least the number of threads sharing
+                           this object, otherwise connections are discarded and
+                           re-established.
+            :max_retries: Number of retries of failed connections, and of GET
+                          requests answered with one of the `RETRY_STATUSES`
+                          (default 3). Queries are never re-submitted.
+            :backoff_factor: Base of the exponential backoff between retries in
+                             seconds (default 0.5). Each wait is drawn at random
+                             below `backoff_factor * 2 ** retry`, unless the
+                             server sends a `Retry-After` header.
+            :keep_alive: Whether to reuse connections between requests (default True).
+            :pool_block: Whether threads wait for a pooled connection to become free
+                         when all `pool_maxsize` connections are in use (default
+                         False), rather than opening a connection which is closed
+                         after the request.
+            :metrics: Optional `Metrics` recording every request, or True for a new
+                      one. See also `register_hook`.
+            :store: Optional `FileStore` of downloaded files, see `fetch_files`.
+            :registry: Optional `QueryRegistry` of started queries, which are then
+                       reused by `start_files_query` and `start_datacollection_query`
+                       for identical requests.
+            :scheduler: Optional `RequestScheduler` rate-limiting the requests and
+                        download bandwidth, which may be shared with other objects.
 
         Returns:
 
@@ -56,7 +363,161 @@ class BdcApi(object):
         self._host = hostname
         self.username = username
         self.auth_header = 'Basic {0}'.format(b64encode('{0}:{1}'.format(username, api_key)))
-        self.session = requests.Session()
+        self.transport_options = {'pool_maxsize': pool_maxsize,
+                                  'max_retries': max_retries,
+                                  'backoff_factor': backoff_factor,
+                                  'keep_alive': keep_alive,
+                                  'pool_block': pool_block}
+        self._session = None
+        self._reset_transport()
+        if cache is True:
+            from .cache import MetadataCache
+            cache = MetadataCache()
+        self.cache = cache if cache is not False else None
+        if metrics is True:
+            from .metrics import Metrics
+            metrics = Metrics()
+        self.metrics = metrics if metrics is not False else None
+        self.hooks = {'pre_request': [], 'post_request': []}
+        self.store = store
+        self.registry = registry
+        self.scheduler = scheduler
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ('_pid', '_adapter', '_adapter_lock', '_local', '_poller',
+                     '_poller_lock'):
+            del state[name]
+        # Hooks are often lambdas or closures, which cannot be pickled.
+        state['hooks'] = {event: [] for event in self.hooks}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset_transport()
+
+    def _reset_transport(self):
+        """Helper function that (re)creates the connection pool and query poller,
+        which belong to the process that created them.
+        """
+        self._pid = os.getpid()
+        # Created with the first session, so that `requests` is only imported then.
+        self._adapter = None
+        self._adapter_lock = threading.Lock()
+        self._local = threading.local()
+        self._poller = None
+        self._poller_lock = threading.Lock()
+
+    def close(self):
+        """Stop tracking queries, cancelling the outstanding `QueryFuture` objects,
+        and close the pooled connections. The object remains usable, and opens new
+        connections as needed.
+        """
+        with self._poller_lock:
+            poller, self._poller = self._poller, None
+        if poller is not None:
+            poller.shutdown()
+        with self._adapter_lock:
+            adapter, self._adapter = self._adapter, None
+            self._local = threading.local()
+        if adapter is not None:
+            adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _check_fork(self):
+        """Helper function that resets the transport in a forked child process, whose
+        pooled connections would be shared with its parent and whose poller
+        thread does not exist.
+        """
+        if self._pid != os.getpid():
+            self._reset_transport()
+
+    @property
+    def session(self):
+        """The `requests.Session` of the calling thread. Assigning a session
+        replaces the per-thread sessions for all threads.
+        """
+        if self._session is not None:
+            return self._session
+        self._check_fork()
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._new_session()
+        return session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    def _new_adapter(self):
+        """Helper function that creates the transport adapter shared by all
+        sessions, whose connection pool and retry policy follow `transport_options`.
+        """
+        from requests.adapters import HTTPAdapter
+        options = self.transport_options
+        retries = _jittered_retry()(total=options['max_retries'],
+                                    status_forcelist=self.RETRY_STATUSES,
+                                    backoff_factor=options['backoff_factor'],
+                                    respect_retry_after_header=True,
+                                    raise_on_status=False)
+        return HTTPAdapter(pool_maxsize=options['pool_maxsize'], max_retries=retries,
+                           pool_block=options['pool_block'])
+
+    def _new_session(self):
+        """Helper function that creates a session using the shared adapter.
+        """
+        import requests
+        with self._adapter_lock:
+            if self._adapter is None:
+                self._adapter = self._new_adapter()
+        session = requests.Session()
+        session.mount('http://', self._adapter)
+        session.mount('https://', self._adapter)
+        if not self.transport_options['keep_alive']:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def register_hook(self, event, hook):
+        """Call `hook` around every request.
+
+        Parameters:
+
+            :event: `pre_request` to call `hook` before each request is sent, or
+                    `post_request` to call it once it is answered or has failed,
+                    and for each metadata request served from `cache`.
+            :hook: Function receiving a named tuple RequestInfo, holding the
+                   `method`, the `endpoint` (one of the `URL_*` constants), the
+                   request `parameters`, and after the request the HTTP `status`,
+                   the latency in `seconds` (until the headers for streamed
+                   downloads), `request_bytes` and `response_bytes` of the bodies,
+                   the number of `retries`, whether it was `cached` and the `error`
+                   raised, if any. Hooks are called from the requesting thread,
+                   and are not kept by pickled copies of this object.
+
+        Returns:
+
+            - None.
+
+        Raises:
+
+            - BdcApiException on unknown events.
+        """
+        if event not in self.hooks:
+            raise BdcApiException('Unknown hook event "{0}".'.format(event))
+        self.hooks[event].append(hook)
+
+    def deregister_hook(self, event, hook):
+        """Stop calling a hook added with `register_hook`. Returns whether it was found."""
+        try:
+            self.hooks[event].remove(hook)
+            return True
+        except (KeyError, ValueError):
+            return False
 
     def get_task_numbers(self):
         """Get the task numbers associated with the logged-in user's organizations.
@@ -82,8 +543,7 @@ class BdcApi(object):
             - BdcApiException on problematic requests (e.g. malformed inputs or 
                 issues reaching the API endpoint).
         """
-        response = self._send_get(self.URL_TASK_NUMBERS)
-        return json.loads(response.content)
+        return self._get_json(self.URL_TASK_NUMBERS, self.URL_TASK_NUMBERS)
 
     def get_domains(self, task_ID=''):
         """Get the domains associated with all tasks (associated with the user),
@@ -105,10 +565,10 @@ class BdcApi(object):
         """
         if not self._valid_id(task_ID):
             raise BdcApiException(f'{task_ID} is not a valid ObjectId!')
-        response = self._send_get('{0}/{1}'.format(self.URL_DOMAINS, task_ID))
-        return json.loads(response.content)
+        return self._get_json(self.URL_DOMAINS, '{0}/{1}'.format(self.URL_DOMAINS, task_ID))
 
-    def get_datacollections(self, task_numbers=[], domains=[], time_limits=[], limit=0):
+    def get_datacollections(self, task_numbers=[], domains=[], time_limits=[], limit=0,
+                            window=None, max_workers=8, on_window=None):
         """Get all available datacollections, optionally filtered.
 
         Parameters (all optional):
@@ -117,6 +577,13 @@ class BdcApi(object):
             :domains: A list of domain names.
             :time_limits: A list of 2 timestamps.
             :limit: Maximum number of datacollections to return.
+            :window: Length of the time windows, in the unit of `time_limits`, into
+                     which to split `time_limits`. The windows are requested
+                     concurrently and their datacollections merged in time order,
+                     without duplicates.
+            :max_workers: Maximum number of windows requested at once (default 8).
+            :on_window: Function called with the time limits and the datacollection
+                        names of each window as soon as it is received.
 
         Returns: 
             
@@ -127,33 +594,46 @@ class BdcApi(object):
             - BdcApiException on problematic requests (e.g. malformed inputs or 
                 issues reaching the API endpoint) or when no datacollections are found.
         """
-        if not isinstance(task_numbers, list):
-            task_numbers = [task_numbers]
-        if not isinstance(domains, list):
-            domains = [domains]
-
-        parameters = {}
-        if task_numbers:
-            parameters['tasks'] = ','.join(task_numbers)
-        if domains:
-            parameters['domains'] = ','.join(domains)
-        if time_limits: 
-            parameters['time_limits'] = ','.join([str(number) for number in time_limits])
-        if limit:
-            parameters['limit'] = limit
-
+        if window is not None:
+            return self._get_datacollections_sharded(task_numbers, domains, time_limits,
+                                                     limit, window, max_workers, on_window)
+        parameters = _datacollection_parameters(task_numbers, domains, time_limits, limit)
         if parameters != {}:
-            response = self._send_get('{0}'.format(self.URL_DATACOLLECTIONS), parameters=parameters)
+            url = '{0}'.format(self.URL_DATACOLLECTIONS)
         else:
-            response = self._send_get('{0}/'.format(self.URL_DATACOLLECTIONS))
-        try:
-            datacollection_names = [doc['name'] for doc in json.loads(response.content)]
-        except ValueError as e:
-            if len(response.content) == 0:
-                raise BdcApiException('No datacollections found.')
-            else:
-                raise e
-        return datacollection_names
+            url = '{0}/'.format(self.URL_DATACOLLECTIONS)
+        content, document = self._get_content(self.URL_DATACOLLECTIONS, url, parameters or None)
+        return _datacollection_names(content, document)
+
+    def _get_datacollections_sharded(self, task_numbers, domains, time_limits, limit, window,
+                                     max_workers, on_window):
+        """Helper function of `get_datacollections` requesting each time window in a
+        pool of `max_workers` threads.
+        """
+        windows = _time_windows(time_limits, window)
+
+        def fetch(time_window):
+            parameters = _datacollection_parameters(task_numbers, domains, time_window, limit)
+            content, document = self._get_content(self.URL_DATACOLLECTIONS,
+                                                  self.URL_DATACOLLECTIONS, parameters)
+            # An empty window is expected, unlike an empty catalog.
+            names = _datacollection_names(content, document) if content else []
+            if on_window is not None:
+                on_window(time_window, names)
+            return names
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(windows))) as executor:
+            futures = [executor.submit(fetch, time_window) for time_window in windows]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in futures:
+                future.cancel()
+            for future in done:
+                if future.exception() is not None:
+                    raise future.exception()
+            names = list(dict.fromkeys(name for future in futures for name in future.result()))
+        if not names:
+            raise BdcApiException('No datacollections found.')
+        return names[:limit] if limit else names
 
     def get_files(self, datacollections=[], extensions='', limit=0):
         """Get file names from all or selected datacollections.
@@ -180,26 +660,69 @@ class BdcApi(object):
             - BdcApiException on problematic requests (e.g. malformed inputs or 
                 issues reaching the API endpoint).
         """
-        if not isinstance(datacollections, list):
-            datacollections = [datacollections]
-        parameters = {'limit': limit}
-        if datacollections:
-            parameters['datacollections'] = ','.join(list(datacollections))
-        if extensions:
-            parameters['extensions'] = extensions
-        response = self._send_get(self.URL_FILELIST, parameters=parameters)
-        return json.loads(response.content)
-
-    def start_files_query(self, files):
+        parameters = _file_parameters(datacollections, extensions, limit)
+        return self._get_json(self.URL_FILELIST, self.URL_FILELIST, parameters)
+
+    def iter_files(self, datacollections=[], extensions='', limit=0):
+        """Iterate over the file names from all or selected datacollections while
+        the listing is still being received. Unlike `get_files`, memory use does
+        not grow with the size of the listing.
+
+        Parameters (optional):
+
+            :datacollections: list of datacollection names whose filenames are desired.
+            :limit: limit on data collections returned (defaults to 0, meaning no limit).
+            :extensions: comma-separated string of desired extensions (e.g: 'json,txt')
+
+        Returns:
+
+            - Generator of `(datacollection, filename)` tuples, in the order of the
+              listing. Listings already in `cache` are served from it, but
+              streamed listings are not added to it.
+
+        Raises:
+
+            - BdcApiException on problematic requests (e.g. malformed inputs or 
+                issues reaching the API endpoint).
+        """
+        import requests
+        parameters = _file_parameters(datacollections, extensions, limit)
+        if self.cache is not None:
+            content = self.cache.get(self.URL_FILELIST, self.cache.key(
+                self._host, self.username, self.URL_FILELIST, parameters))
+            if content is not None:
+                self._record_cache_hit(self.URL_FILELIST, parameters, content)
+                yield from _iter_file_listing([content])
+                return
+        response = self._send_get(self.URL_FILELIST, parameters=parameters, stream=True)
+        try:
+            if isinstance(self.session, requests.Session):
+                chunks = response.iter_content(chunk_size=self.LISTING_CHUNK_SIZE)
+            else:
+                # Test case: the Django test client does not stream.
+                chunks = [response.content]
+            yield from _iter_file_listing(chunks)
+        except requests.RequestException as e:
+            raise BdcApiException('Error occurred while receiving files listing: {0}'.format(e))
+        finally:
+            response.close()
+
+    def start_files_query(self, files, future=False, reuse=True):
         """Initiate a query to download specified files.
 
         Parameters:
             
             :files: List of desired file names as selected from `get_files`.
+            :future: Whether to return a `QueryFuture` tracking the query instead
+                     of its ID (default False), see `watch_query`.
+            :reuse: Whether to reuse an identical query found in `registry`, if
+                    any, which is still running or whose result can still be
+                    downloaded (default True).
 
         Returns:
 
-            - Query ID with which to check query progress or request the download.
+            - Query ID with which to check query progress or request the download,
+              or its `QueryFuture` if `future` is True.
 
         Raises:
 
@@ -208,27 +731,25 @@ class BdcApi(object):
         """
         if not isinstance(files, list):
             files = [files]
-        post_data = {'filepaths': ','.join(files)}
-        headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES)}
-        response = self._send_post(self.URL_QUERY, post_data, headers=headers)
-        response = json.loads(response.content)
-        if 'query_id' in response:
-            return response['query_id']
-        elif 'error_message' in response:
-            raise BdcApiException(response['error_message'])
-        else:
-            raise BdcApiException('Unknown response received when requesting files!')
+        query_id = self._start_query({'filepaths': ','.join(files)}, reuse, files=files)
+        return self.watch_query(query_id) if future else query_id
 
-    def start_datacollection_query(self, datacollection):
+    def start_datacollection_query(self, datacollection, future=False, reuse=True):
         """Initiate a query to download all files associated with a datacollection.
 
         Parameters:
 
             :datacollection: name of datacollection to get data for.
+            :future: Whether to return a `QueryFuture` tracking the query instead
+                     of its ID (default False), see `watch_query`.
+            :reuse: Whether to reuse an identical query found in `registry`, if
+                    any, which is still running or whose result can still be
+                    downloaded (default True).
 
         Returns:
 
-            - Query ID with which to check query progress or request the download.
+            - Query ID with which to check query progress or request the download,
+              or its `QueryFuture` if `future` is True.
 
         Raises:
 
@@ -237,16 +758,50 @@ class BdcApi(object):
         """
         if not isinstance(datacollection, str):
             raise BdcApiException('Please use a datacollection name in string form.')
-        post_data = {'datacollection': datacollection}
+        query_id = self._start_query({'datacollection': datacollection}, reuse,
+                                     datacollection=datacollection)
+        return self.watch_query(query_id) if future else query_id
+
+    def _start_query(self, post_data, reuse, **request):
+        """Helper function of `start_files_query` and `start_datacollection_query`
+        posting a query, unless `registry` holds a reusable one for the same
+        `files` or `datacollection` given in `request`.
+        """
+        key = None
+        if self.registry is not None:
+            key = self.registry.key(self._host, self.username, **request)
+            query_id = self.registry.get(key) if reuse else None
+            if query_id is not None:
+                if self._reusable_query(query_id):
+                    return query_id
+                self.registry.discard(query_id)
         headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES)}
         response = self._send_post(self.URL_QUERY, post_data, headers=headers)
-        response = json.loads(response.content)
-        if 'query_id' in response:
-            return response['query_id']
-        elif 'error_message' in response:
-            raise BdcApiException(response['error_message'])
-        else:
-            raise BdcApiException('Unknown response received when requesting files!')
+        query_id = _query_id(_response_json(response))
+        if key is not None:
+            self.registry.record(key, query_id)
+        return query_id
+
+    def _reusable_query(self, query_id):
+        """Helper function of `_start_query` checking whether a registered query is
+        still running, or completed with its result still available for download.
+        """
+        try:
+            info = self.check_query_progress(query_id)
+            if info.status in self.COMPLETE_QUERY_STATUS:
+                return False
+            if info.progress == self.COMPLETE_QUERY:
+                headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES), 'Range': 'bytes=0-0'}
+                response = self._send_get('{0}/{1}'.format(self.URL_DOWNLOAD, query_id),
+                                          headers=headers, stream=True)
+                try:
+                    self._check_streamed_response(response)
+                finally:
+                    response.close()
+        except BdcApiException:
+            return False
+        self.registry.update(query_id, info)
+        return True
 
     def check_query_progress(self, query_id):
         """Check the progress query.
@@ -270,14 +825,49 @@ class BdcApi(object):
         if not self._valid_id(query_id):
             raise BdcApiException(f'{query_id} is not a valid ObjectId!')        
         response = self._send_get('{0}/{1}'.format(self.URL_PROGRESS, query_id))
-        response = json.loads(response.content)
-        if 'errormessage' in response:
-            raise BdcApiException(response['errormessage'])
-        else:
-            return self.QueryInfo(progress=response['progress'], 
-                            status=response['job_status'])
+        info = _query_info(_response_json(response))
+        if self.registry is not None:
+            if info.status in self.COMPLETE_QUERY_STATUS:
+                self.registry.discard(query_id)
+            elif info.progress == self.COMPLETE_QUERY:
+                self.registry.update(query_id, info)
+        return info
+
+    def watch_query(self, query_id, poll_interval=None):
+        """Track a query in the background. All tracked queries of this object are
+        checked by one shared poller thread, which checks each query less often
+        while its progress does not change (see `POLL_MIN_INTERVAL`,
+        `POLL_MAX_INTERVAL` and `POLL_BACKOFF`).
+
+        Parameters:
 
-    def save_file(self, query_id, jupyterhub=False, local_path=""):
+            :query_id: Query ID from one of the `start_datacollection_query` 
+                       or `start_files_query` functions.
+            :poll_interval: Seconds before the first progress check (defaults to
+                            `POLL_MIN_INTERVAL`).
+
+        Returns:
+
+            - `QueryFuture`, a `concurrent.futures.Future` whose result is the final
+              QueryInfo once the progress reaches `COMPLETE_QUERY`. If the job ends
+              with one of the `COMPLETE_QUERY_STATUS` statuses, or checking its
+              progress fails, the future holds a `BdcApiException` instead.
+
+        Raises:
+
+            - BdcApiException on malformed query IDs.
+        """
+        if not query_id or not self._valid_id(query_id):
+            raise BdcApiException(f'{query_id} is not a valid ObjectId!')
+        self._check_fork()
+        with self._poller_lock:
+            if self._poller is None:
+                from .query import QueryPoller
+                self._poller = QueryPoller(self)
+        return self._poller.submit(query_id, poll_interval)
+
+    def save_file(self, query_id, jupyterhub=False, local_path="", resume=True, segments=1,
+                  extract_to=None, on_member=None, keep_archive=True):
         """This function will save the result of a query to the given directory
         on local disk, or, if the jupyterhub flag is set to True, to the user's
         JupyterHub home directory. The latter requires that the JupyterHub home
@@ -295,6 +885,29 @@ class BdcApi(object):
                          (default False).
             :local_path: A path to a directory on local disk, which will only be
                          considered if the API is not being run from JupyterHub.
+            :resume: Whether to continue an interrupted download of the same query
+                     into `local_path` from where it stopped (default True). Until
+                     complete, the download is kept as `{query_id}.partial` next to
+                     a `{query_id}.partial.json` file recording its expected size
+                     and ETag. If False, any such leftovers are discarded.
+            :segments: Number of byte ranges to fetch concurrently (default 1).
+                       With more than one segment the archive is preallocated and
+                       each range is written in place as it arrives, falling back
+                       to a single stream if the server does not support ranges.
+                       Segmented downloads are not resumable. Use a
+                       `pool_maxsize` of at least `segments` when creating the
+                       `BdcApi` to keep all connections open.
+            :extract_to: Optional directory to extract the members of a zip archive
+                         into while it is being downloaded, see `ZipStreamExtractor`.
+                         Segmented downloads are extracted once complete.
+            :on_member: Optional function called with the path of each extracted
+                        file as soon as it is complete, or a `queue.Queue` the paths
+                        are put into. Members are reported again if an interrupted
+                        download is resumed. Pass a `ConversionPipeline` to convert
+                        the members while the download goes on.
+            :keep_archive: Whether to keep the downloaded archive when extracting it
+                           (default True). Results which are not zip archives are
+                           always kept.
 
         Returns:
             
@@ -306,13 +919,23 @@ class BdcApi(object):
                     {"message": 
                         "Successfully moved query results to home directory. Filename is: download_5d9407266362395834cdbfbe.zip"}
 
-              Upon success if the jupyterhub flag is False, will return a dict
-              with the success message:
+              Upon success if the jupyterhub flag is False, the archive is streamed
+              to disk and a dict with the success message and transfer statistics
+              (bytes transferred, elapsed seconds, bytes per second, the offset
+              the transfer was resumed from and the number of segments used) is
+              returned. With `extract_to`, it also lists the extracted `members`,
+              and `path` is None for zip archives unless `keep_archive` is set:
 
               .. code-block:: json
 
                     {"message":
-                        "Successfully downloaded query results to /path/on/disk. Filename is: download_5d9407266362395834cdbfbe.zip"}
+                        "Successfully downloaded query results to /path/on/disk. Filename is: download_5d9407266362395834cdbfbe.zip",
+                     "path": "/path/on/disk/download_5d9407266362395834cdbfbe.zip",
+                     "bytes": 1048576,
+                     "seconds": 0.5,
+                     "throughput": 2097152.0,
+                     "resumed_from": 0,
+                     "segments": 1}
 
               Upon failure, will raise `BdcApiException`.
         
@@ -328,12 +951,328 @@ class BdcApi(object):
             parameters = {'jupyterhub': int(jupyterhub)}
             response = self._send_get(
                 '{0}/{1}'.format(self.URL_DOWNLOAD, str(query_id)), parameters=parameters)
-            response = json.loads(response.content)
+            response = _response_json(response)
         else:
-            response = self._save_file_local(str(query_id), local_path)
+            response = self._save_file_local(
+                str(query_id), local_path, resume=resume, segments=segments,
+                extract_to=extract_to, on_member=on_member, keep_archive=keep_archive)
         return response
 
-    def _save_file_local(self, query_id, path):
+    def download_datacollections(self, datacollections, local_path, max_workers=8,
+                                 poll_interval=3, segments=1):
+        """Download many datacollections at once. All queries are submitted up
+        front, their progress is checked concurrently, and each result is saved
+        to `local_path` as soon as its query completes, all from a bounded pool
+        of worker threads. Queries are tracked with `watch_query`. A failing
+        datacollection does not affect the others.
+
+        Parameters:
+
+            :datacollections: List of datacollection names.
+            :local_path: A directory on local disk to save the results to.
+            :max_workers: Maximum number of concurrent requests (default 8).
+            :poll_interval: Seconds before the first progress check of a query
+                            (default 3).
+            :segments: Number of byte ranges to fetch concurrently per download,
+                       see `save_file` (default 1).
+
+        Returns:
+
+            - Dictionary, in the order of `datacollections`, whose values are named
+              tuple objects DownloadResult where the `query_id` field contains the
+              query ID (or None if the query could not be started), the `result`
+              field the return value of `save_file` and the `error` field the
+              exception raised while processing the datacollection, if any.
+
+        Raises:
+
+            - BdcApiException if `local_path` is not a directory.
+        """
+        if not isinstance(datacollections, list):
+            datacollections = [datacollections]
+        if not os.path.exists(local_path) or not os.path.isdir(local_path):
+            raise BdcApiException('Invalid directory "{0}".'.format(local_path))
+        names = list(dict.fromkeys(datacollections))
+        results = {}
+        queries = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            starts = {executor.submit(self.start_datacollection_query, name): name
+                      for name in names}
+            for task in as_completed(starts):
+                try:
+                    queries[self.watch_query(task.result(), poll_interval)] = starts[task]
+                except Exception as e:
+                    results[starts[task]] = self.DownloadResult(None, None, e)
+        results.update(self._save_completed_queries(queries, local_path, max_workers, segments))
+        return {name: results[name] for name in names}
+
+    def start_files_query_group(self, files, max_bytes=None, max_workers=8):
+        """Initiate queries to download a large list of files. The list is split
+        into chunks whose `filepaths` field stays below `max_bytes`, and one
+        query per chunk is started concurrently, so that the server packages
+        the chunks in parallel.
+
+        Parameters:
+
+            :files: List of desired file names as selected from `get_files`.
+            :max_bytes: Maximum size of the comma-separated file names of one
+                        query (defaults to `FILES_QUERY_MAX_BYTES`).
+            :max_workers: Maximum number of queries started concurrently (default 8).
+
+        Returns:
+
+            - `QueryGroup` tracking the queries of all chunks.
+
+        Raises:
+
+            - BdcApiException on problematic requests (e.g. malformed inputs or 
+                issues reaching the API endpoint) while starting any of the queries.
+                The queries started nonetheless keep running on the server, and
+                are tracked by a `QueryGroup` in the `group` attribute of the
+                exception.
+        """
+        if not isinstance(files, list):
+            files = [files]
+        max_bytes = max_bytes or self.FILES_QUERY_MAX_BYTES
+        chunks, chunk, size = [], [], 0
+        for name in files:
+            length = len(name.encode('utf-8')) + 1
+            if chunk and size + length > max_bytes:
+                chunks.append(chunk)
+                chunk, size = [], 0
+            chunk.append(name)
+            size += length
+        if chunk:
+            chunks.append(chunk)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.start_files_query, chunk) for chunk in chunks]
+        started, error = [], None
+        for chunk, future in zip(chunks, futures):
+            try:
+                started.append((future.result(), chunk))
+            except Exception as e:
+                error = error or e
+        from .query import QueryGroup
+        group = QueryGroup(self, [query_id for query_id, _ in started],
+                           [chunk for _, chunk in started])
+        if error is not None:
+            exception = BdcApiException(
+                'Error occurred while starting {0} of {1} queries, the started queries are '
+                'kept in the group attribute of this exception. Details: {2}'.format(
+                    len(chunks) - len(started), len(chunks), error))
+            exception.group = group
+            raise exception from error
+        return group
+
+    def fetch_files(self, files, local_path, max_workers=4, segments=1, poll_interval=None,
+                    verify=False):
+        """Make files available in `local_path`, downloading only those which are
+        not in `store` yet. The missing files are queried with
+        `start_files_query_group`, each archive is extracted while it downloads
+        and its members are added to `store`, then all requested files are
+        linked from `store` into `local_path`.
+
+        Parameters:
+
+            :files: Dictionary of datacollection names, whose values are lists of
+                    file paths, as returned by `get_files`.
+            :local_path: A directory on local disk to make the files available in,
+                         as `local_path/<datacollection>/<path>`.
+            :max_workers: Maximum number of concurrent downloads (default 4).
+            :segments: Number of byte ranges to fetch concurrently per download,
+                       see `save_file` (default 1).
+            :poll_interval: Seconds before the first progress check of each query.
+            :verify: Whether to verify the checksum of stored files rather than
+                     only their size (default False).
+
+        Returns:
+
+            - Dictionary of datacollection names, whose values are dictionaries of
+              the file paths to their local paths.
+
+        Raises:
+
+            - BdcApiException without `store`, on problematic requests, or if
+              some files were not part of the query results. Files received
+              before the error are kept in `store`.
+        """
+        if self.store is None:
+            raise BdcApiException('fetch_files requires a store, see FileStore.')
+        if not os.path.exists(local_path) or not os.path.isdir(local_path):
+            raise BdcApiException('Invalid directory "{0}".'.format(local_path))
+        missing = self.store.missing(files, verify=verify)
+        if missing:
+            incoming = os.path.join(self.store.root, 'incoming', '{0}-{1}'.format(
+                os.getpid(), threading.get_ident()))
+            os.makedirs(incoming, exist_ok=True)
+            try:
+                self._fetch_into_store(missing, incoming, max_workers, segments, poll_interval)
+            finally:
+                shutil.rmtree(incoming, ignore_errors=True)
+        return self.store.materialize(files, local_path)
+
+    def _fetch_into_store(self, files, incoming, max_workers, segments, poll_interval):
+        """Helper function of `fetch_files` downloading `files` into `incoming`
+        and adding them to `store`."""
+        wanted, paths = _wanted_files(files)
+        group = self.start_files_query_group(paths, max_workers=max_workers)
+        extracted = os.path.join(incoming, 'extracted')
+        queries = dict(zip(group.futures(poll_interval), group.query_ids))
+        results = self._save_completed_queries(queries, incoming, max_workers, segments,
+                                               extract_to=extracted, keep_archive=False)
+        members = {}
+        for result in results.values():
+            for member in (result.result or {}).get('members', []):
+                members[os.path.relpath(member, extracted).replace(os.sep, '/')] = member
+        received = set()
+        for datacollection, path in wanted:
+            member = _find_member(members, path, datacollection)
+            if member is not None:
+                self.store.add(datacollection, path, member)
+                received.add((datacollection, path))
+        errors = [result.error for result in results.values() if result.error is not None]
+        if errors:
+            raise BdcApiException('Error occurred while fetching files, {0} of {1} received. '
+                                  'Details: {2}'.format(len(received), len(wanted), errors[0]))
+        if len(received) < len(wanted):
+            datacollection, path = sorted(set(wanted) - received)[0]
+            raise BdcApiException('{0} of {1} files were not part of the query results, e.g. '
+                                  '"{2}" of {3}.'.format(len(wanted) - len(received),
+                                                         len(wanted), path, datacollection))
+
+    def load_catalogs(self, datacollections=[], output='arrow', fields=None, local_path=None,
+                      max_workers=None, segments=1, poll_interval=None):
+        """Load the JSON catalogs of datacollections into a single columnar table.
+        The catalogs listed by `get_files` are queried with
+        `start_files_query_group`, and the members of each downloaded archive are
+        parsed by a pool of processes straight from the archive, without
+        extracting it, in chunks of `CATALOGS_PER_TASK` catalogs.
+
+        Parameters (all optional):
+
+            :datacollections: List of datacollection names (defaults to all).
+            :output: 'arrow' for a `pyarrow.Table` (default) or 'pandas' for a
+                     `pandas.DataFrame`. Both require the optional `pyarrow`
+                     dependency (`pip install bdc_api[arrow]`).
+            :fields: List of the catalog fields to load, as flattened column names
+                     (e.g. 'detector.id'), fixing the schema. Defaults to all
+                     fields found, in sorted order.
+            :local_path: Directory to download the archives to, which are deleted
+                         once parsed (defaults to a temporary directory).
+            :max_workers: Maximum number of parsing processes (defaults to the
+                          number of CPUs).
+            :segments: Number of byte ranges to fetch concurrently per download,
+                       see `save_file` (default 1).
+            :poll_interval: Seconds before the first progress check of each query.
+
+        Returns:
+
+            - `pyarrow.Table` or `pandas.DataFrame` with one row per catalog
+              record (the catalog itself, or each item of a catalog which is a
+              list), in the order of `get_files`. Its `datacollection` and
+              `catalog` columns tell where each row came from, nested objects
+              are flattened into dotted column names, and lists are kept as
+              JSON strings.
+
+        Raises:
+
+            - BdcApiException on problematic requests, if no catalogs are found
+              or received, or if a catalog is not valid JSON.
+        """
+        from .archive import open_query_result
+        from .tables import catalog_table, check_output, parse_catalogs
+        check_output(output)
+        files = self.get_files(datacollections, extensions='json')
+        wanted, paths = _wanted_files(files)
+        if not wanted:
+            raise BdcApiException('No catalogs found.')
+        with tempfile.TemporaryDirectory(dir=local_path) as directory:
+            group = self.start_files_query_group(paths)
+            queries = dict(zip(group.futures(poll_interval), group.query_ids))
+            results = self._save_completed_queries(queries, directory, segments=segments)
+            errors = [result.error for result in results.values() if result.error is not None]
+            if errors:
+                raise BdcApiException('Error occurred while loading catalogs. Details: '
+                                      '{0}'.format(errors[0]))
+            found = {}
+            for result in results.values():
+                archive = result.result['path']
+                with open_query_result(archive) as saved:
+                    members = {name: name for name in saved.names()}
+                for datacollection, path in wanted:
+                    member = None if (datacollection, path) in found else _find_member(
+                        members, path, datacollection)
+                    if member is not None:
+                        found[datacollection, path] = (archive, member)
+            if len(found) < len(wanted):
+                datacollection, path = sorted(set(wanted) - set(found))[0]
+                raise BdcApiException('{0} of {1} catalogs were not part of the query '
+                                      'results, e.g. "{2}" of {3}.'.format(
+                                          len(wanted) - len(found), len(wanted), path,
+                                          datacollection))
+            tasks = []
+            for datacollection, path in wanted:
+                archive, member = found[datacollection, path]
+                if not tasks or tasks[-1][0] != archive or \
+                        len(tasks[-1][1]) == self.CATALOGS_PER_TASK:
+                    tasks.append((archive, []))
+                tasks[-1][1].append((member, datacollection, path))
+            if len(tasks) == 1 or max_workers == 1:
+                parts = [parse_catalogs(archive, members, fields) for archive, members in tasks]
+            else:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=max_workers,
+                                         mp_context=multiprocessing.get_context('spawn')) \
+                        as executor:
+                    parts = list(executor.map(parse_catalogs, *zip(*[
+                        (archive, members, fields) for archive, members in tasks])))
+        return catalog_table(parts, fields, output)
+
+    def _save_completed_queries(self, queries, local_path, max_workers=8, segments=1,
+                                **options):
+        """Helper function that saves the result of each query to `local_path` as
+        soon as the query completes, with at most `max_workers` concurrent downloads.
+
+        Parameters:
+
+            :queries: Dictionary whose keys are `QueryFuture` objects.
+            :local_path: A directory on local disk to save the results to.
+            :max_workers: Maximum number of concurrent downloads.
+            :segments: Number of byte ranges to fetch concurrently per download.
+            :options: Further keyword arguments of `save_file`.
+
+        Returns:
+
+            - Dictionary keyed by the values of `queries`, whose values are named
+              tuple objects DownloadResult (see `download_datacollections`).
+
+        Raises:
+
+            - None.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            downloads = {}
+            for query in as_completed(queries):
+                try:
+                    query.result()
+                except Exception as e:
+                    results[queries[query]] = self.DownloadResult(query.query_id, None, e)
+                    continue
+                downloads[executor.submit(self.save_file, query.query_id, local_path=local_path,
+                                          segments=segments, **options)] = query
+            for task in as_completed(downloads):
+                query = downloads[task]
+                try:
+                    result, error = task.result(), None
+                except Exception as e:
+                    result, error = None, e
+                results[queries[query]] = self.DownloadResult(query.query_id, result, error)
+        return results
+
+    def _save_file_local(self, query_id, path, resume=True, segments=1, extract_to=None,
+                         on_member=None, keep_archive=True):
         """Helper function that attempts to save the results of the given query
         to the given directory on local disk.
 
@@ -342,15 +1281,16 @@ class BdcApi(object):
             :query_id: Query ID from one of the `start_datacollection_query` or
                        `start_files_query` functions.
             :path: A directory on local disk to save the results to.
+            :resume: Whether to continue a previously interrupted download.
+            :segments: Number of byte ranges to fetch concurrently.
+            :extract_to: Directory to extract the archive into while downloading.
+            :on_member: Function or queue receiving the paths of extracted files.
+            :keep_archive: Whether to keep the archive once extracted. Results
+                           which are not zip archives are always kept.
 
         Returns:
 
-            - A dict with the success message:
-
-              .. code-block:: json
-
-                    {"message":
-                        "Successfully downloaded query results to /path/on/disk. Filename is: download_5d9407266362395834cdbfbe.zip"}
+            - A dict with the success message and transfer statistics, see `save_file`.
 
         Raises:
 
@@ -359,43 +1299,571 @@ class BdcApi(object):
         """
         if not self._valid_id(query_id):
             raise BdcApiException(f'{query_id} is not a valid ObjectId!')
-        def get_file_name_from_http_response(http_response):
-            """Retrieve the file name from the given HTTP response, or the empty string. If the
-            parent method is run from tests, return a default name."""
-            if isinstance(self.session, requests.Session):
-                return http_response.headers['content-disposition'].split("=")[1]
-            return "test.zip"
         if not os.path.exists(path) or not os.path.isdir(path):
             raise BdcApiException('Invalid directory "{0}".'.format(path))
-        headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES)}
-        response = self._send_get(
-            '{0}/{1}'.format(self.URL_DOWNLOAD, str(query_id)), headers=headers)
+        if extract_to is None:
+            return self._download_archive(query_id, path, resume, segments)
+        from .archive import ZipStreamExtractor
+        try:
+            extractor = ZipStreamExtractor(extract_to, on_member)
+        except OSError as e:
+            raise BdcApiException('Invalid directory "{0}". Details: {1}'.format(extract_to, e))
+        try:
+            result = self._download_archive(query_id, path, resume, segments, extractor)
+        except BaseException:
+            extractor.abort()
+            raise
+        if result['segments'] > 1:
+            extractor.feed_file(result['path'])
+        members = extractor.close()
+        if extractor.fallback:
+            members = extractor.extract_remaining(result['path'])
+        if not keep_archive and extractor.is_zip:
+            os.remove(result['path'])
+            result['path'] = None
+        result['members'] = members
+        return result
+
+    def _download_archive(self, query_id, path, resume=True, segments=1, extractor=None):
+        """Helper function of `_save_file_local` downloading the archive, while
+        passing it to `extractor` if given.
+        """
+        import requests
+        if segments > 1 and isinstance(self.session, requests.Session):
+            result = self._save_file_segmented(query_id, path, segments)
+            if result is not None:
+                return result
+        partial_path = os.path.join(path, '{0}.partial'.format(query_id))
+        state_path = '{0}.json'.format(partial_path)
+        state = self._load_partial_state(query_id, partial_path, state_path) if resume else None
+        if state is None:
+            for leftover in (partial_path, state_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        offset = os.path.getsize(partial_path) if state else 0
+        started = time.time()
+        if state and state['size'] is not None and offset >= state['size']:
+            # Only the final rename is missing.
+            file_name, size = state['file_name'], 0
+            if extractor is not None:
+                extractor.feed_file(partial_path)
+        else:
+            headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES)}
+            if offset:
+                headers['Range'] = 'bytes={0}-'.format(offset)
+                if state['etag']:
+                    headers['If-Range'] = state['etag']
+            response = self._send_get(
+                '{0}/{1}'.format(self.URL_DOWNLOAD, str(query_id)), headers=headers, stream=True)
+            try:
+                self._check_streamed_response(response)
+                if offset and response.status_code == 206:
+                    content_range = response.headers.get('content-range', '')
+                    if not content_range.startswith('bytes {0}-'.format(offset)):
+                        os.remove(state_path)
+                        raise BdcApiException(
+                            'Unexpected range "{0}" received while resuming download of query '
+                            '{1}, please retry.'.format(content_range, query_id))
+                    mode = 'ab'
+                else:
+                    # Fresh download, or the server ignored the range request.
+                    offset, mode = 0, 'wb'
+                    file_name = self._file_name_from_response(response)
+                    headers = getattr(response, 'headers', {})
+                    content_length = None
+                    if not headers.get('content-encoding'):
+                        content_length = headers.get('content-length')
+                    state = {'query_id': query_id,
+                             'file_name': file_name,
+                             'size': int(content_length) if content_length else None,
+                             'etag': headers.get('etag')}
+                    self._save_partial_state(state, state_path)
+                file_name = state['file_name']
+                if extractor is not None and mode == 'ab':
+                    extractor.feed_file(partial_path, offset)
+                size = self._stream_to_file(response, partial_path, mode, extractor)
+            finally:
+                response.close()
+            if state['size'] is not None and offset + size != state['size']:
+                raise BdcApiException(
+                    'Download of query {0} ended after {1} of {2} bytes. Partial download kept '
+                    'at "{3}", call save_file again to resume.'.format(
+                        query_id, offset + size, state['size'], partial_path))
+        full_path = os.path.join(path, file_name)
         try:
-            file_name = get_file_name_from_http_response(response).strip()
+            os.replace(partial_path, full_path)
+            os.remove(state_path)
+        except OSError as e:
+            raise BdcApiException(
+                'Error occurred while saving file to {0}. Details: {1}'.format(full_path, e))
+        elapsed = time.time() - started
+        return {'message': ('Successfully downloaded query results to "{0}". Filename is: '
+                            '{1}.').format(path, file_name),
+                'path': full_path,
+                'bytes': size,
+                'seconds': elapsed,
+                'throughput': size / elapsed if elapsed > 0 else float(size),
+                'resumed_from': offset,
+                'segments': 1}
+
+    def _save_file_segmented(self, query_id, path, segments):
+        """Helper function that saves the results of the given query by fetching
+        several byte ranges of the archive concurrently. Each range is written at
+        its final position in a preallocated `{query_id}.partial` file, which is
+        renamed into place once all ranges have arrived.
+
+        Parameters:
+
+            :query_id: Query ID from one of the `start_datacollection_query` or
+                       `start_files_query` functions.
+            :path: A directory on local disk to save the results to.
+            :segments: Maximum number of byte ranges to fetch concurrently.
+
+        Returns:
+
+            - A dict with the success message and transfer statistics, see `save_file`,
+              or None if the server does not support range requests.
+
+        Raises:
+
+            - BdcApiException on problematic requests (e.g. malformed inputs or
+              issues reaching the API endpoint) or OS errors during the save
+        """
+        url = '{0}/{1}'.format(self.URL_DOWNLOAD, query_id)
+        started = time.time()
+        probe = self._send_get(url, headers={'Accept': ', '.join(self.QUERY_ACCEPT_TYPES),
+                                             'Range': 'bytes=0-0'}, stream=True)
+        try:
+            match = re.match(r'^bytes 0-0/(\d+)$', probe.headers.get('content-range', ''))
+            if probe.status_code != 206 or not match:
+                return None
+            file_name = self._file_name_from_response(probe)
+            etag = probe.headers.get('etag')
+            total = int(match.group(1))
+        finally:
+            probe.close()
+        count = max(1, min(segments, -(-total // self.DOWNLOAD_CHUNK_SIZE)))
+        bounds = [total * i // count for i in range(count + 1)]
+        partial_path = os.path.join(path, '{0}.partial'.format(query_id))
+        full_path = os.path.join(path, file_name)
+        abort = threading.Event()
+        try:
+            fd = os.open(partial_path,
+                         os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0))
+            try:
+                os.ftruncate(fd, total)
+                with ThreadPoolExecutor(max_workers=count) as executor:
+                    futures = [executor.submit(self._download_segment, url, fd, bounds[i],
+                                               bounds[i + 1] - 1, etag, abort)
+                               for i in range(count)]
+                    wait(futures, return_when=FIRST_EXCEPTION)
+                    abort.set()
+                    size = sum(future.result() for future in futures)
+            finally:
+                os.close(fd)
+            os.replace(partial_path, full_path)
+            if os.path.exists('{0}.json'.format(partial_path)):
+                os.remove('{0}.json'.format(partial_path))
+        except BaseException as e:
+            abort.set()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            if isinstance(e, OSError):
+                raise BdcApiException(
+                    'Error occurred while saving file to {0}. Details: {1}'.format(full_path, e))
+            raise
+        elapsed = time.time() - started
+        return {'message': ('Successfully downloaded query results to "{0}". Filename is: '
+                            '{1}.').format(path, file_name),
+                'path': full_path,
+                'bytes': size,
+                'seconds': elapsed,
+                'throughput': size / elapsed if elapsed > 0 else float(size),
+                'resumed_from': 0,
+                'segments': count}
+
+    def _download_segment(self, url, fd, start, end, etag, abort):
+        """Helper function that downloads bytes `start` to `end` (inclusive) of an
+        archive and writes them at the same offsets of the file descriptor `fd`.
+
+        Parameters:
+
+            :url: URL of the download endpoint suffix as a string.
+            :fd: File descriptor of the preallocated archive.
+            :start: First byte of the segment.
+            :end: Last byte of the segment.
+            :etag: ETag of the archive, to make sure all segments belong to the same file.
+            :abort: `threading.Event` set when another segment has failed.
+
+        Returns:
+
+            - Number of bytes written.
+
+        Raises:
+
+            - BdcApiException on problematic requests or OS errors during the save.
+        """
+        import requests
+        headers = {'Accept': ', '.join(self.QUERY_ACCEPT_TYPES),
+                   'Range': 'bytes={0}-{1}'.format(start, end)}
+        if etag:
+            headers['If-Range'] = etag
+        response = self._send_get(url, headers=headers, stream=True)
+        position = start
+        try:
+            if response.status_code != 206 or not response.headers.get(
+                    'content-range', '').startswith('bytes {0}-{1}/'.format(start, end)):
+                raise BdcApiException(
+                    'Server did not honour the range request for bytes {0}-{1}.'.format(start, end))
+            for chunk in response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE):
+                if abort.is_set():
+                    break
+                pwrite(fd, chunk, position)
+                position += len(chunk)
+                if self.scheduler is not None:
+                    self.scheduler.throttle(len(chunk))
+        except requests.RequestException as e:
+            raise BdcApiException('Error occurred while downloading bytes {0}-{1}. '
+                                  'Details: {2}'.format(start, end, e))
+        finally:
+            response.close()
+        if position != end + 1 and not abort.is_set():
+            raise BdcApiException('Download of bytes {0}-{1} ended after {2} bytes.'.format(
+                start, end, position - start))
+        return position - start
+
+    def _file_name_from_response(self, response):
+        """Helper function that retrieves the archive file name from a download
+        response. If run from tests, returns a default name.
+
+        Parameters:
+
+            :response: Response of the download endpoint.
+
+        Returns:
+
+            - The file name.
+
+        Raises:
+
+            - BdcApiException if the response does not include a file name.
+        """
+        import requests
+        try:
+            if isinstance(self.session, requests.Session):
+                file_name = response.headers['content-disposition'].split("=")[1].strip()
+            else:
+                file_name = "test.zip"
             if not file_name:
                 raise ValueError('Empty file name {0}.'.format(file_name))
         except Exception as e:
             raise BdcApiException(
                 'Error occurred while retrieving file name from response. Details: {0}'.format(e))
+        return file_name
+
+    def _check_streamed_response(self, response):
+        """Helper function that checks a streamed download response for error
+        messages. Only JSON bodies are read for this, any other body is left to
+        be streamed.
+
+        Parameters:
+
+            :response: Response returned by `_send_get` with `stream=True`.
+
+        Returns:
+
+            - None.
+
+        Raises:
+
+            - BdcApiException if the response holds an error message.
+        """
+        headers = getattr(response, 'headers', None) or {}
+        if headers.get('content-type', '').split(';')[0].strip().endswith('json'):
+            self._decode_response(response)
+
+    def _load_partial_state(self, query_id, partial_path, state_path):
+        """Helper function that reads the sidecar file of an interrupted download.
+
+        Parameters:
+
+            :query_id: Query ID the download belongs to.
+            :partial_path: Path of the partially downloaded archive.
+            :state_path: Path of the sidecar file describing it.
+
+        Returns:
+
+            - Dict with the `query_id`, `file_name`, expected `size` and `etag` of
+              the download, or None if there is nothing usable to resume from.
+
+        Raises:
+
+            - None.
+        """
+        if not os.path.exists(partial_path) or not os.path.exists(state_path):
+            return None
         try:
-            full_path = os.path.join(path, file_name)
-            open(full_path, 'wb').write(response.content)
+            with open(state_path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or state.get('query_id') != query_id \
+                or not state.get('file_name'):
+            return None
+        state.setdefault('size', None)
+        state.setdefault('etag', None)
+        return state
+
+    def _save_partial_state(self, state, state_path):
+        """Helper function that writes the sidecar file of a download in progress.
+
+        Parameters:
+
+            :state: Dict as returned by `_load_partial_state`.
+            :state_path: Path of the sidecar file.
+
+        Returns:
+
+            - None.
+
+        Raises:
+
+            - BdcApiException on OS errors during the save.
+        """
+        try:
+            with open(state_path, 'w') as f:
+                json.dump(state, f)
         except OSError as e:
             raise BdcApiException(
-                'Error occurred while saving file to {0}. Details: {1}'.format(full_path, e))
-        return {'message': ('Successfully downloaded query results to "{0}". Filename is: '
-                            '{1}.').format(path, file_name)}
-    
-    def _valid_id(self, to_validate):
-        if not to_validate:
-            return True
+                'Error occurred while saving file to {0}. Details: {1}'.format(state_path, e))
+
+    def _stream_to_file(self, response, partial_path, mode='wb', extractor=None):
+        """Helper function that writes the body of a download response to disk in
+        chunks of `DOWNLOAD_CHUNK_SIZE` bytes, so that memory use does not depend on
+        the size of the archive. Whatever was received is kept in `partial_path`
+        when the transfer fails so that it can be resumed later.
+
+        Parameters:
+
+            :response: Response returned by `_send_get` with `stream=True`.
+            :partial_path: File to write the body to.
+            :mode: `wb` to start the file over, or `ab` to append to it.
+            :extractor: Optional `ZipStreamExtractor` fed with each chunk once written.
+
+        Returns:
+
+            - Number of bytes written.
+
+        Raises:
+
+            - BdcApiException on network errors during the transfer or OS errors
+              during the save.
+        """
+        import requests
+        if isinstance(self.session, requests.Session):
+            chunks = response.iter_content(chunk_size=self.DOWNLOAD_CHUNK_SIZE)
+        else:
+            # Test case: the Django test client does not stream.
+            chunks = [response.content]
+        size = 0
         try:
-            validated = ObjectId(to_validate)
-            return True
-        except InvalidId:
-            return False
+            with open(partial_path, mode) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    if extractor is not None:
+                        extractor.feed(chunk)
+                    if self.scheduler is not None:
+                        self.scheduler.throttle(len(chunk))
+        except (OSError, requests.RequestException) as e:
+            raise BdcApiException(
+                'Error occurred while saving file to {0} after {1} bytes, call save_file again '
+                'to resume. Details: {2}'.format(partial_path, size, e))
+        return size
+
+    def invalidate_cache(self, endpoint=None):
+        """Drop cached metadata responses, see `MetadataCache`.
+
+        Parameters:
+
+            :endpoint: Endpoint whose responses to drop (e.g. `BdcApi.URL_FILELIST`),
+                       or None for all of them.
+
+        Returns:
+
+            - None.
+
+        Raises:
+
+            - None.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(endpoint)
+
+    def _get_content(self, endpoint, url, parameters=None):
+        """Helper function returning the body of a metadata GET request, served
+        from `cache` when possible.
+
+        Parameters:
+
+            :endpoint: Endpoint the request belongs to, which selects the cache TTL.
+            :url: URL of API endpoint suffix as a string.
+            :parameters: GET parameters to include.
 
-    def _send_get(self, url, parameters=None, headers={}):
+        Returns:
+
+            - Tuple of the body of the response and its decoded JSON document, or
+              None if it was served from `cache` or could not be decoded.
+
+        Raises:
+
+            - BdcApiException on problematic requests (e.g. malformed inputs or 
+                issues reaching the API endpoint).
+        """
+        if self.cache is not None:
+            key = self.cache.key(self._host, self.username, url, parameters)
+            content = self.cache.get(endpoint, key)
+            if content is not None:
+                self._record_cache_hit(url, parameters, content)
+                return content, None
+        response = self._send_get(url, parameters=parameters)
+        if self.cache is not None:
+            self.cache.set(endpoint, key, response.content)
+        try:
+            return response.content, vars(response).get('_decoded')
+        except TypeError:
+            return response.content, None
+
+    def _get_json(self, endpoint, url, parameters=None):
+        """Helper function returning the decoded body of a metadata GET request,
+        see `_get_content`.
+        """
+        content, document = self._get_content(endpoint, url, parameters)
+        return _decode_json(content) if document is None else document
+
+    def _decode_response(self, response):
+        """Helper function that decodes the JSON body of a response, once, and raises
+        BdcApiException if it holds an error message. The decoded body is kept on
+        the response for `_response_json`. Bodies of one of the `QUERY_ACCEPT_TYPES`
+        are not inspected.
+
+        Parameters:
+
+            :response: Response from server, with its body read.
+
+        Returns:
+
+            - None.
+
+        Raises:
+
+            - BdcApiException if the response holds an error message.
+        """
+        headers = getattr(response, 'headers', None) or {}
+        if headers.get('content-type', '').split(';')[0].strip() in self.QUERY_ACCEPT_TYPES:
+            return
+        try:
+            document = json_loads(response.content)
+        except ValueError:
+            return
+        message = _error_message(document)
+        if message is not None:
+            raise BdcApiException('Error occurred while making request: {0}'.format(message))
+        response._decoded = document
+
+    def _valid_id(self, to_validate):
+        return _valid_id(to_validate)
+
+    def _instrumented(self):
+        return self.metrics is not None or bool(self.hooks['pre_request']
+                                                or self.hooks['post_request'])
+
+    def _endpoint(self, url):
+        """Helper function returning the `URL_*` constant `url` belongs to."""
+        for endpoint in (self.URL_TASK_NUMBERS, self.URL_DOMAINS, self.URL_DATACOLLECTIONS,
+                         self.URL_FILELIST, self.URL_QUERY, self.URL_PROGRESS,
+                         self.URL_DOWNLOAD):
+            if url.startswith(endpoint):
+                return endpoint
+        return url
+
+    def _request_class(self, url):
+        """Helper function returning the `RequestScheduler` class of a request to `url`."""
+        if url.startswith(self.URL_DOWNLOAD):
+            return 'download'
+        if url.startswith(self.URL_PROGRESS):
+            return 'progress'
+        if url.startswith(self.URL_QUERY):
+            return 'query'
+        return 'metadata'
+
+    def _instrument(self, method, url, parameters, request_bytes, stream, send, *args):
+        """Helper function that calls `send(*args)` to send a request, running the
+        hooks and recording `metrics` around it.
+
+        Parameters:
+
+            :method: HTTP method of the request.
+            :url: URL of API endpoint suffix as a string.
+            :parameters: GET parameters of the request.
+            :request_bytes: Size of the encoded parameters or POST data.
+            :stream: Whether the response body is read by the caller, in which case
+                     its size is taken from the `Content-Length` header.
+            :send: Function sending the request and returning the response.
+
+        Returns:
+
+            - Return value of `send`.
+
+        Raises:
+
+            - Any exception raised by `send`. The status of a failed response is
+              taken from the `response` attribute of the exception.
+        """
+        info = self.RequestInfo(method=method, endpoint=self._endpoint(url),
+                                parameters=parameters, status=None, seconds=None,
+                                request_bytes=request_bytes, response_bytes=None, retries=0,
+                                cached=False, error=None)
+        for hook in self.hooks['pre_request']:
+            hook(info)
+        started = time.perf_counter()
+        response = error = None
+        try:
+            response = send(*args)
+            return response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            info = info._replace(seconds=time.perf_counter() - started, error=error)
+            if response is None:
+                response = getattr(error, 'response', None)
+            if response is not None:
+                if stream:
+                    response_bytes = int(response.headers.get('content-length') or 0)
+                else:
+                    response_bytes = len(response.content)
+                retries = getattr(getattr(response, 'raw', None), 'retries', None)
+                info = info._replace(status=response.status_code, response_bytes=response_bytes,
+                                     retries=len(retries.history) if retries else 0)
+            self._post_request(info)
+
+    def _record_cache_hit(self, url, parameters, content):
+        """Helper function running the `post_request` hooks for a response served
+        from `cache`."""
+        if self._instrumented():
+            self._post_request(self.RequestInfo(
+                method='GET', endpoint=self._endpoint(url), parameters=parameters, status=None,
+                seconds=0.0, request_bytes=0, response_bytes=len(content), retries=0,
+                cached=True, error=None))
+
+    def _post_request(self, info):
+        if self.metrics is not None:
+            self.metrics.record(info)
+        for hook in self.hooks['post_request']:
+            hook(info)
+
+    def _send_get(self, url, parameters=None, headers=None, stream=False):
         """Helper function to send GET requests.
 
         Parameters:
@@ -403,6 +1871,9 @@ class BdcApi(object):
             :url: URL of API endpoint suffix as a string.
             :parameters: GET parameters to include.
             :headers: Request headers to include.
+            :stream: Whether to defer reading the response body (default False).
+                     Streamed responses are not checked for error messages and
+                     must be closed by the caller.
 
         Returns:
 
@@ -413,40 +1884,52 @@ class BdcApi(object):
             - BdcApiException on problematic requests (e.g. malformed inputs or 
                 issues reaching the API endpoint).
         """
-        headers.update({'Authorization': self.auth_header})
+        if self.scheduler is not None:
+            self.scheduler.acquire(self._request_class(url))
+        if self._instrumented():
+            request_bytes = len(urllib.parse.urlencode(parameters)) if parameters else 0
+            return self._instrument('GET', url, parameters, request_bytes, stream,
+                                    self._get, url, parameters, headers, stream)
+        return self._get(url, parameters, headers, stream)
+
+    def _get(self, url, parameters, headers, stream):
+        import requests
+        headers = dict(headers or {}, Authorization=self.auth_header)
+        session = self.session
         response = None
         try:
             # Production case: session.get has a particular signature which we use:
-            if isinstance(self.session, requests.Session):
+            if isinstance(session, requests.Session):
                 if parameters:
-                    response = self.session.get(
-                        '{0}/{1}'.format(self._host, url), params=parameters, headers=headers)
+                    response = session.get('{0}/{1}'.format(self._host, url),
+                                           params=parameters, headers=headers, stream=stream)
                 else:
-                    response = self.session.get(
-                        '{0}/{1}'.format(self._host, url), headers=headers)
+                    response = session.get(
+                        '{0}/{1}'.format(self._host, url), headers=headers, stream=stream)
             # Test case: session is really a Django Client object, different signature:
             else:
                 if parameters:
                     params = urllib.parse.urlencode(parameters)
-                    response = self.session.get(
+                    response = session.get(
                         '{0}/{1}/?{2}'.format(self._host, url, params), headers=headers)
                 else:
-                    response = self.session.get(
+                    response = session.get(
                         '{0}/{1}'.format(self._host, url), headers=headers)
             response.raise_for_status()
         except Exception as e:
             if not response:
-                raise BdcApiException('Error sending request to host server: {0}', e)
-
-        if b'error_message' in response.content: 
-            raise BdcApiException('Error occurred while making request: {0}',
-                    json.loads(response.content)['error_message'])
-        elif b'errormessage' in response.content:
-            raise BdcApiException('Error occurred while making request: {0}',
-                    json.loads(response.content)['errormessage'])
+                exception = BdcApiException(
+                    'Error sending request to host server: {0}'.format(e))
+                # Lets `_instrument` report the status of failed responses.
+                exception.response = response
+                raise exception from e
+
+        if stream and isinstance(session, requests.Session):
+            return response
+        self._decode_response(response)
         return response
     
-    def _send_post(self, url, post_data, headers={}):
+    def _send_post(self, url, post_data, headers=None):
         """Helper function to send POST requests.
 
         Parameters:
@@ -464,19 +1947,23 @@ class BdcApi(object):
             - BdcApiException on problematic requests (e.g. malformed inputs or 
                 issues reaching the API endpoint).
         """
-        headers.update({'Authorization': self.auth_header})
+        if self.scheduler is not None:
+            self.scheduler.acquire(self._request_class(url))
+        if self._instrumented():
+            request_bytes = len(urllib.parse.urlencode(post_data))
+            return self._instrument('POST', url, None, request_bytes, False,
+                                    self._post, url, post_data, headers)
+        return self._post(url, post_data, headers)
+
+    def _post(self, url, post_data, headers):
+        headers = dict(headers or {}, Authorization=self.auth_header)
         response = None
         try:
             response = self.session.post(
                 '{0}/{1}/'.format(self._host, url), data=post_data, headers=headers)
         except Exception as e:
             if not response:
-                raise BdcApiException('Error sending request to host server: {0}', e)
-
-        if b'error_message' in response.content: 
-            raise BdcApiException('Error occurred while making request: {0}',
-                    json.loads(response.content)['error_message'])
-        elif b'errormessage' in response.content:
-            raise BdcApiException('Error occurred while making request: {0}',
-                    json.loads(response.content)['errormessage'])
+                raise BdcApiException('Error sending request to host server: {0}'.format(e))
+
+        self._decode_response(response)
         return response
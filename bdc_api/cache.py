@@ -0,0 +1,129 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from collections import OrderedDict
+
+from ._sqlite import connect, create
+from .bdc_api import BdcApi
+
+class MetadataCache(object):
+    """Cache of metadata responses (task numbers, domains, datacollections and
+    file listings) for `BdcApi`.
+
+    Responses are kept for a per-endpoint time to live in a bounded in-memory
+    LRU and, if `path` is given, in an SQLite database which any number of
+    processes can share. Enable it with `BdcApi(..., cache=MetadataCache())`.
+    """
+    DEFAULT_TTLS = {BdcApi.URL_TASK_NUMBERS: 3600,
+                    BdcApi.URL_DOMAINS: 3600,
+                    BdcApi.URL_DATACOLLECTIONS: 600,
+                    BdcApi.URL_FILELIST: 600}
+
+    def __init__(self, ttls=None, max_entries=256, path=None):
+        """Configure the cache.
+
+        Parameters:
+
+            :ttls: Dictionary of seconds to keep responses for, keyed by endpoint
+                   (e.g. `BdcApi.URL_FILELIST`). Merged into `DEFAULT_TTLS`; a TTL
+                   of 0 disables caching of that endpoint.
+            :max_entries: Maximum number of responses kept in memory (default 256).
+            :path: Optional path of an SQLite database used as persistent tier.
+
+        Returns:
+
+            - New `MetadataCache` object.
+
+        Raises:
+
+            - None.
+        """
+        self.ttls = dict(self.DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.max_entries = max_entries
+        self.path = path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path:
+            create(path, 'CREATE TABLE IF NOT EXISTS responses ('
+                         'key TEXT PRIMARY KEY, endpoint TEXT, expires REAL, content BLOB)',
+                   'CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)')
+
+    def key(self, *parts):
+        """Derive a cache key from the exact request, e.g. host, username, URL
+        and parameters."""
+        canonical = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, endpoint, key):
+        """Return the cached body of a response, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    return entry[2]
+                del self._entries[key]
+        if not self.path:
+            return None
+        with connect(self.path) as connection:
+            row = connection.execute('SELECT expires, content FROM responses WHERE key = ?',
+                                     (key,)).fetchone()
+        if row is None or row[0] <= now:
+            return None
+        self._remember(key, row[0], endpoint, bytes(row[1]))
+        return bytes(row[1])
+
+    def set(self, endpoint, key, content):
+        """Cache the body of a response if `endpoint` has a TTL."""
+        ttl = self.ttls.get(endpoint)
+        if not ttl:
+            return
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        expires = time.time() + ttl
+        self._remember(key, expires, endpoint, content)
+        if self.path:
+            with connect(self.path) as connection:
+                connection.execute('DELETE FROM responses WHERE expires <= ?', (time.time(),))
+                connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                                   (key, endpoint, expires, sqlite3.Binary(content)))
+
+    def invalidate(self, endpoint=None):
+        """Drop cached responses of one endpoint, or all of them if `endpoint` is None."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items()
+                        if endpoint is None or entry[1] == endpoint]:
+                del self._entries[key]
+        if self.path:
+            with connect(self.path) as connection:
+                if endpoint is None:
+                    connection.execute('DELETE FROM responses')
+                else:
+                    connection.execute('DELETE FROM responses WHERE endpoint = ?', (endpoint,))
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        with self._lock:
+            state['_entries'] = OrderedDict(self._entries)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _remember(self, key, expires, endpoint, content):
+        with self._lock:
+            self._entries[key] = (expires, endpoint, content)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,174 @@
+import posixpath
+import time
+
+from ._sqlite import connect, create
+from .bdc_api import BdcApiException
+
+class CatalogIndex(object):
+    """Local SQLite index of the remote file catalog.
+
+    `sync` materializes the output of `BdcApi.get_datacollections` and
+    `BdcApi.iter_files` into an indexed database, after which files can be
+    selected by datacollection, extension and path prefix without contacting
+    the server. The selected paths can be passed straight to
+    `BdcApi.start_files_query`:
+
+    .. code-block:: python
+
+        index = CatalogIndex(api, 'catalog.sqlite')
+        index.sync()
+        query_id = api.start_files_query(index.files(extensions='json'))
+    """
+    BATCH_SIZE = 50
+
+    def __init__(self, api, path):
+        """Open or create an index.
+
+        Parameters:
+
+            :api: `BdcApi` used to synchronize the index.
+            :path: Path of the SQLite database.
+
+        Returns:
+
+            - New `CatalogIndex` object.
+
+        Raises:
+
+            - None.
+        """
+        self.api = api
+        self.path = path
+        create(path, 'CREATE TABLE IF NOT EXISTS datacollections ('
+                     'name TEXT PRIMARY KEY, synced REAL)',
+               'CREATE TABLE IF NOT EXISTS files (datacollection TEXT, path TEXT, '
+                     'extension TEXT, PRIMARY KEY (datacollection, path))',
+               'CREATE INDEX IF NOT EXISTS files_extension ON files (extension, path)',
+               'CREATE INDEX IF NOT EXISTS files_path ON files (path)',
+               'CREATE TABLE IF NOT EXISTS sync (key TEXT PRIMARY KEY, value)')
+
+    @property
+    def last_sync(self):
+        """Time of the start of the last complete unrestricted `sync`, or None."""
+        return self._last_sync('last_sync')
+
+    def _last_sync(self, key):
+        with connect(self.path) as connection:
+            row = connection.execute('SELECT value FROM sync WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _sync_key(self, task_numbers, domains):
+        """Key of the last sync restricted to `task_numbers` and `domains`."""
+        if not task_numbers and not domains:
+            return 'last_sync'
+        return 'last_sync:{0}|{1}'.format(','.join(sorted(task_numbers)),
+                                          ','.join(sorted(domains)))
+
+    def sync(self, task_numbers=[], domains=[], full=False):
+        """Bring the index up to date. After the first run, only datacollections
+        matching the `time_limits` from the last sync until now are requested,
+        and their files replace those already indexed. The last sync is kept
+        per restriction to `task_numbers` and `domains`, so that a restricted
+        sync does not hide the other datacollections from later syncs.
+
+        Parameters (all optional):
+
+            :task_numbers: A list of task number names to restrict the sync to.
+            :domains: A list of domain names to restrict the sync to.
+            :full: Whether to request every datacollection regardless of the
+                   last sync (default False).
+
+        Returns:
+
+            - Number of datacollections synchronized.
+
+        Raises:
+
+            - BdcApiException on problematic requests.
+        """
+        if not isinstance(task_numbers, list):
+            task_numbers = [task_numbers] if task_numbers else []
+        if not isinstance(domains, list):
+            domains = [domains] if domains else []
+        started = int(time.time())
+        key = self._sync_key(task_numbers, domains)
+        last_sync = None
+        if not full:
+            # An unrestricted sync also covers every restricted one.
+            synced = [value for value in (self._last_sync(key), self.last_sync)
+                      if value is not None]
+            last_sync = max(synced) if synced else None
+        time_limits = [int(last_sync), started] if last_sync is not None else []
+        try:
+            names = self.api.get_datacollections(task_numbers=task_numbers, domains=domains,
+                                                 time_limits=time_limits)
+        except BdcApiException as e:
+            if 'No datacollections found' not in str(e):
+                raise
+            names = []
+        for i in range(0, len(names), self.BATCH_SIZE):
+            batch = names[i:i + self.BATCH_SIZE]
+            rows = [(name, path, self._extension(path))
+                    for name, path in self.api.iter_files(datacollections=batch)]
+            with connect(self.path) as connection:
+                connection.executemany('DELETE FROM files WHERE datacollection = ?',
+                                       [(name,) for name in batch])
+                connection.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', rows)
+                connection.executemany('INSERT OR REPLACE INTO datacollections VALUES (?, ?)',
+                                       [(name, started) for name in batch])
+        with connect(self.path) as connection:
+            connection.execute('INSERT OR REPLACE INTO sync VALUES (?, ?)', (key, started))
+        return len(names)
+
+    def datacollections(self):
+        """Return the names of all indexed datacollections."""
+        with connect(self.path) as connection:
+            return [row[0] for row in connection.execute(
+                'SELECT name FROM datacollections ORDER BY name')]
+
+    def files(self, datacollections=[], extensions='', prefix='', limit=0):
+        """Select indexed files.
+
+        Parameters (all optional):
+
+            :datacollections: list of datacollection names to select files from.
+            :extensions: comma-separated string of desired extensions (e.g: 'json,txt').
+            :prefix: Path prefix the files must start with.
+            :limit: Maximum number of files to return (defaults to 0, meaning no limit).
+
+        Returns:
+
+            - List of file paths as returned by `BdcApi.get_files`, sorted by path.
+              Paths listed by several datacollections are returned once.
+
+        Raises:
+
+            - None.
+        """
+        if not isinstance(datacollections, list):
+            datacollections = [datacollections]
+        extensions = [extension.strip().lstrip('.').lower()
+                      for extension in extensions.split(',') if extension.strip()]
+        conditions, parameters = [], []
+        if datacollections:
+            conditions.append('datacollection IN ({0})'.format(
+                ','.join('?' * len(datacollections))))
+            parameters += datacollections
+        if extensions:
+            conditions.append('extension IN ({0})'.format(','.join('?' * len(extensions))))
+            parameters += extensions
+        if prefix:
+            # A range rather than LIKE, so that the path index is used.
+            conditions.append('path >= ? AND path < ?')
+            parameters += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+        sql = 'SELECT DISTINCT path FROM files'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY path'
+        if limit:
+            sql += ' LIMIT {0:d}'.format(limit)
+        with connect(self.path) as connection:
+            return [row[0] for row in connection.execute(sql, parameters)]
+
+    def _extension(self, path):
+        return posixpath.splitext(path)[1].lstrip('.').lower()
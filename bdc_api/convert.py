@@ -0,0 +1,239 @@
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .bdc_api import BdcApiException, json_loads
+
+HDF_SLICE_BYTES = 64 * 1024 * 1024
+
+class ConversionPipeline(object):
+    """Convert the members of query results into columnar or array files in a
+    pool of processes, while the results are still downloading.
+
+    Members are handed to the converter registered for their extension, which
+    writes its outputs under `target`, mirroring the layout of the extracted
+    members. By default `.json` catalogs and `.txt`/`.csv` text become Parquet
+    files (requires `pyarrow`) and every dataset of `.h5`/`.hdf5` files becomes a
+    `.npy` file (requires `h5py`). Pass the pipeline as the `on_member` of
+    `BdcApi.save_file`, so that each member is converted as soon as it is
+    extracted:
+
+    .. code-block:: python
+
+        with ConversionPipeline('extracted', 'converted') as pipeline:
+            api.save_file(query_id, local_path='/tmp', extract_to='extracted',
+                          on_member=pipeline)
+        print(pipeline.manifest)
+
+    At most `max_pending` members are queued or converting at once: beyond
+    that, `submit` blocks, which in turn pauses the extraction. Once closed, the
+    pipeline writes `manifest.json` to `target`, listing for each member its
+    converter, outputs, conversion time and error, if any.
+    """
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, source, target, converters=None, max_workers=None, max_pending=None):
+        """Create a pipeline. Worker processes are started with the first member.
+
+        Parameters:
+
+            :source: Directory the members are extracted into, i.e. the
+                     `extract_to` of `BdcApi.save_file`.
+            :target: Directory to write the outputs and the manifest to.
+            :converters: Optional dictionary of extensions to converters, replacing
+                         the defaults (see `register`).
+            :max_workers: Maximum number of worker processes (defaults to the number
+                          of CPUs).
+            :max_pending: Maximum number of members queued or converting at once
+                          (defaults to twice the number of workers).
+
+        Returns:
+
+            - New `ConversionPipeline` object.
+
+        Raises:
+
+            - None.
+        """
+        self.source = source
+        self.target = target
+        self.converters = {}
+        for extension, converter in (DEFAULT_CONVERTERS if converters is None
+                                     else converters).items():
+            self.register(extension, converter)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.manifest = []
+        self._pending = threading.BoundedSemaphore(max_pending or 2 * self.max_workers)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._closed = False
+
+    def register(self, extension, converter):
+        """Convert members with `extension` (e.g. 'json') with `converter`, a
+        function defined at module level so that it can be sent to the worker
+        processes. It is called with the path of the member and the path its
+        outputs should start with (the member's path under `target`, without
+        extension), and returns the list of paths it wrote."""
+        self.converters[extension.lstrip('.').lower()] = converter
+
+    def __call__(self, path):
+        self.submit(path)
+
+    def submit(self, path):
+        """Queue the member at `path` for conversion, if a converter is registered
+        for its extension, waiting while `max_pending` members are in flight.
+
+        Returns:
+
+            - Whether the member was queued.
+
+        Raises:
+
+            - BdcApiException if the pipeline is closed.
+        """
+        name = os.path.relpath(path, self.source)
+        stem, extension = os.path.splitext(name)
+        converter = self.converters.get(extension.lstrip('.').lower())
+        if converter is None:
+            return False
+        self._pending.acquire()
+        try:
+            with self._lock:
+                if self._closed:
+                    raise BdcApiException('The conversion pipeline is closed.')
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context('spawn'))
+                future = self._executor.submit(_convert, converter, path,
+                                               os.path.join(self.target, stem))
+        except BaseException:
+            self._pending.release()
+            raise
+        entry = {'source': name.replace(os.sep, '/'),
+                 'converter': getattr(converter, '__name__', repr(converter))}
+        future.add_done_callback(lambda future: self._record(entry, future))
+        return True
+
+    def close(self):
+        """Wait for all conversions, stop the worker processes and write the
+        manifest.
+
+        Returns:
+
+            - The manifest, a list of dictionaries with the `source` member name,
+              the `converter` name, the `outputs` paths relative to `target`, the
+              conversion `seconds` and the `error` message, or None.
+
+        Raises:
+
+            - BdcApiException if the manifest cannot be written.
+        """
+        with self._lock:
+            self._closed = True
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            self.manifest.sort(key=lambda entry: entry['source'])
+            manifest = list(self.manifest)
+        path = os.path.join(self.target, self.MANIFEST)
+        try:
+            os.makedirs(self.target, exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump(manifest, f, indent=1)
+        except OSError as e:
+            raise BdcApiException('Error occurred while saving file to {0}. Details: {1}'.format(
+                path, e))
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _record(self, entry, future):
+        """Add the outcome of a conversion to the manifest."""
+        try:
+            outputs, seconds = future.result()
+            entry.update(outputs=[os.path.relpath(output, self.target).replace(os.sep, '/')
+                                  for output in outputs], seconds=seconds, error=None)
+        except Exception as e:
+            entry.update(outputs=[], seconds=None, error='{0}: {1}'.format(
+                type(e).__name__, e))
+        with self._lock:
+            self.manifest.append(entry)
+        self._pending.release()
+
+def _convert(converter, source, base):
+    """Run `converter` in a worker process, timing it."""
+    started = time.perf_counter()
+    os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+    outputs = converter(source, base)
+    return list(outputs), time.perf_counter() - started
+
+def json_to_parquet(source, base):
+    """Convert a JSON document to `<base>.parquet`, see `tables.json_table`."""
+    from .tables import json_table
+    with open(source, 'rb') as f:
+        table = json_table(json_loads(f.read()))
+    return [_write_parquet(table, base)]
+
+def text_to_parquet(source, base):
+    """Convert delimited text to `<base>.parquet`, with the columns named by its
+    header line and typed by `pyarrow.csv`. Text which is not delimited becomes
+    a single `line` column."""
+    from .tables import _pyarrow
+    pyarrow = _pyarrow()
+    from pyarrow import csv
+    try:
+        table = csv.read_csv(source)
+    except pyarrow.ArrowInvalid:
+        with open(source, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+        table = pyarrow.table({'line': pyarrow.array(lines, pyarrow.string())})
+    return [_write_parquet(table, base)]
+
+def hdf_to_npy(source, base):
+    """Write every numeric dataset of an HDF5 file to `<base>/<dataset path>.npy`,
+    copying large datasets in slices so that memory use stays bounded."""
+    from numpy.lib.format import open_memmap
+    from .archive import _h5py
+    outputs = []
+    with _h5py().File(source, 'r') as f:
+        datasets = []
+        f.visititems(lambda name, item: datasets.append(name)
+                     if hasattr(item, 'shape') else None)
+        for name in datasets:
+            dataset = f[name]
+            if dataset.dtype.hasobject or dataset.shape is None:
+                continue
+            output = os.path.join(base, *name.split('/')) + '.npy'
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            array = open_memmap(output, mode='w+', dtype=dataset.dtype, shape=dataset.shape)
+            if dataset.ndim == 0:
+                array[()] = dataset[()]
+            else:
+                row_bytes = max(1, dataset.dtype.itemsize * int(dataset.size // max(
+                    dataset.shape[0], 1)))
+                step = max(1, HDF_SLICE_BYTES // row_bytes)
+                for start in range(0, dataset.shape[0], step):
+                    array[start:start + step] = dataset[start:start + step]
+            array.flush()
+            del array
+            outputs.append(output)
+    return outputs
+
+def _write_parquet(table, base):
+    import pyarrow.parquet
+    output = base + '.parquet'
+    pyarrow.parquet.write_table(table, output)
+    return output
+
+DEFAULT_CONVERTERS = {'json': json_to_parquet, 'txt': text_to_parquet, 'csv': text_to_parquet,
+                      'h5': hdf_to_npy, 'hdf5': hdf_to_npy}
@@ -0,0 +1,140 @@
+import bisect
+import threading
+
+class Metrics(object):
+    """Latency histograms and counters of the requests sent by a `BdcApi`, per
+    endpoint. Enable it with `BdcApi(..., metrics=True)`, then read it with
+    `as_dict` or export it in the Prometheus text format with `prometheus`:
+
+    .. code-block:: python
+
+        api = BdcApi(USERNAME, API_KEY, HOST, metrics=True)
+        api.get_task_numbers()
+        print(api.metrics.prometheus())
+
+    Any `BdcApi.RequestInfo` can be recorded, so a `Metrics` object can also be
+    registered as a `post_request` hook of several `BdcApi` objects.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    COUNTERS = ('requests', 'errors', 'cache_hits', 'retries', 'request_bytes',
+                'response_bytes')
+
+    def __init__(self, buckets=None):
+        """Create empty metrics.
+
+        Parameters:
+
+            :buckets: Sorted upper bounds in seconds of the latency histogram
+                      buckets (defaults to `BUCKETS`).
+
+        Returns:
+
+            - New `Metrics` object.
+
+        Raises:
+
+            - None.
+        """
+        self.buckets = tuple(buckets or self.BUCKETS)
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, info):
+        self.record(info)
+
+    def record(self, info):
+        """Account for one request, described by a `BdcApi.RequestInfo`."""
+        with self._lock:
+            endpoint = self._endpoints.get(info.endpoint)
+            if endpoint is None:
+                endpoint = self._endpoints[info.endpoint] = dict.fromkeys(self.COUNTERS, 0)
+                endpoint['latency_buckets'] = [0] * (len(self.buckets) + 1)
+                endpoint['latency_sum'] = 0.0
+            endpoint['requests'] += 1
+            endpoint['errors'] += info.error is not None
+            endpoint['cache_hits'] += info.cached
+            endpoint['retries'] += info.retries
+            endpoint['request_bytes'] += info.request_bytes
+            endpoint['response_bytes'] += info.response_bytes or 0
+            if not info.cached:
+                endpoint['latency_buckets'][bisect.bisect_left(self.buckets, info.seconds)] += 1
+                endpoint['latency_sum'] += info.seconds
+
+    def reset(self):
+        """Drop everything recorded so far."""
+        with self._lock:
+            self._endpoints = {}
+
+    def as_dict(self):
+        """Return the metrics as a dictionary keyed by endpoint, whose values hold
+        the counters, the `latency_sum` in seconds and the `latency_buckets`,
+        a dictionary of the number of requests sent (cache hits excluded) that
+        took at most each bucket bound, including the `inf` bucket.
+        """
+        bounds = [str(bound) for bound in self.buckets] + ['inf']
+        result = {}
+        with self._lock:
+            for name, endpoint in self._endpoints.items():
+                result[name] = {counter: endpoint[counter] for counter in self.COUNTERS}
+                result[name]['latency_sum'] = endpoint['latency_sum']
+                result[name]['latency_buckets'] = dict(zip(bounds, _cumulative(
+                    endpoint['latency_buckets'])))
+        return result
+
+    def prometheus(self, prefix='bdc_api'):
+        """Return the metrics in the Prometheus text exposition format.
+
+        Parameters:
+
+            :prefix: Prefix of the metric names (default `bdc_api`).
+
+        Returns:
+
+            - String of the `<prefix>_<counter>_total` counters and the
+              `<prefix>_request_seconds` histogram, labelled by endpoint.
+
+        Raises:
+
+            - None.
+        """
+        metrics = self.as_dict()
+        lines = []
+        for counter in self.COUNTERS:
+            name = '{0}_{1}_total'.format(prefix, counter)
+            lines.append('# TYPE {0} counter'.format(name))
+            for endpoint in sorted(metrics):
+                lines.append('{0}{{endpoint="{1}"}} {2}'.format(
+                    name, _label(endpoint), metrics[endpoint][counter]))
+        name = '{0}_request_seconds'.format(prefix)
+        lines.append('# TYPE {0} histogram'.format(name))
+        for endpoint in sorted(metrics):
+            label = _label(endpoint)
+            buckets = metrics[endpoint]['latency_buckets']
+            for bound, count in buckets.items():
+                lines.append('{0}_bucket{{endpoint="{1}",le="{2}"}} {3}'.format(
+                    name, label, '+Inf' if bound == 'inf' else bound, count))
+            lines.append('{0}_sum{{endpoint="{1}"}} {2}'.format(
+                name, label, metrics[endpoint]['latency_sum']))
+            lines.append('{0}_count{{endpoint="{1}"}} {2}'.format(name, label, buckets['inf']))
+        return '\n'.join(lines) + '\n'
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        with self._lock:
+            state['_endpoints'] = {name: dict(endpoint, latency_buckets=list(
+                endpoint['latency_buckets'])) for name, endpoint in self._endpoints.items()}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+def _cumulative(counts):
+    total = 0
+    for count in counts:
+        total += count
+        yield total
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
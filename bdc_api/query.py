@@ -0,0 +1,280 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+from .bdc_api import BdcApiException
+
+class QueryFuture(Future):
+    """`concurrent.futures.Future` tracking a query started with `BdcApi`.
+
+    Resolves with the final `BdcApi.QueryInfo` once the query progress reaches
+    `BdcApi.COMPLETE_QUERY`, or with a `BdcApiException` if the job ends with
+    one of the `BdcApi.COMPLETE_QUERY_STATUS` statuses. Works with
+    `concurrent.futures.wait`, `as_completed` and `add_done_callback`.
+    """
+
+    def __init__(self, query_id):
+        super(QueryFuture, self).__init__()
+        self.query_id = query_id
+        self.info = None
+        self.checks = 0
+
+class QueryPoller(object):
+    """Background thread checking the progress of every outstanding `QueryFuture`
+    of a `BdcApi`. Each query is checked on its own schedule: the interval grows
+    by `BdcApi.POLL_BACKOFF` whenever its progress has not changed since the
+    previous check, up to `BdcApi.POLL_MAX_INTERVAL`, and shrinks back towards
+    `BdcApi.POLL_MIN_INTERVAL` while it is moving. The thread and its workers
+    stop once no query is left, and start again with the next one.
+    """
+
+    def __init__(self, api, max_workers=4):
+        """Create a poller for the queries of `api`.
+
+        Parameters:
+
+            :api: `BdcApi` used to check query progress.
+            :max_workers: Maximum number of progress checks sent concurrently.
+
+        Returns:
+
+            - New `QueryPoller` object. Its thread starts with the first query.
+
+        Raises:
+
+            - None.
+        """
+        self.api = api
+        self.max_workers = max_workers
+        self._queue = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, query_id, poll_interval=None):
+        """Start tracking a query.
+
+        Parameters:
+
+            :query_id: Query ID from one of the `start_datacollection_query` or
+                       `start_files_query` functions.
+            :poll_interval: Seconds before the first progress check (defaults to
+                            `BdcApi.POLL_MIN_INTERVAL`).
+
+        Returns:
+
+            - `QueryFuture` of the query.
+
+        Raises:
+
+            - BdcApiException if the poller was shut down.
+        """
+        if poll_interval is None:
+            poll_interval = self.api.POLL_MIN_INTERVAL
+        future = QueryFuture(query_id)
+        with self._condition:
+            if self._stopped:
+                raise BdcApiException('Cannot track query {0}, poller is shut down.'.format(
+                    query_id))
+            self._schedule(future, poll_interval, None)
+            if self._thread is None:
+                executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                self._thread = threading.Thread(target=self._run, args=(executor,),
+                                                name='QueryPoller', daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def shutdown(self):
+        """Stop the poller thread. Outstanding futures are cancelled."""
+        with self._condition:
+            self._stopped = True
+            pending = [entry[2] for entry in self._queue]
+            self._queue = []
+            self._condition.notify()
+            thread = self._thread
+        for future in pending:
+            if future.cancel():
+                future.set_running_or_notify_cancel()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._queue)
+
+    def _schedule(self, future, interval, progress):
+        heapq.heappush(self._queue, (time.monotonic() + interval, next(self._counter),
+                                     future, interval, progress))
+
+    def _run(self, executor):
+        try:
+            self._poll(executor)
+        finally:
+            executor.shutdown()
+
+    def _poll(self, executor):
+        while True:
+            with self._condition:
+                while not self._stopped and self._queue and \
+                        self._queue[0][0] > time.monotonic():
+                    self._condition.wait(self._queue[0][0] - time.monotonic())
+                if self._stopped or not self._queue:
+                    # Idle, the next query starts a new thread.
+                    self._thread = None
+                    return
+                due = []
+                while self._queue and self._queue[0][0] <= time.monotonic():
+                    due.append(heapq.heappop(self._queue))
+            due = [entry for entry in due if not self._drop_cancelled(entry[2])]
+            # Futures are resolved and cancelled without holding the lock, since
+            # their done callbacks may track further queries or close the API.
+            checks = list(executor.map(self._check, [entry[2] for entry in due]))
+            resolved, cancelled = [], []
+            with self._condition:
+                for (_, _, future, interval, progress), (info, outcome) in zip(due, checks):
+                    if outcome is not None:
+                        resolved.append((future, outcome))
+                        continue
+                    if future.done():
+                        continue
+                    if self._stopped:
+                        cancelled.append(future)
+                        continue
+                    if info.progress == progress:
+                        interval = min(interval * self.api.POLL_BACKOFF,
+                                       self.api.POLL_MAX_INTERVAL)
+                    else:
+                        interval = max(interval / self.api.POLL_BACKOFF,
+                                       self.api.POLL_MIN_INTERVAL)
+                    self._schedule(future, interval, info.progress)
+            for future, (result, exception) in resolved:
+                self._resolve(future, result, exception)
+            for future in cancelled:
+                if future.cancel():
+                    future.set_running_or_notify_cancel()
+
+    def _drop_cancelled(self, future):
+        """Notify waiters of a cancelled future, which `Future.cancel` alone does not."""
+        if not future.cancelled():
+            return False
+        try:
+            future.set_running_or_notify_cancel()
+        except RuntimeError:
+            # Already notified.
+            pass
+        return True
+
+    def _check(self, future):
+        """Check the progress of one query. Returns the QueryInfo, and the (result,
+        exception) tuple to resolve its future with if the query is over, else None."""
+        try:
+            info = self.api.check_query_progress(future.query_id)
+        except Exception as e:
+            return None, (None, e)
+        future.info = info
+        future.checks += 1
+        if info.progress == self.api.COMPLETE_QUERY:
+            return info, (info, None)
+        if info.status in self.api.COMPLETE_QUERY_STATUS:
+            return info, (None, BdcApiException(
+                'Query {0} {1}.'.format(future.query_id, info.status)))
+        return info, None
+
+    def _resolve(self, future, result=None, exception=None):
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            # Cancelled in the meantime.
+            self._drop_cancelled(future)
+
+class QueryGroup(object):
+    """Queries started together by `BdcApi.start_files_query_group`, one per
+    chunk of the requested file list, tracked as a single logical query.
+    """
+
+    def __init__(self, api, query_ids, chunks):
+        """Create a group.
+
+        Parameters:
+
+            :api: `BdcApi` the queries were started with.
+            :query_ids: List of query IDs.
+            :chunks: List of the file lists of each query.
+
+        Returns:
+
+            - New `QueryGroup` object.
+
+        Raises:
+
+            - None.
+        """
+        self.api = api
+        self.query_ids = list(query_ids)
+        self.chunks = list(chunks)
+
+    def __len__(self):
+        return len(self.query_ids)
+
+    def check_query_progress(self):
+        """Check the progress of every query of the group.
+
+        Returns:
+
+            - Dictionary of query IDs, whose values are their QueryInfo.
+
+        Raises:
+
+            - BdcApiException on problematic requests.
+        """
+        return {query_id: self.api.check_query_progress(query_id) for query_id in self.query_ids}
+
+    def futures(self, poll_interval=None):
+        """Track every query of the group, see `BdcApi.watch_query`.
+
+        Returns:
+
+            - List of `QueryFuture` objects, in the order of `query_ids`.
+
+        Raises:
+
+            - None.
+        """
+        return [self.api.watch_query(query_id, poll_interval) for query_id in self.query_ids]
+
+    def save_files(self, local_path, max_workers=4, segments=1, poll_interval=None):
+        """Save the archive of each query to `local_path` as soon as it is ready,
+        downloading up to `max_workers` archives concurrently.
+
+        Parameters:
+
+            :local_path: A directory on local disk to save the results to.
+            :max_workers: Maximum number of concurrent downloads (default 4).
+            :segments: Number of byte ranges to fetch concurrently per download,
+                       see `BdcApi.save_file` (default 1).
+            :poll_interval: Seconds before the first progress check of each query.
+
+        Returns:
+
+            - Dictionary of query IDs, in the order of `query_ids`, whose values
+              are named tuple objects `BdcApi.DownloadResult`. A failing query does
+              not affect the others.
+
+        Raises:
+
+            - BdcApiException if `local_path` is not a directory.
+        """
+        if not os.path.exists(local_path) or not os.path.isdir(local_path):
+            raise BdcApiException('Invalid directory "{0}".'.format(local_path))
+        queries = dict(zip(self.futures(poll_interval), self.query_ids))
+        results = self.api._save_completed_queries(queries, local_path, max_workers, segments)
+        return {query_id: results[query_id] for query_id in self.query_ids}
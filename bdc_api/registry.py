@@ -0,0 +1,91 @@
+import hashlib
+import json
+import time
+
+from ._sqlite import connect, create
+
+class QueryRegistry(object):
+    """Persistent registry of the queries started by `BdcApi`, so that identical
+    requests reuse the query of an earlier one instead of having the server
+    package the same data again.
+
+    Requests are keyed by a canonical hash of their host, user and inputs (the
+    sorted file list or the datacollection name), and recorded with the query
+    ID, its last known status and progress, and its creation time, in an
+    SQLite database which any number of processes can share. Enable it with
+    `BdcApi(..., registry=QueryRegistry('queries.sqlite'))`.
+    """
+    DEFAULT_MAX_AGE = 24 * 3600
+
+    def __init__(self, path, max_age=DEFAULT_MAX_AGE):
+        """Open or create a registry.
+
+        Parameters:
+
+            :path: Path of the SQLite database.
+            :max_age: Seconds after its creation during which a query is reused
+                      (default one day), to stay within the time the server keeps
+                      query results.
+
+        Returns:
+
+            - New `QueryRegistry` object.
+
+        Raises:
+
+            - None.
+        """
+        self.path = path
+        self.max_age = max_age
+        create(path, 'CREATE TABLE IF NOT EXISTS queries (key TEXT PRIMARY KEY, '
+                     'query_id TEXT, status TEXT, progress TEXT, created REAL)',
+               'CREATE INDEX IF NOT EXISTS queries_query_id ON queries (query_id)')
+
+    def key(self, host, username, files=None, datacollection=None):
+        """Derive the key of a query of `files` or of `datacollection`."""
+        request = {'host': host, 'username': username}
+        if files is not None:
+            request['files'] = sorted(set(files))
+        else:
+            request['datacollection'] = datacollection
+        canonical = json.dumps(request, sort_keys=True)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the query ID recorded for `key` if it is recent enough, else None."""
+        with connect(self.path) as connection:
+            row = connection.execute('SELECT query_id FROM queries WHERE key = ? '
+                                     'AND created > ?',
+                                     (key, time.time() - self.max_age)).fetchone()
+        return row[0] if row else None
+
+    def record(self, key, query_id, info=None):
+        """Record a newly started query."""
+        with connect(self.path) as connection:
+            connection.execute('DELETE FROM queries WHERE created <= ?',
+                               (time.time() - self.max_age,))
+            connection.execute('INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?, ?)',
+                               (key, query_id, info.status if info else None,
+                                info.progress if info else None, time.time()))
+
+    def update(self, query_id, info):
+        """Record the last known `BdcApi.QueryInfo` of a query."""
+        with connect(self.path) as connection:
+            connection.execute('UPDATE queries SET status = ?, progress = ? WHERE query_id = ?',
+                               (info.status, str(info.progress), query_id))
+
+    def status(self, query_id):
+        """Return the last known status and progress of a query, or None."""
+        with connect(self.path) as connection:
+            row = connection.execute('SELECT status, progress FROM queries WHERE query_id = ?',
+                                     (query_id,)).fetchone()
+        return tuple(row) if row else None
+
+    def discard(self, query_id):
+        """Stop reusing a query, e.g. once it failed or its results expired."""
+        with connect(self.path) as connection:
+            connection.execute('DELETE FROM queries WHERE query_id = ?', (query_id,))
+
+    def __len__(self):
+        with connect(self.path) as connection:
+            return connection.execute('SELECT COUNT(*) FROM queries').fetchone()[0]
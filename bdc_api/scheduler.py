@@ -0,0 +1,168 @@
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+from .bdc_api import BdcApiException
+
+class RequestScheduler(object):
+    """Client-side rate limits for the requests of one or more `BdcApi` objects,
+    with priority lanes.
+
+    Requests are classed as `metadata`, `query` (submissions), `progress` or
+    `download`, and each class can be limited to a number of requests per
+    second by a token bucket, as can all requests together with the `total`
+    rate. Download bodies can also be capped in bytes per second. When a limit
+    is reached, waiting threads are served by priority, lowest first, then in
+    arrival order. Downloads default to `BULK` and every other request to
+    `INTERACTIVE`, so that under the `total` rate, which all classes compete
+    for, interactive calls overtake queued downloads. `priority` overrides the
+    default for the calling thread, which also orders the threads waiting for
+    the limit of one class or for the bandwidth:
+
+    .. code-block:: python
+
+        scheduler = RequestScheduler(rates={'total': 20, 'progress': 5, 'query': (1, 5)},
+                                     max_bytes_per_second=50 * 1024 * 1024)
+        api = BdcApi(USERNAME, API_KEY, HOST, scheduler=scheduler)
+        with scheduler.priority(RequestScheduler.BULK):
+            CatalogIndex(api, 'catalog.sqlite').sync()
+
+    One scheduler can be shared by all `BdcApi` objects of a process. Thread
+    priorities do not carry over to the worker threads of methods such as
+    `download_datacollections`, whose requests run at their default priority.
+    """
+    CLASSES = ('metadata', 'query', 'progress', 'download')
+    TOTAL = 'total'
+    INTERACTIVE = 0
+    BULK = 10
+
+    def __init__(self, rates=None, max_bytes_per_second=None, priorities=None):
+        """Create a scheduler.
+
+        Parameters:
+
+            :rates: Optional dictionary of request classes (see `CLASSES`), or
+                    `TOTAL` for all requests together, to their limit, either a
+                    number of requests per second, or a tuple of that rate and
+                    the size of bursts allowed after idle time (defaults to one
+                    second worth of requests). Requests without a limit are not
+                    delayed.
+            :max_bytes_per_second: Optional cap on the bandwidth of all download
+                                   bodies together.
+            :priorities: Optional dictionary of request classes to their default
+                         priority, overriding `BULK` for downloads and
+                         `INTERACTIVE` for the others.
+
+        Returns:
+
+            - New `RequestScheduler` object.
+
+        Raises:
+
+            - BdcApiException on unknown request classes or non-positive limits.
+        """
+        self.rates = dict(rates or {})
+        self.max_bytes_per_second = max_bytes_per_second
+        self.priorities = dict({name: self.INTERACTIVE for name in self.CLASSES},
+                               download=self.BULK)
+        self.priorities.update(priorities or {})
+        unknown = (set(self.rates) - {self.TOTAL} | set(self.priorities)) - set(self.CLASSES)
+        if unknown:
+            raise BdcApiException('Unknown request classes: {0}.'.format(
+                ', '.join(sorted(unknown))))
+        self._reset()
+
+    def _reset(self):
+        self._condition = threading.Condition()
+        self._local = threading.local()
+        self._tickets = itertools.count()
+        self._buckets = {}
+        for name, rate in self.rates.items():
+            rate, burst = rate if isinstance(rate, tuple) else (rate, max(rate, 1))
+            self._buckets[name] = _Bucket(rate, burst)
+        if self.max_bytes_per_second:
+            self._buckets['bandwidth'] = _Bucket(self.max_bytes_per_second,
+                                                 self.max_bytes_per_second)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ('_condition', '_local', '_tickets', '_buckets'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    @contextlib.contextmanager
+    def priority(self, priority):
+        """Run the requests of the calling thread at `priority` (lower goes first)."""
+        previous = getattr(self._local, 'priority', None)
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def acquire(self, request_class):
+        """Wait until a request of `request_class` may be sent."""
+        if request_class in self._buckets:
+            self._take(request_class, request_class, 1)
+        if self.TOTAL in self._buckets:
+            self._take(self.TOTAL, request_class, 1)
+
+    def throttle(self, size):
+        """Account for `size` bytes of download body, waiting while above
+        `max_bytes_per_second`."""
+        if 'bandwidth' in self._buckets:
+            self._take('bandwidth', 'download', size)
+
+    def _take(self, name, request_class, cost):
+        """Take `cost` tokens from bucket `name`, serving waiters by priority. A
+        cost above the bucket size is taken as soon as the bucket is full, and
+        paid back before the next waiter is served."""
+        priority = getattr(self._local, 'priority', None)
+        if priority is None:
+            priority = self.priorities[request_class]
+        bucket = self._buckets[name]
+        ticket = (priority, next(self._tickets))
+        with self._condition:
+            heapq.heappush(bucket.waiting, ticket)
+            try:
+                while True:
+                    wait = None
+                    if bucket.waiting[0] == ticket:
+                        wait = bucket.wait(min(cost, bucket.burst))
+                        if wait <= 0:
+                            heapq.heappop(bucket.waiting)
+                            bucket.tokens -= cost
+                            self._condition.notify_all()
+                            return
+                    self._condition.wait(wait)
+            except BaseException:
+                bucket.waiting.remove(ticket)
+                heapq.heapify(bucket.waiting)
+                self._condition.notify_all()
+                raise
+
+class _Bucket(object):
+    """Token bucket refilled at `rate` tokens per second up to `burst` tokens,
+    with the heap of the tickets waiting for it."""
+
+    def __init__(self, rate, burst):
+        if rate <= 0 or burst <= 0:
+            raise BdcApiException('Rate limits must be positive.')
+        self.rate = float(rate)
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.waiting = []
+
+    def wait(self, cost):
+        """Return the seconds until `cost` tokens are available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return (cost - self.tokens) / self.rate
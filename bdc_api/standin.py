@@ -0,0 +1,386 @@
+import hashlib
+import io
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+import zipfile
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StandinServer(object):
+    """Local stand-in for the MINOS REST API, meant for tests and benchmarks.
+
+    Implements every endpoint used by `BdcApi` over synthetic data: one task
+    with `domains` domains, `datacollections` datacollections (the i-th one
+    timestamped i) of `files_per_datacollection` files each, queries which
+    take `job_duration` seconds to complete, and a synthetic query result
+    served from the download endpoint, honouring `Range` requests unless told
+    otherwise. `QUERY_ID` is always complete. Use it as a context manager and
+    point a `BdcApi` at its `url`:
+
+    .. code-block:: python
+
+        with StandinServer(archive_size=64 * 1024 * 1024) as server:
+            api = BdcApi('user', 'key', server.url)
+            api.save_file(server.QUERY_ID, local_path='/tmp', segments=4)
+    """
+    QUERY_ID = '5d9e26ada81660b57e387f49'
+    ETAG = '"standin-v1"'
+    BLOCK_SIZE = 64 * 1024
+
+    TASK = 'Task 1-ARES'
+    EXTENSIONS = ('h5', 'json', 'txt')
+
+    def __init__(self, archive_size=1024 * 1024, ranges=True, stream_rate=0,
+                 content_type='application/zip', latency=0, failures=0, job_duration=0,
+                 domains=2, datacollections=10, files_per_datacollection=10, content=None,
+                 zip_results=False, file_size=1024, shared_paths=False):
+        """Configure the stand-in server.
+
+        Parameters:
+
+            :archive_size: Size in bytes of the archive served by the download endpoint.
+            :ranges: Whether `Range` requests are honoured (default True).
+            :stream_rate: Maximum bytes per second sent on each response, 0 for
+                          no limit. Emulates per-connection throughput limits of
+                          long-distance links.
+            :content_type: Content type of the served archive.
+            :latency: Seconds to wait before answering any request.
+            :failures: Number of upcoming task numbers requests to answer with
+                       `503 Service Unavailable` and `Retry-After: 0`.
+            :job_duration: Seconds from the start of a query until its progress
+                           reaches 100%, growing linearly in between.
+            :domains: Number of domains of the task.
+            :datacollections: Number of datacollections.
+            :files_per_datacollection: Number of files of each datacollection,
+                                       with extensions cycling through `EXTENSIONS`.
+            :content: Optional bytes served as the archive instead of synthetic
+                      data, overriding `archive_size`.
+            :zip_results: Whether the results of queries started from the query
+                          endpoint are zip archives of the requested files, named
+                          after their paths and holding `file_content` (default
+                          False).
+            :file_size: Size in bytes of each file in those archives.
+            :shared_paths: Whether all datacollections list the same file paths,
+                           `/file_<i>.<extension>`, which the archives then hold
+                           once per datacollection, named `<datacollection>/<path>`
+                           and with different content (default False).
+
+        Returns:
+
+            - New `StandinServer` object, not started yet.
+
+        Raises:
+
+            - None.
+        """
+        self.content = content
+        self.archive_size = archive_size if content is None else len(content)
+        self.ranges = ranges
+        self.stream_rate = stream_rate
+        self.content_type = content_type
+        self.latency = latency
+        self.failures = failures
+        self.job_duration = job_duration
+        self.domains = ['domain_{0}'.format(i) for i in range(domains)]
+        self.datacollections = datacollections
+        self.files_per_datacollection = files_per_datacollection
+        self.block = os.urandom(self.BLOCK_SIZE)
+        self.requests = []
+        self.connections = 0
+        self.zip_results = zip_results
+        self.file_size = file_size
+        self.shared_paths = shared_paths
+        self.jobs = {}
+        self.job_files = {}
+        self._results = {}
+        self._query_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to be used as `hostname` of a `BdcApi`."""
+        host, port = self._httpd.server_address[:2]
+        return 'http://{0}:{1}'.format(host, port)
+
+    def start(self):
+        """Start serving from a background thread on a free local port."""
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), _StandinHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.standin = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        kwargs={'poll_interval': 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and release the port."""
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def fail_request(self):
+        """Return whether the current request should fail, counting down `failures`."""
+        with self._lock:
+            if self.failures > 0:
+                self.failures -= 1
+                return True
+            return False
+
+    def datacollection(self, index):
+        """Return a dictionary describing the `index`-th datacollection."""
+        return {'name': 'datacollection_{0:05d}'.format(index),
+                'task': self.TASK,
+                'domain': self.domains[index % len(self.domains)] if self.domains else '',
+                'timestamp': index}
+
+    def files(self, name):
+        """Return the file paths of datacollection `name`."""
+        prefix = '' if self.shared_paths else '/' + name
+        return ['{0}/file_{1:05d}.{2}'.format(prefix, i, self.EXTENSIONS[i % len(self.EXTENSIONS)])
+                for i in range(self.files_per_datacollection)]
+
+    def start_job(self, files=()):
+        """Start a query job of the given file paths, returning its ID."""
+        with self._lock:
+            query_id = '{0:024x}'.format(next(self._query_ids))
+            self.jobs[query_id] = time.monotonic()
+            self.job_files[query_id] = list(files)
+        return query_id
+
+    def file_content(self, path, datacollection=None):
+        """Return the content of file `path` in the archives of `zip_results`: a
+        JSON catalog of two records for `.json` files, else `file_size` bytes.
+        With `shared_paths`, the content also depends on `datacollection`."""
+        key = path if datacollection is None else '{0}:{1}'.format(datacollection, path)
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        if path.endswith('.json'):
+            return json.dumps([{'file': path, 'record': i, 'size': self.file_size,
+                                'detector': {'id': digest[i], 'gain': digest[i] / 4.0},
+                                'tags': ['standin', str(i)], 'valid': i == 0}
+                               for i in range(2)]).encode('utf-8')
+        return (digest * (self.file_size // len(digest) + 1))[:self.file_size]
+
+    def result(self, query_id):
+        """Return the zip archive of a query with `zip_results`, else None."""
+        if not self.zip_results or query_id not in self.job_files:
+            return None
+        with self._lock:
+            if query_id not in self._results:
+                archive = io.BytesIO()
+                with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as result:
+                    for path in self.job_files[query_id]:
+                        if not self.shared_paths:
+                            result.writestr(path.lstrip('/'), self.file_content(path))
+                            continue
+                        for i in range(self.datacollections):
+                            name = self.datacollection(i)['name']
+                            result.writestr('{0}/{1}'.format(name, path.lstrip('/')),
+                                            self.file_content(path, name))
+                self._results[query_id] = archive.getvalue()
+            return self._results[query_id]
+
+    def progress(self, query_id):
+        """Return the progress of a query in percent, or None if it is unknown."""
+        if query_id == self.QUERY_ID:
+            return 100
+        started = self.jobs.get(query_id)
+        if started is None:
+            return None
+        if self.job_duration <= 0:
+            return 100
+        return min(100, int(100 * (time.monotonic() - started) / self.job_duration))
+
+    def archive(self, start=0, stop=None):
+        """Return bytes `start` to `stop` (exclusive) of the served archive."""
+        stop = self.archive_size if stop is None else min(stop, self.archive_size)
+        if self.content is not None:
+            return self.content[start:stop]
+        chunks = []
+        while start < stop:
+            offset = start % self.BLOCK_SIZE
+            length = min(self.BLOCK_SIZE - offset, stop - start)
+            chunks.append(self.block[offset:offset + length])
+            start += length
+        return b''.join(chunks)
+
+class _StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    DOWNLOAD_PATH = re.compile(r'^/minos_restapi/download/(?P<query_id>[0-9a-f]{24})/?$')
+    PROGRESS_PATH = re.compile(r'^/minos_restapi/progress/(?P<query_id>[0-9a-f]{24})/?$')
+    DOMAINS_PATH = re.compile(r'^/minos_restapi/domains_info(/(?P<task_id>[0-9a-f]{24})?)?/?$')
+    TASK_ID = '5d9e26ada81660b57e387f49'
+    TASKS = {StandinServer.TASK: {'POCS': [{'username': 'admin', 'laboratory': 'LBNL',
+                                            'fullname': ' '}],
+                                  'ID': TASK_ID}}
+    RANGE = re.compile(r'^bytes=(?P<start>\d+)-(?P<end>\d*)$')
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super(_StandinHandler, self).setup()
+        with self.server.standin._lock:
+            self.server.standin.connections += 1
+
+    def do_GET(self):
+        standin = self.server.standin
+        standin.requests.append(('GET', self.path, dict(self.headers)))
+        if standin.latency:
+            time.sleep(standin.latency)
+        path, _, query = self.path.partition('?')
+        parameters = dict(urllib.parse.parse_qsl(query))
+        route = path.rstrip('/')
+        match = self.DOWNLOAD_PATH.match(path)
+        if match:
+            progress = standin.progress(match.group('query_id'))
+            if progress is not None and progress < 100:
+                self._send_json({'error_message': 'Query is not complete.'})
+            else:
+                self._send_download(standin, match.group('query_id'))
+        elif route == '/minos_restapi/tasks_info':
+            if standin.fail_request():
+                self._send_bytes(503, b'', 'text/plain', {'Retry-After': '0'})
+            else:
+                self._send_json(self.TASKS)
+        elif self.DOMAINS_PATH.match(path):
+            task_id = self.DOMAINS_PATH.match(path).group('task_id')
+            if task_id and task_id != self.TASK_ID:
+                self._send_json({'error_message': 'Unknown task.'})
+            else:
+                self._send_json({standin.TASK: standin.domains})
+        elif route == '/minos_restapi/datacollections':
+            self._send_datacollections(standin, parameters)
+        elif route == '/minos_restapi/files':
+            self._send_files(standin, parameters)
+        else:
+            match = self.PROGRESS_PATH.match(path)
+            progress = standin.progress(match.group('query_id')) if match else None
+            if progress is not None:
+                self._send_json({'progress': '{0}%'.format(progress),
+                                 'job_status': 'success' if progress == 100 else 'running'})
+            elif match:
+                self._send_json({'errormessage': 'Unknown query.'})
+            else:
+                self._send_bytes(404, b'{"error_message": "Not found."}', 'application/json')
+
+    def do_POST(self):
+        standin = self.server.standin
+        standin.requests.append(('POST', self.path, dict(self.headers)))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if standin.latency:
+            time.sleep(standin.latency)
+        parameters = dict(urllib.parse.parse_qsl(body.decode('utf-8')))
+        if self.path.rstrip('/') != '/minos_restapi/request_data':
+            self._send_bytes(404, b'{"error_message": "Not found."}', 'application/json')
+        elif not parameters.get('datacollection') and not parameters.get('filepaths'):
+            self._send_json({'error_message': 'Nothing to query.'})
+        elif parameters.get('filepaths'):
+            self._send_json({'query_id': standin.start_job(parameters['filepaths'].split(','))})
+        else:
+            self._send_json({'query_id': standin.start_job(
+                standin.files(parameters['datacollection']))})
+
+    def _send_datacollections(self, standin, parameters):
+        tasks = parameters['tasks'].split(',') if parameters.get('tasks') else None
+        domains = parameters['domains'].split(',') if parameters.get('domains') else None
+        start, stop = 0, standin.datacollections - 1
+        if parameters.get('time_limits'):
+            start, stop = [int(limit) for limit in parameters['time_limits'].split(',')]
+        limit = int(parameters.get('limit') or 0)
+        documents = []
+        for i in range(max(start, 0), min(stop, standin.datacollections - 1) + 1):
+            document = standin.datacollection(i)
+            if tasks is not None and document['task'] not in tasks:
+                continue
+            if domains is not None and document['domain'] not in domains:
+                continue
+            documents.append(document)
+            if len(documents) == limit:
+                break
+        self._send_json(documents)
+
+    def _send_files(self, standin, parameters):
+        if parameters.get('datacollections'):
+            names = parameters['datacollections'].split(',')
+        else:
+            names = [standin.datacollection(i)['name'] for i in range(standin.datacollections)]
+        extensions = [extension.strip().lstrip('.') for extension
+                      in parameters.get('extensions', '').split(',') if extension.strip()]
+        limit = int(parameters.get('limit') or 0)
+        if limit:
+            names = names[:limit]
+        listing = {}
+        for name in names:
+            listing[name] = [path for path in standin.files(name)
+                             if not extensions or path.rsplit('.', 1)[-1] in extensions]
+        self._send_json(listing)
+
+    def _send_download(self, standin, query_id):
+        content = standin.result(query_id)
+        size = standin.archive_size if content is None else len(content)
+        start, end, status = 0, size - 1, 200
+        headers = {'Content-Disposition': 'attachment; filename=download_{0}.zip'.format(query_id),
+                   'ETag': standin.ETAG}
+        if standin.ranges:
+            headers['Accept-Ranges'] = 'bytes'
+            match = self.RANGE.match(self.headers.get('Range', ''))
+            if_range = self.headers.get('If-Range')
+            if match and (if_range is None or if_range == standin.ETAG):
+                start = int(match.group('start'))
+                if match.group('end'):
+                    end = min(int(match.group('end')), size - 1)
+                if start >= size or start > end:
+                    headers['Content-Range'] = 'bytes */{0}'.format(size)
+                    self._send_bytes(416, b'', standin.content_type, headers)
+                    return
+                status = 206
+                headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, size)
+        self.send_response(status)
+        self.send_header('Content-Type', standin.content_type)
+        self.send_header('Content-Length', str(end + 1 - start))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        position, started = start, time.time()
+        try:
+            while position <= end:
+                stop = min(position + standin.BLOCK_SIZE, end + 1)
+                if content is None:
+                    chunk = standin.archive(position, stop)
+                else:
+                    chunk = content[position:stop]
+                self.wfile.write(chunk)
+                position += len(chunk)
+                if standin.stream_rate:
+                    delay = (position - start) / standin.stream_rate - (time.time() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def _send_json(self, document):
+        self._send_bytes(200, json.dumps(document).encode('utf-8'), 'application/json')
+
+    def _send_bytes(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
@@ -0,0 +1,209 @@
+import hashlib
+import os
+import shutil
+import time
+import uuid
+
+from ._sqlite import connect, create
+from .bdc_api import BdcApiException
+
+class FileStore(object):
+    """Content-addressed local store of downloaded files.
+
+    Files are kept once per content under `objects/`, named by their SHA-256,
+    and indexed by datacollection and file path (as listed by
+    `BdcApi.get_files`) together with their size and checksum in an SQLite
+    database. `BdcApi.fetch_files` uses it to only query the files which are
+    not stored yet:
+
+    .. code-block:: python
+
+        api = BdcApi(USERNAME, API_KEY, HOST, store=FileStore('/data/bdc'))
+        paths = api.fetch_files(api.get_files('datacollection_1'), 'inputs')
+    """
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root):
+        """Open or create a store.
+
+        Parameters:
+
+            :root: Directory of the store, created if missing.
+
+        Returns:
+
+            - New `FileStore` object.
+
+        Raises:
+
+            - BdcApiException if `root` cannot be created.
+        """
+        self.root = root
+        self.objects = os.path.join(root, 'objects')
+        self.path = os.path.join(root, 'index.sqlite')
+        try:
+            os.makedirs(self.objects, exist_ok=True)
+        except OSError as e:
+            raise BdcApiException('Invalid directory "{0}". Details: {1}'.format(root, e))
+        create(self.path, 'CREATE TABLE IF NOT EXISTS files (datacollection TEXT, '
+                          'path TEXT, size INTEGER, sha256 TEXT, added REAL, '
+                          'PRIMARY KEY (datacollection, path))')
+
+    def add(self, datacollection, path, source):
+        """Store the file at `source` as `path` of `datacollection`. `source` is
+        hard-linked into the store when possible, and copied otherwise.
+
+        Returns:
+
+            - Path of the stored object.
+
+        Raises:
+
+            - BdcApiException on OS errors.
+        """
+        try:
+            size = os.path.getsize(source)
+            digest = self._checksum(source)
+            target = self._object_path(digest)
+            if os.path.exists(target) and os.path.getsize(target) != size:
+                os.remove(target)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _link_or_copy(source, target)
+        except OSError as e:
+            raise BdcApiException('Error occurred while storing {0}. Details: {1}'.format(
+                source, e))
+        with connect(self.path) as connection:
+            connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                               (datacollection, path, size, digest, time.time()))
+        return target
+
+    def get(self, datacollection, path, verify=False):
+        """Return the path of the stored object of `path` of `datacollection`, or
+        None if it is missing or invalid: of the wrong size or, if `verify` is
+        set, of the wrong checksum."""
+        with connect(self.path) as connection:
+            row = connection.execute('SELECT size, sha256 FROM files WHERE datacollection = ? '
+                                     'AND path = ?', (datacollection, path)).fetchone()
+        return self._valid_object(row, verify) if row else None
+
+    def missing(self, files, verify=False):
+        """Select the files which are not stored, or not valid, see `get`.
+
+        Parameters:
+
+            :files: Dictionary of datacollection names, whose values are lists of
+                    file paths, as returned by `BdcApi.get_files`.
+            :verify: Whether to verify the checksum of stored files (default False).
+
+        Returns:
+
+            - Dictionary of the same form, holding only the missing files. Only
+              datacollections with missing files are included.
+
+        Raises:
+
+            - None.
+        """
+        missing = {}
+        with connect(self.path) as connection:
+            for datacollection, paths in files.items():
+                rows = self._rows(connection, datacollection)
+                absent = [path for path in paths
+                          if path not in rows or not self._valid_object(rows[path], verify)]
+                if absent:
+                    missing[datacollection] = absent
+        return missing
+
+    def materialize(self, files, target):
+        """Link stored files under `target`, as `target/<datacollection>/<path>`.
+        Hard links share their content with the store, so they must not be
+        modified in place.
+
+        Parameters:
+
+            :files: Dictionary of datacollection names, whose values are lists of
+                    file paths.
+            :target: Directory to link the files into.
+
+        Returns:
+
+            - Dictionary of datacollection names, whose values are dictionaries of
+              the file paths to their local paths.
+
+        Raises:
+
+            - BdcApiException if a file is not stored, or on OS errors.
+        """
+        result = {}
+        for datacollection, paths in files.items():
+            local = result.setdefault(datacollection, {})
+            with connect(self.path) as connection:
+                rows = self._rows(connection, datacollection)
+            for path in paths:
+                source = self._valid_object(rows[path], False) if path in rows else None
+                if source is None:
+                    raise BdcApiException('File "{0}" of {1} is not stored.'.format(
+                        path, datacollection))
+                local_path = os.path.join(target, datacollection,
+                                          *[part for part in path.split('/')
+                                            if part not in ('', '.', '..')])
+                try:
+                    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                    if os.path.exists(local_path):
+                        os.remove(local_path)
+                    _link_or_copy(source, local_path)
+                except OSError as e:
+                    raise BdcApiException('Error occurred while saving file to {0}. '
+                                          'Details: {1}'.format(local_path, e))
+                local[path] = local_path
+        return result
+
+    def discard(self, datacollection, path):
+        """Forget `path` of `datacollection`. Its object is kept for other paths
+        with the same content."""
+        with connect(self.path) as connection:
+            connection.execute('DELETE FROM files WHERE datacollection = ? AND path = ?',
+                               (datacollection, path))
+
+    def __len__(self):
+        with connect(self.path) as connection:
+            return connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def _rows(self, connection, datacollection):
+        """Return the size and checksum of the files of `datacollection`, by path."""
+        return {path: (size, digest) for path, size, digest in connection.execute(
+            'SELECT path, size, sha256 FROM files WHERE datacollection = ?', (datacollection,))}
+
+    def _valid_object(self, row, verify):
+        size, digest = row
+        target = self._object_path(digest)
+        try:
+            if os.path.getsize(target) != size:
+                return None
+        except OSError:
+            return None
+        if verify and self._checksum(target) != digest:
+            return None
+        return target
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects, digest[:2], digest)
+
+    def _checksum(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+def _link_or_copy(source, target):
+    """Hard-link `source` to `target`, copying it when links are not supported."""
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        temporary = '{0}.{1}.tmp'.format(target, uuid.uuid4().hex)
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, target)
@@ -0,0 +1,155 @@
+import json
+
+from .bdc_api import BdcApiException, json_loads
+
+CATALOG_COLUMNS = ('datacollection', 'catalog')
+
+def parse_catalogs(archive, members, fields=None):
+    """Parse JSON catalogs from a saved query result into columns. Runs in the
+    worker processes of `BdcApi.load_catalogs`.
+
+    Each record of a catalog, i.e. the catalog itself or each item of a catalog
+    which is a list, becomes one row holding the `datacollection` and
+    `catalog` path it came from. Nested objects are flattened into dotted
+    column names, lists are kept as JSON strings, and record fields named like
+    `CATALOG_COLUMNS` are renamed `record.<name>`.
+
+    Parameters:
+
+        :archive: Path of the zip archive, see `open_query_result`.
+        :members: List of (member name, datacollection, catalog path) tuples.
+        :fields: Optional list of the columns to keep, besides `CATALOG_COLUMNS`.
+
+    Returns:
+
+        - Tuple of the number of rows and a dictionary of the columns, as lists
+          of the same length.
+
+    Raises:
+
+        - BdcApiException if the archive cannot be read or a member is not JSON.
+    """
+    from .archive import open_query_result
+    wanted = set(fields) if fields is not None else None
+    columns = {name: [] for name in CATALOG_COLUMNS}
+    rows = 0
+    with open_query_result(archive) as result:
+        for member, datacollection, path in members:
+            try:
+                document = json_loads(result.read(member))
+            except ValueError as e:
+                raise BdcApiException('Catalog "{0}" of {1} is not valid JSON. Details: '
+                                      '{2}'.format(path, datacollection, e))
+            for record in document if isinstance(document, list) else [document]:
+                row = _flatten(record, reserved=CATALOG_COLUMNS) if isinstance(record, dict) \
+                    else {'value': record}
+                for name, value in row.items():
+                    if wanted is not None and name not in wanted:
+                        continue
+                    column = columns.get(name)
+                    if column is None:
+                        column = columns[name] = [None] * rows
+                    column.append(value)
+                columns['datacollection'].append(datacollection)
+                columns['catalog'].append(path)
+                rows += 1
+                for column in columns.values():
+                    if len(column) < rows:
+                        column.append(None)
+    return rows, columns
+
+def catalog_table(parts, fields=None, output='arrow'):
+    """Assemble the results of `parse_catalogs` into one table, with a schema
+    which only depends on the data: `CATALOG_COLUMNS` followed by the fields
+    in sorted order, or in the order of `fields` if given. Columns holding only
+    booleans, integers, numbers or strings get the matching type, and any
+    other mix is converted to JSON strings.
+
+    Parameters:
+
+        :parts: List of (rows, columns) tuples returned by `parse_catalogs`.
+        :fields: Optional list of the columns to include, besides `CATALOG_COLUMNS`.
+        :output: 'arrow' for a `pyarrow.Table` (default) or 'pandas' for a
+                 `pandas.DataFrame`.
+
+    Returns:
+
+        - `pyarrow.Table` or `pandas.DataFrame`.
+
+    Raises:
+
+        - BdcApiException on an unknown `output`.
+    """
+    pyarrow = check_output(output)
+    if fields is None:
+        fields = sorted(set(name for _, columns in parts for name in columns) -
+                        set(CATALOG_COLUMNS))
+    arrays = []
+    for name in CATALOG_COLUMNS + tuple(fields):
+        values = []
+        for rows, columns in parts:
+            values.extend(columns.get(name) or [None] * rows)
+        arrays.append(_array(pyarrow, values))
+    table = pyarrow.Table.from_arrays(arrays, names=list(CATALOG_COLUMNS) + list(fields))
+    return table.to_pandas() if output == 'pandas' else table
+
+def check_output(output):
+    """Check that tables can be produced as `output`, returning `pyarrow`."""
+    if output not in ('arrow', 'pandas'):
+        raise BdcApiException('Unknown output "{0}", use "arrow" or "pandas".'.format(output))
+    return _pyarrow()
+
+def json_table(document):
+    """Convert a JSON document into a `pyarrow.Table` of one row per record (the
+    document itself, or each item of a document which is a list), flattened and
+    typed as described in `parse_catalogs` and `catalog_table`, with the
+    columns in sorted order."""
+    pyarrow = _pyarrow()
+    records = document if isinstance(document, list) else [document]
+    rows = [_flatten(record) if isinstance(record, dict) else {'value': record}
+            for record in records]
+    names = sorted(set(name for row in rows for name in row))
+    return pyarrow.Table.from_arrays([_array(pyarrow, [row.get(name) for row in rows])
+                                      for name in names], names=names)
+
+def _flatten(document, prefix='', row=None, reserved=()):
+    """Flatten nested objects of `document` into a row with dotted column names,
+    renaming top-level `reserved` names to `record.<name>`."""
+    row = {} if row is None else row
+    for key, value in document.items():
+        name = prefix + str(key)
+        if not prefix and name in reserved:
+            name = 'record.' + name
+        if isinstance(value, dict) and value:
+            _flatten(value, name + '.', row)
+        elif isinstance(value, (dict, list)):
+            row[name] = json.dumps(value)
+        else:
+            row[name] = value
+    return row
+
+def _array(pyarrow, values):
+    """Convert `values` into an Arrow array of the type they all share, or of JSON
+    strings."""
+    kinds = set(type(value) for value in values if value is not None)
+    if kinds <= {str}:
+        return pyarrow.array(values, pyarrow.string())
+    if kinds <= {bool}:
+        return pyarrow.array(values, pyarrow.bool_())
+    try:
+        if kinds <= {int}:
+            return pyarrow.array(values, pyarrow.int64())
+        if kinds <= {int, float}:
+            return pyarrow.array(values, pyarrow.float64())
+    except (OverflowError, pyarrow.ArrowInvalid):
+        pass
+    return pyarrow.array([value if value is None or isinstance(value, str) else
+                          json.dumps(value) for value in values], pyarrow.string())
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('Columnar tables require pyarrow, install it with '
+                          '`pip install bdc_api[arrow]`.')
+    return pyarrow
@@ -0,0 +1,79 @@
+"""Measure the cold start of `import bdc_api` in fresh interpreters, the heavy
+modules it pulls in, and the per-call cost of query ID validation, compared with
+`bson.ObjectId` when it is installed.
+
+Usage:
+
+    python benchmarks/bench_import.py --runs 20 --calls 1000000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from bdc_api import bdc_api
+
+HEAVY_MODULES = ['requests', 'urllib3', 'bson', 'six', 'asyncio', 'aiohttp', 'sqlite3']
+
+def cold_start(statement, runs):
+    """Median and minimum wall time in ms of running `statement` in a new interpreter."""
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', statement], cwd=ROOT)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings), min(timings)
+
+def loaded_modules(statement):
+    """Heavy modules present in `sys.modules` after running `statement`."""
+    output = subprocess.check_output([sys.executable, '-c', '{0}; import sys; print(" ".join('
+                                      'm for m in {1!r} if m in sys.modules))'.format(
+                                          statement, HEAVY_MODULES)], cwd=ROOT)
+    return output.decode('utf-8').split() or ['none']
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--calls', type=int, default=1000000)
+    args = parser.parse_args()
+
+    interpreter = cold_start('pass', args.runs)
+    print('{0:<28} {1:>10} {2:>10}   {3}'.format('cold start', 'median ms', 'min ms',
+                                                 'heavy modules loaded'))
+    api = 'import bdc_api; api = bdc_api.BdcApi("user", "key", "https://host")'
+    for label, statement in [('import bdc_api', 'import bdc_api'),
+                             ('+ BdcApi()', api),
+                             ('+ first session', api + '; api.session')]:
+        median, minimum = cold_start(statement, args.runs)
+        print('{0:<28} {1:>10.1f} {2:>10.1f}   {3}'.format(
+            label, median - interpreter[0], minimum - interpreter[1],
+            ' '.join(loaded_modules(statement))))
+
+    validators = [('_valid_id', bdc_api._valid_id)]
+    try:
+        from bson import ObjectId
+        from bson.errors import InvalidId
+    except ImportError:
+        print('bson is not installed, only the new validator is measured.')
+    else:
+        def bson_valid_id(to_validate):
+            try:
+                ObjectId(to_validate)
+                return True
+            except InvalidId:
+                return False
+        validators.append(('bson.ObjectId', bson_valid_id))
+    print('\n{0:<16} {1:>12} {2:>12}'.format('validation', 'valid ns', 'invalid ns'))
+    for name, validator in validators:
+        timings = [timeit.timeit(lambda: validator(query_id), number=args.calls) / args.calls
+                   for query_id in ('5d9e26ada81660b57e387f49', '5d9e26ada81660b57e387f4z')]
+        print('{0:<16} {1:>12.0f} {2:>12.0f}'.format(name, timings[0] * 1e9, timings[1] * 1e9))
+
+if __name__ == '__main__':
+    main()
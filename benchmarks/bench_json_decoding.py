@@ -0,0 +1,62 @@
+"""Measure the decoding of large file listings, comparing the former scan-then-parse
+handling of response bodies with single-pass decoding by each JSON backend.
+
+Usage:
+
+    python benchmarks/bench_json_decoding.py --files 10000 100000 1000000 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bdc_api import bdc_api
+
+def listing(files, per_datacollection=1000):
+    """Body of a files listing response with `files` file names."""
+    document = {}
+    for i in range(files):
+        document.setdefault('datacollection_{0:06d}'.format(i // per_datacollection), []).append(
+            '/data/run_{0:06d}/detector_{1:02d}/events_{2:08d}.h5'.format(
+                i // per_datacollection, i % 16, i))
+    return json.dumps(document).encode('utf-8')
+
+def scan_then_parse(content):
+    # Former handling: the body is scanned for error messages by _send_get,
+    # then parsed by the caller.
+    if b'error_message' in content or b'errormessage' in content:
+        raise ValueError('unexpected error message')
+    return json.loads(content)
+
+def best_of(function, content, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(content)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    decoders = [('scan + json', scan_then_parse), ('json', json.loads)]
+    if bdc_api.orjson is not None:
+        decoders.append(('orjson', bdc_api.orjson.loads))
+    else:
+        print('orjson is not installed, only the standard library backend is measured.')
+    print('{0:>10} {1:>10} '.format('files', 'MB') +
+          ' '.join('{0:>14}'.format(name + ' ms') for name, _ in decoders))
+    for files in args.files:
+        content = listing(files)
+        timings = [best_of(function, content, args.repeat) for _, function in decoders]
+        print('{0:>10} {1:>10.1f} '.format(files, len(content) / 1e6) +
+              ' '.join('{0:>14.1f}'.format(timing * 1000) for timing in timings))
+
+if __name__ == '__main__':
+    main()
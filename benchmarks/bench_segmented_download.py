@@ -0,0 +1,45 @@
+"""Compare single-stream and segmented `save_file` downloads against a local
+stand-in server whose responses are throttled per connection, the way a single
+TCP stream over a long-distance link is.
+
+Usage:
+
+    python benchmarks/bench_segmented_download.py --size-mb 64 --stream-rate-mb 16 --segments 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bdc_api import BdcApi
+from bdc_api.standin import StandinServer
+
+MB = 1024 * 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=64, help='archive size in MB')
+    parser.add_argument('--stream-rate-mb', type=float, default=16,
+                        help='per-connection throughput limit in MB/s, 0 for none')
+    parser.add_argument('--segments', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with StandinServer(archive_size=args.size_mb * MB,
+                       stream_rate=int(args.stream_rate_mb * MB)) as server:
+        api = BdcApi('bench_user', 'bench_key', server.url)
+        print('{0:>9} {1:>10} {2:>10}'.format('segments', 'best s', 'MB/s'))
+        for segments in args.segments:
+            best = None
+            for _ in range(args.repeat):
+                with tempfile.TemporaryDirectory() as directory:
+                    result = api.save_file(server.QUERY_ID, local_path=directory,
+                                           segments=segments)
+                best = result['seconds'] if best is None else min(best, result['seconds'])
+            print('{0:>9} {1:>10.3f} {2:>10.1f}'.format(
+                segments, best, server.archive_size / best / MB))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Run the client benchmark suite against a local stand-in MINOS REST server:
+metadata call throughput, query polling overhead, download throughput and
+listing decoding, each in a fresh process so that its peak RSS is reported.
+
+Usage:
+
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --only download --size-mb 256 --latency-ms 20
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bdc_api import BdcApi
+from bdc_api.standin import StandinServer
+
+MB = 1024 * 1024
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, in kilobytes elsewhere.
+    return peak / MB if sys.platform == 'darwin' else peak / 1024.0
+
+def bench_metadata(url, args):
+    api = BdcApi('bench_user', 'bench_key', url, pool_maxsize=args.threads)
+    names = api.get_datacollections(limit=10)
+    calls = [api.get_task_numbers, api.get_domains, lambda: api.get_datacollections(limit=10),
+             lambda: api.get_files(names)]
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(lambda i: calls[i % len(calls)](), range(args.calls)))
+    elapsed = time.time() - started
+    return [('calls/s', args.calls / elapsed)]
+
+def bench_polling(url, args):
+    api = BdcApi('bench_user', 'bench_key', url, pool_maxsize=args.threads)
+    api.POLL_MIN_INTERVAL = args.poll_interval
+    started = time.time()
+    futures = [api.start_datacollection_query('datacollection_00000', future=True)
+               for _ in range(args.queries)]
+    wait(futures)
+    elapsed = time.time() - started
+    checks = sum(future.checks for future in futures)
+    return [('checks/query', checks / float(args.queries)),
+            ('s over job', elapsed - args.job_duration)]
+
+def bench_download(url, args):
+    api = BdcApi('bench_user', 'bench_key', url)
+    results = []
+    for segments in args.segments:
+        with tempfile.TemporaryDirectory() as directory:
+            result = api.save_file(StandinServer.QUERY_ID, local_path=directory,
+                                   segments=segments)
+        results.append(('MB/s x{0}'.format(segments), result['throughput'] / MB))
+    return results
+
+def bench_listing(url, args):
+    api = BdcApi('bench_user', 'bench_key', url)
+    started = time.time()
+    files = sum(1 for _ in api.iter_files())
+    elapsed = time.time() - started
+    return [('files/s', files / elapsed)]
+
+BENCHMARKS = {'metadata': bench_metadata, 'polling': bench_polling,
+              'download': bench_download, 'listing': bench_listing}
+
+def run(name, url, args):
+    """Run one benchmark, returning its results and the peak RSS of the process."""
+    return BENCHMARKS[name](url, args) + [('peak RSS MB', peak_rss_mb())]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), default=None)
+    parser.add_argument('--latency-ms', type=float, default=1,
+                        help='server-side latency of each request in ms')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--job-duration', type=float, default=5,
+                        help='seconds until each query completes')
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--size-mb', type=int, default=64, help='archive size in MB')
+    parser.add_argument('--stream-rate-mb', type=float, default=0,
+                        help='per-connection throughput limit in MB/s, 0 for none')
+    parser.add_argument('--segments', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--datacollections', type=int, default=1000)
+    parser.add_argument('--files', type=int, default=200,
+                        help='files per datacollection')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    with StandinServer(archive_size=args.size_mb * MB, latency=args.latency_ms / 1000.0,
+                       stream_rate=int(args.stream_rate_mb * MB),
+                       job_duration=args.job_duration, datacollections=args.datacollections,
+                       files_per_datacollection=args.files) as server:
+        for name in args.only or sorted(BENCHMARKS):
+            with context.Pool(1) as pool:
+                results = pool.apply(run, (name, server.url, args))
+            print('{0:<10} '.format(name) + '  '.join(
+                '{0}: {1:.1f}'.format(label, value) for label, value in results))
+
+if __name__ == '__main__':
+    main()
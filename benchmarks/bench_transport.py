@@ -0,0 +1,42 @@
+"""Measure metadata call throughput from many threads sharing one `BdcApi`,
+comparing connection pool sizes, against a local stand-in server.
+
+Usage:
+
+    python benchmarks/bench_transport.py --threads 32 --calls 2000 --pool-sizes 1 10 32
+"""
+import argparse
+import os
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bdc_api import BdcApi
+from bdc_api.standin import StandinServer
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[1, 10, 32])
+    parser.add_argument('--latency-ms', type=float, default=1,
+                        help='server-side latency of each request in ms')
+    args = parser.parse_args()
+
+    with StandinServer(latency=args.latency_ms / 1000.0) as server:
+        print('{0:>10} {1:>10} {2:>12}'.format('pool size', 'calls/s', 'connections'))
+        for pool_maxsize in args.pool_sizes:
+            api = BdcApi('bench_user', 'bench_key', server.url, pool_maxsize=pool_maxsize)
+            connections = server.connections
+            started = time.time()
+            with ThreadPoolExecutor(max_workers=args.threads) as executor:
+                list(executor.map(lambda _: api.get_task_numbers(), range(args.calls)))
+            elapsed = time.time() - started
+            print('{0:>10} {1:>10.0f} {2:>12}'.format(
+                pool_maxsize, args.calls / elapsed, server.connections - connections))
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,8 @@ setuptools.setup(
         name="bdc_api",
         version="v1.1",
         data_files = [("", ["LICENSE.txt"])],
-        install_requires=['requests','six'],
+        install_requires=['requests'],
+        extras_require={'async': ['aiohttp'], 'fast': ['orjson'], 'arrow': ['pyarrow', 'pandas']},
         author="Hamdy Elgammal",
         author_email="hhelgammal@lbl.gov",
         long_description=long_description,
@@ -16,6 +17,6 @@ setuptools.setup(
         packages=setuptools.find_packages(),
         license="BSD-3-Clause-LBNL",
         classifiers=[
-            "Programming Language :: Python :: 2",
+            "Programming Language :: Python :: 3",
             ],
         )
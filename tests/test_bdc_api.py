@@ -1,12 +1,113 @@
 from __future__ import absolute_import
 
 # import os
+import queue
 # import shutil
 from bdc_api import *
+from bdc_api.bdc_api import json_loads
+from bdc_api.cache import MetadataCache
+from bdc_api.catalog import CatalogIndex
+from bdc_api.store import FileStore
+from bdc_api.registry import QueryRegistry
+from bdc_api.scheduler import RequestScheduler
+from bdc_api.convert import ConversionPipeline
+from bdc_api.standin import StandinServer, _StandinHandler
 from unittest.mock import patch
 
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import time
 import unittest
+import zipfile
 import json
+import pickle
+import requests
+import subprocess
+import sys
+
+QUERY_ID = '5d9e26ada81660b57e387f49'
+
+
+def make_response(body, status_code=200, headers=None):
+    """Build a `requests.Response` whose body is read from `body`."""
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = body if hasattr(body, 'read') else io.BytesIO(body)
+    response.headers.update(headers or {})
+    return response
+
+
+class BrokenBody(io.BytesIO):
+    """Response body that drops the connection after `fail_after` bytes."""
+
+    def __init__(self, body, fail_after):
+        super().__init__(body)
+        self.fail_after = fail_after
+
+    def read(self, size=-1):
+        if self.tell() >= self.fail_after:
+            raise requests.exceptions.ConnectionError('connection reset')
+        return super().read(min(size, self.fail_after - self.tell()))
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream without `seek`, which makes zipfile write data descriptors."""
+
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+
+def make_zip(members, compression=zipfile.ZIP_DEFLATED, seekable=True):
+    """Build a zip archive of `members`, a dictionary of names to contents."""
+    stream = io.BytesIO() if seekable else Unseekable()
+    with zipfile.ZipFile(stream, 'w', compression=compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return (stream if seekable else stream.buffer).getvalue()
+
+
+class FakeDownloadSession(requests.Session):
+    """Session serving one archive from the download endpoint, honouring
+    `Range` requests unless `ranges` is False."""
+
+    def __init__(self, body, fail_after=None, ranges=True):
+        super().__init__()
+        self.body = body
+        self.fail_after = fail_after
+        self.ranges = ranges
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, stream=False, **kwargs):
+        headers = dict(headers or {})
+        self.requests.append(headers)
+        body, status_code = self.body, 200
+        response_headers = {'content-type': 'application/zip',
+                            'etag': '"v1"',
+                            'accept-ranges': 'bytes',
+                            'content-disposition': 'attachment; filename=download_{0}.zip'.format(
+                                QUERY_ID)}
+        if self.ranges and 'Range' in headers and headers.get('If-Range', '"v1"') == '"v1"':
+            start = int(headers['Range'][len('bytes='):].split('-')[0])
+            body, status_code = body[start:], 206
+            response_headers['content-range'] = 'bytes {0}-{1}/{2}'.format(
+                start, len(self.body) - 1, len(self.body))
+        response_headers['content-length'] = str(len(body))
+        if self.fail_after is not None:
+            body = BrokenBody(body, self.fail_after)
+            self.fail_after = None
+        return make_response(body, status_code=status_code, headers=response_headers)
+
 
 class TestBdcApiInterface(unittest.TestCase):
     
@@ -140,6 +241,28 @@ class TestBdcApiInterface(unittest.TestCase):
         files = self.api.get_files('test_coll_0')
         assert len(files['test_coll_0']) == 2
 
+    @patch('bdc_api.BdcApi._send_get')
+    def test_iter_files(self, mock_get):
+        """Ensure that iter_files yields pairs from a listing received in pieces."""
+        body = json.dumps(self.files).encode('utf-8')
+        mock_get.return_value.iter_content.return_value = [body[i:i + 7]
+                for i in range(0, len(body), 7)]
+        pairs = self.api.iter_files(['test_coll_0', 'test_coll_1'], extensions='txt')
+        assert next(pairs) == ('test_coll_0', '/file_0.txt')
+        assert mock_get.call_args[1]['stream']
+        assert mock_get.call_args[1]['parameters']['extensions'] == 'txt'
+        assert list(pairs) == [(name, path) for name, paths in self.files.items()
+                               for path in paths][1:]
+        assert mock_get.return_value.close.called
+
+    @patch('bdc_api.BdcApi._send_get')
+    def test_iter_files_fail(self, mock_get):
+        """Ensure that iter_files fails on errors and truncated listings."""
+        mock_get.return_value.iter_content.return_value = [b'{"error_message": "No access."}']
+        self.assertRaises(BdcApiException, list, self.api.iter_files())
+        mock_get.return_value.iter_content.return_value = [b'{"test_coll_0": ["/file_0.txt"']
+        self.assertRaises(BdcApiException, list, self.api.iter_files())
+
     @patch('bdc_api.BdcApi._send_post')
     def test_start_files_query_success(self, mock_post):
         """Ensure that start_files_query works as expected."""
@@ -214,5 +337,1162 @@ class TestBdcApiInterface(unittest.TestCase):
         self.assertRaises(BdcApiException, self.api.check_query_progress, 
                 query_id)
 
+    @patch('bdc_api.BdcApi.save_file')
+    @patch('bdc_api.BdcApi.check_query_progress')
+    @patch('bdc_api.BdcApi.start_datacollection_query')
+    def test_download_datacollections(self, mock_start, mock_progress, mock_save):
+        """Ensure that download_datacollections reports each datacollection separately."""
+        query_ids = {'test_coll_{0}'.format(i): '5d9e26ada81660b57e387f4{0}'.format(i)
+                     for i in range(4)}
+        polls = {}
+        def start(name):
+            if name == 'test_coll_3':
+                raise BdcApiException('No access.')
+            return query_ids[name]
+        def progress(query_id):
+            polls[query_id] = polls.get(query_id, 0) + 1
+            if query_id == query_ids['test_coll_2']:
+                return BdcApi.QueryInfo(progress='0%', status='cancelled')
+            if polls[query_id] < 2:
+                return BdcApi.QueryInfo(progress='50%', status='processing')
+            return BdcApi.QueryInfo(progress=BdcApi.COMPLETE_QUERY, status='success')
+        mock_start.side_effect = start
+        mock_progress.side_effect = progress
+        mock_save.side_effect = lambda query_id, **kwargs: {'message': query_id}
+        self.api.POLL_MIN_INTERVAL = 0
+        results = self.api.download_datacollections(list(query_ids), '.',
+                max_workers=3, poll_interval=0)
+        assert list(results) == list(query_ids)
+        for name in ['test_coll_0', 'test_coll_1']:
+            assert results[name].query_id == query_ids[name]
+            assert results[name].result == {'message': query_ids[name]}
+            assert results[name].error is None
+            assert polls[query_ids[name]] == 2
+        assert isinstance(results['test_coll_2'].error, BdcApiException)
+        assert results['test_coll_3'].query_id is None
+        assert isinstance(results['test_coll_3'].error, BdcApiException)
+        assert mock_save.call_count == 2
+
+    @patch('bdc_api.BdcApi.save_file')
+    @patch('bdc_api.BdcApi.check_query_progress')
+    @patch('bdc_api.BdcApi._send_post')
+    def test_start_files_query_group(self, mock_post, mock_progress, mock_save):
+        """Ensure that large file lists are split into size-bounded queries."""
+        files = ['/data/file_{0:03d}.txt'.format(i) for i in range(100)]
+        chunks = []
+        def post(url, post_data, headers):
+            chunks.append(post_data['filepaths'])
+            response = unittest.mock.Mock()
+            response.content = json.dumps({'query_id': '5d9e26ada81660b57e387{0:03d}'.format(
+                    len(chunks))})
+            return response
+        mock_post.side_effect = post
+        mock_progress.return_value = BdcApi.QueryInfo(progress='100%', status='success')
+        mock_save.side_effect = lambda query_id, **kwargs: {'message': query_id}
+        self.api.POLL_MIN_INTERVAL = 0
+        group = self.api.start_files_query_group(files, max_bytes=200, max_workers=4)
+        assert len(group) == len(chunks) == 10
+        assert all(len(chunk) <= 200 for chunk in chunks)
+        assert sorted(','.join(chunks).split(',')) == files
+        assert [name for chunk in group.chunks for name in chunk] == files
+        results = group.save_files('.')
+        assert list(results) == group.query_ids
+        assert all(result.result == {'message': query_id}
+                   for query_id, result in results.items())
+
+    @patch('bdc_api.BdcApi.start_files_query')
+    def test_start_files_query_group_partial(self, mock_start):
+        """Ensure that queries started before a failure are not lost."""
+        files = ['/data/file_{0:03d}.txt'.format(i) for i in range(100)]
+        def start(chunk):
+            if chunk[0] == '/data/file_020.txt':
+                raise BdcApiException('Error sending request to host server: 503')
+            return '5d9e26ada81660b57e387{0}'.format(chunk[0][-7:-4])
+        mock_start.side_effect = start
+        with self.assertRaises(BdcApiException) as raised:
+            self.api.start_files_query_group(files, max_bytes=200, max_workers=4)
+        group = raised.exception.group
+        assert mock_start.call_count == 10 and len(group) == 9
+        assert '/data/file_020.txt' not in [name for chunk in group.chunks for name in chunk]
+        assert group.query_ids[:2] == ['5d9e26ada81660b57e387000', '5d9e26ada81660b57e387010']
+
+    @patch('bdc_api.BdcApi.check_query_progress')
+    @patch('bdc_api.BdcApi._send_post')
+    def test_start_datacollection_query_future(self, mock_post, mock_progress):
+        """Ensure that query futures resolve once the query is over."""
+        self.api.POLL_MIN_INTERVAL = 0.01
+        self.api.POLL_MAX_INTERVAL = 0.05
+        progress = {}
+        def check(query_id):
+            progress[query_id] = progress.get(query_id, 0) + 1
+            if query_id.endswith('0'):
+                return BdcApi.QueryInfo(progress='0%', status='failed')
+            if progress[query_id] < 3:
+                return BdcApi.QueryInfo(progress='50%', status='processing')
+            return BdcApi.QueryInfo(progress='100%', status='success')
+        mock_progress.side_effect = check
+        futures = []
+        for i in range(5):
+            mock_post.return_value.content = json.dumps(
+                    {'query_id': '5d9e26ada81660b57e387f4{0}'.format(i)})
+            futures.append(self.api.start_datacollection_query('coll_1', future=True))
+        done = [future.query_id for future in as_completed(futures, timeout=5)]
+        assert sorted(done) == sorted(future.query_id for future in futures)
+        self.assertRaises(BdcApiException, futures[0].result)
+        for future in futures[1:]:
+            assert future.result().progress == BdcApi.COMPLETE_QUERY
+            assert future.checks == 3
+        assert len(self.api._poller) == 0
+
+    @patch('bdc_api.BdcApi.check_query_progress')
+    def test_watch_query_cancel(self, mock_progress):
+        """Ensure that cancelled query futures are no longer checked."""
+        self.api.POLL_MIN_INTERVAL = 0.01
+        mock_progress.return_value = BdcApi.QueryInfo(progress='0%', status='processing')
+        future = self.api.watch_query('5d9e26ada81660b57e387f49')
+        callbacks = []
+        future.add_done_callback(callbacks.append)
+        assert future.cancel()
+        done, _ = wait([future], timeout=5)
+        assert done == {future} and callbacks == [future]
+        self.assertRaises(BdcApiException, self.api.watch_query, 'not_an_ID')
+
+    @patch('bdc_api.BdcApi.check_query_progress')
+    @patch('bdc_api.BdcApi._send_post')
+    def test_future_callbacks(self, mock_post, mock_progress):
+        """Ensure that done callbacks can start further queries and close the API."""
+        self.api.POLL_MIN_INTERVAL = 0.01
+        mock_progress.return_value = BdcApi.QueryInfo(progress='100%', status='success')
+        mock_post.return_value.content = json.dumps({'query_id': '5d9e26ada81660b57e387f40'})
+        chained = queue.Queue()
+        first = self.api.watch_query(QUERY_ID)
+        first.add_done_callback(lambda future: chained.put(
+            self.api.start_datacollection_query('coll_1', future=True)))
+        second = chained.get(timeout=5)
+        assert second.result(timeout=5).progress == BdcApi.COMPLETE_QUERY
+        closed = threading.Event()
+        mock_progress.side_effect = lambda query_id: BdcApi.QueryInfo(
+            progress='0%' if query_id.endswith('1') else '100%', status='processing')
+        pending = self.api.watch_query('5d9e26ada81660b57e387f41')
+        third = self.api.watch_query('5d9e26ada81660b57e387f42')
+        third.add_done_callback(lambda future: (self.api.close(), closed.set()))
+        assert closed.wait(5)
+        wait([pending], timeout=5)
+        assert pending.cancelled()
+
+    @patch('bdc_api.BdcApi.check_query_progress')
+    def test_close(self, mock_progress):
+        """Ensure that the poller thread stops when idle and on close."""
+        self.api.POLL_MIN_INTERVAL = 0.01
+        mock_progress.return_value = BdcApi.QueryInfo(progress='100%', status='success')
+        self.api.watch_query(QUERY_ID).result(timeout=5)
+        deadline = time.monotonic() + 5
+        while self.api._poller._thread is not None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert self.api._poller._thread is None
+        mock_progress.return_value = BdcApi.QueryInfo(progress='0%', status='processing')
+        with self.api:
+            future = self.api.watch_query(QUERY_ID)
+            thread = self.api._poller._thread
+            assert thread.is_alive()
+        assert future.cancelled() and not thread.is_alive()
+        assert self.api._poller is None
+
+    def test_valid_id(self):
+        """Ensure that ObjectIds are validated without bson."""
+        for query_id in ['', None, QUERY_ID, QUERY_ID.upper(), b'0123456789ab']:
+            assert self.api._valid_id(query_id)
+        for query_id in [QUERY_ID[:-1], QUERY_ID + '0', QUERY_ID[:-1] + 'g',
+                         QUERY_ID + '\n', b'0123456789a', 12]:
+            assert not self.api._valid_id(query_id)
+
+    def test_lazy_imports(self):
+        """Ensure that requests is only imported with the first session."""
+        code = ('import sys, bdc_api; api = bdc_api.BdcApi("u", "k", "h"); '
+                'print("requests" in sys.modules); api.session; print("requests" in sys.modules)')
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), '..'))
+        assert output.split() == [b'False', b'True']
+
+
+class TestBdcApiTransport(unittest.TestCase):
+
+    def test_retry_transient_errors(self):
+        """Ensure that GET requests are retried on transient server errors."""
+        with StandinServer(failures=2) as server:
+            api = BdcApi('test_user', 'somekey', server.url, backoff_factor=0)
+            assert 'Task 1-ARES' in api.get_task_numbers()
+            assert len(server.requests) == 3
+            api = BdcApi('test_user', 'somekey', server.url, max_retries=0)
+            server.failures = 1
+            self.assertRaises(BdcApiException, api.get_task_numbers)
+
+    def test_connection_pool(self):
+        """Ensure that concurrent requests reuse pooled connections."""
+        with StandinServer() as server:
+            api = BdcApi('test_user', 'somekey', server.url, pool_maxsize=8)
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(lambda _: api.get_task_numbers(), range(200)))
+            assert len(results) == 200
+            assert server.connections <= 8
+            api = BdcApi('test_user', 'somekey', server.url, keep_alive=False)
+            api.get_task_numbers()
+            assert server.requests[-1][2]['Connection'] == 'close'
+
+    def test_shared_across_threads(self):
+        """Ensure that one instance can serve metadata requests and downloads
+        from many threads without their headers or sessions leaking."""
+        defaults = BdcApi._send_get.__defaults__
+        with StandinServer(archive_size=256 * 1024) as server, \
+                tempfile.TemporaryDirectory() as tmp:
+            api = BdcApi('test_user', 'somekey', server.url, pool_maxsize=4)
+
+            def work(i):
+                if i % 4:
+                    return 'Task 1-ARES' in api.get_task_numbers()
+                path = os.path.join(tmp, str(i))
+                os.mkdir(path)
+                result = api.save_file(server.QUERY_ID, local_path=path)
+                return result['bytes'] == server.archive_size
+
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                assert all(executor.map(work, range(64)))
+            barrier = threading.Barrier(4)
+
+            def session(_):
+                barrier.wait()
+                return api.session
+
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                sessions = list(executor.map(session, range(4)))
+            assert len(set(map(id, sessions))) == 4
+            assert len(set(id(s.get_adapter(server.url)) for s in sessions)) == 1
+        assert BdcApi._send_get.__defaults__ == defaults
+        for method, path, headers in server.requests:
+            assert headers['Authorization'] == api.auth_header
+            if 'tasks_info' in path:
+                assert 'Accept' not in headers or 'zip' not in headers['Accept']
+
+    def test_decode_once(self):
+        """Ensure that responses are decoded once, and that only error documents are
+        treated as errors."""
+        api = BdcApi('test_user', 'somekey', 'localhost')
+        api.session = requests.Session()
+        listing = {'test_coll_0': ['/error_message.txt']}
+        responses = [
+            make_response(json.dumps(listing).encode('utf-8'),
+                          headers={'content-type': 'application/json'}),
+            make_response(b'{"error_message": "No access."}',
+                          headers={'content-type': 'application/json'}),
+            make_response(b'PK error_message', headers={'content-type': 'application/zip'})]
+        with patch.object(api.session, 'get', side_effect=responses), \
+                patch('bdc_api.bdc_api.json_loads', wraps=json.loads) as loads:
+            assert api.get_files('test_coll_0') == listing
+            assert loads.call_count == 1
+            with self.assertRaises(BdcApiException) as raised:
+                api.get_files('test_coll_0')
+            assert str(raised.exception) == 'Error occurred while making request: No access.'
+            assert api._send_get('download').content == b'PK error_message'
+            assert loads.call_count == 2
+
+    def test_decode_fallback(self):
+        """Ensure that documents orjson rejects are still decoded, and that bodies
+        which are not JSON raise BdcApiException."""
+        assert json_loads(b'[NaN, 123456789012345678901234567890]')[1] == \
+            123456789012345678901234567890
+        api = BdcApi('test_user', 'somekey', 'localhost')
+        api.session = requests.Session()
+        responses = [make_response(b'{"value": Infinity}'), make_response(b'<html>')]
+        with patch.object(api.session, 'get', side_effect=responses):
+            assert api.get_task_numbers() == {'value': float('inf')}
+            self.assertRaises(BdcApiException, api.get_task_numbers)
+
+    def test_pickle(self):
+        """Ensure that a pickled instance keeps its configuration and opens its own
+        connections."""
+        with StandinServer() as server:
+            api = BdcApi('test_user', 'somekey', server.url, cache=True, pool_maxsize=4)
+            infos = []
+            api.register_hook('post_request', lambda info: infos.append(info))
+            assert 'Task 1-ARES' in api.get_task_numbers()
+            copy = pickle.loads(pickle.dumps(api))
+            assert copy.hooks == {'pre_request': [], 'post_request': []}
+            assert len(api.hooks['post_request']) == 1
+            assert copy.auth_header == api.auth_header
+            assert copy.transport_options == api.transport_options
+            assert len(copy.cache) == 1
+            assert copy.session is not api.session
+            copy.cache.invalidate()
+            assert 'Task 1-ARES' in copy.get_task_numbers()
+            assert server.connections == 2
+            assert len(infos) == 1
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+    def test_fork(self):
+        """Ensure that forked processes do not reuse the connections of their parent."""
+        with StandinServer() as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            api.get_task_numbers()
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    os.write(write_fd, b'1' if 'Task 1-ARES' in api.get_task_numbers() else b'0')
+                finally:
+                    os._exit(0)
+            os.close(write_fd)
+            os.waitpid(pid, 0)
+            with os.fdopen(read_fd, 'rb') as pipe:
+                assert pipe.read() == b'1'
+            assert 'Task 1-ARES' in api.get_task_numbers()
+            assert server.connections == 2
+
+class TestStandinServer(unittest.TestCase):
+
+    def test_metadata(self):
+        """Ensure that every metadata call works over HTTP."""
+        with StandinServer(datacollections=20, files_per_datacollection=6) as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            task_numbers = api.get_task_numbers()
+            assert api.get_domains(task_numbers[server.TASK]['ID']) == {
+                server.TASK: ['domain_0', 'domain_1']}
+            assert len(api.get_datacollections()) == 20
+            dcols = api.get_datacollections(domains='domain_1', time_limits=[0, 9], limit=3)
+            assert dcols == ['datacollection_00001', 'datacollection_00003',
+                             'datacollection_00005']
+            files = api.get_files(dcols[:2], extensions='json')
+            assert files == {name: server.files(name)[1::3] for name in dcols[:2]}
+            assert list(api.iter_files(dcols[0])) == [(dcols[0], path)
+                                                      for path in server.files(dcols[0])]
+
+    def test_query_and_download(self):
+        """Ensure that queries progress and their results are downloaded over HTTP."""
+        with StandinServer(job_duration=0.3, archive_size=100000) as server, \
+                tempfile.TemporaryDirectory() as directory:
+            api = BdcApi('test_user', 'somekey', server.url)
+            api.POLL_MIN_INTERVAL = 0.05
+            query_id = api.start_files_query(['/datacollection_00000/file_00000.h5'])
+            assert api.check_query_progress(query_id).status == 'running'
+            self.assertRaises(BdcApiException, api.save_file, query_id, local_path=directory)
+            info = api.watch_query(query_id, poll_interval=0.05).result(timeout=5)
+            assert info.progress == BdcApi.COMPLETE_QUERY
+            result = api.save_file(query_id, local_path=directory, segments=2)
+            with open(result['path'], 'rb') as f:
+                assert f.read() == server.archive()
+
+    def test_sharded_datacollections(self):
+        """Ensure that time windows are requested concurrently and merged in order."""
+        with StandinServer(datacollections=50) as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            expected = api.get_datacollections(domains='domain_0', time_limits=[5, 44])
+            windows = []
+            names = api.get_datacollections(domains='domain_0', time_limits=[5, 44], window=7,
+                                            max_workers=3,
+                                            on_window=lambda *args: windows.append(args))
+            assert names == expected
+            assert sorted(time_window for time_window, _ in windows) == [
+                [5, 12], [12, 19], [19, 26], [26, 33], [33, 40], [40, 44]]
+            assert api.get_datacollections(time_limits=[5, 44], window=10, limit=12) == \
+                api.get_datacollections(time_limits=[5, 44], limit=12)
+            assert api.get_datacollections(time_limits=[45, 60], window=5) == [
+                'datacollection_{0:05d}'.format(i) for i in range(45, 50)]
+            self.assertRaises(BdcApiException, api.get_datacollections,
+                              time_limits=[60, 90], window=10)
+            self.assertRaises(BdcApiException, api.get_datacollections, window=10)
+
+class TestMetrics(unittest.TestCase):
+
+    def test_hooks(self):
+        """Ensure that hooks see every request, retry and cache hit."""
+        with StandinServer(failures=2) as server:
+            api = BdcApi('test_user', 'somekey', server.url, backoff_factor=0, cache=True)
+            before, after = [], []
+            api.register_hook('pre_request', before.append)
+            api.register_hook('post_request', after.append)
+            api.get_task_numbers()
+            api.get_task_numbers()
+            self.assertRaises(BdcApiException, api.check_query_progress, 'f' * 24)
+            assert [info.endpoint for info in before] == [BdcApi.URL_TASK_NUMBERS,
+                                                          BdcApi.URL_PROGRESS]
+            sent, cached, failed = after
+            assert sent.status == 200 and sent.retries == 2 and not sent.cached
+            assert sent.response_bytes == len(json.dumps(_StandinHandler.TASKS))
+            assert cached.cached and cached.response_bytes == sent.response_bytes
+            assert isinstance(failed.error, BdcApiException)
+            assert api.deregister_hook('post_request', after.append)
+            assert not api.deregister_hook('post_request', after.append)
+            self.assertRaises(BdcApiException, api.register_hook, 'response', print)
+
+    def test_hooks_failed_status(self):
+        """Ensure that hooks see the status of requests failing with an HTTP error."""
+        with StandinServer(failures=1) as server:
+            api = BdcApi('test_user', 'somekey', server.url, max_retries=0)
+            after = []
+            api.register_hook('post_request', after.append)
+            self.assertRaises(BdcApiException, api.get_task_numbers)
+        failed, = after
+        assert failed.status == 503 and failed.response_bytes is not None
+        assert str(failed.error).startswith('Error sending request to host server: 503')
+
+    def test_metrics(self):
+        """Ensure that metrics are recorded per endpoint and exported."""
+        with StandinServer() as server:
+            api = BdcApi('test_user', 'somekey', server.url, metrics=True)
+            for _ in range(3):
+                api.get_task_numbers()
+            metrics = api.metrics.as_dict()[BdcApi.URL_TASK_NUMBERS]
+            assert metrics['requests'] == 3 and metrics['errors'] == 0
+            assert metrics['latency_buckets']['inf'] == 3
+            assert metrics['response_bytes'] == 3 * len(json.dumps(_StandinHandler.TASKS))
+            text = api.metrics.prometheus()
+            assert 'bdc_api_requests_total{{endpoint="{0}"}} 3'.format(
+                BdcApi.URL_TASK_NUMBERS) in text
+            assert 'bdc_api_request_seconds_bucket{{endpoint="{0}",le="+Inf"}} 3'.format(
+                BdcApi.URL_TASK_NUMBERS) in text
+            copy = pickle.loads(pickle.dumps(api))
+            assert copy.metrics.as_dict() == api.metrics.as_dict()
+            api.metrics.reset()
+            assert api.metrics.as_dict() == {}
+
+class TestMetadataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.files = {'test_coll_0': ['/file_0.txt', '/file_1.txt']}
+
+    @patch('bdc_api.BdcApi._send_get')
+    def test_cached_get_files(self, mock_get):
+        """Ensure that repeated listings are served from the cache."""
+        mock_get.return_value.content = json.dumps(self.files)
+        api = BdcApi('test_user', 'somekey', 'localhost', cache=True)
+        assert api.get_files('test_coll_0') == self.files
+        assert api.get_files('test_coll_0') == self.files
+        assert mock_get.call_count == 1
+        api.get_files('test_coll_0', extensions='txt')
+        assert mock_get.call_count == 2
+        api.invalidate_cache(BdcApi.URL_FILELIST)
+        api.get_files('test_coll_0')
+        assert mock_get.call_count == 3
+
+    @patch('bdc_api.BdcApi._send_get')
+    def test_cache_ttl(self, mock_get):
+        """Ensure that expired or disabled endpoints hit the server."""
+        mock_get.return_value.content = json.dumps([{'name': 'test_coll_0'}])
+        cache = MetadataCache(ttls={BdcApi.URL_DATACOLLECTIONS: 0})
+        api = BdcApi('test_user', 'somekey', 'localhost', cache=cache)
+        api.get_datacollections()
+        api.get_datacollections()
+        assert mock_get.call_count == 2
+        mock_get.return_value.content = json.dumps({'ARES': ['domain_1']})
+        cache.ttls[BdcApi.URL_DOMAINS] = 0.05
+        api.get_domains()
+        api.get_domains()
+        assert mock_get.call_count == 3
+        time.sleep(0.06)
+        api.get_domains()
+        assert mock_get.call_count == 4
+
+    @patch('bdc_api.BdcApi._send_get')
+    def test_cache_persistent(self, mock_get):
+        """Ensure that the on-disk tier is shared between cache instances."""
+        mock_get.return_value.content = json.dumps(self.files)
+        path = os.path.join(self.tmp.name, 'cache.sqlite')
+        api = BdcApi('test_user', 'somekey', 'localhost', cache=MetadataCache(path=path))
+        api.get_files()
+        warm = BdcApi('test_user', 'somekey', 'localhost',
+                cache=MetadataCache(path=path, max_entries=1))
+        assert warm.get_files() == self.files
+        assert mock_get.call_count == 1
+        other_user = BdcApi('other_user', 'somekey', 'localhost', cache=MetadataCache(path=path))
+        other_user.get_files()
+        assert mock_get.call_count == 2
+        warm.invalidate_cache()
+        BdcApi('test_user', 'somekey', 'localhost', cache=MetadataCache(path=path)).get_files()
+        assert mock_get.call_count == 3
+
+class TestCatalogIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.api = BdcApi('test_user', 'somekey', 'localhost')
+        self.files = {'test_coll_0': ['/data/a/file_0.txt', '/data/a/file_0.json'],
+                      'test_coll_1': ['/data/b/file_1.TXT', '/data/b/file_1.h5']}
+
+    @patch('bdc_api.BdcApi.iter_files')
+    @patch('bdc_api.BdcApi.get_datacollections')
+    def test_sync_and_query(self, mock_dcols, mock_files):
+        """Ensure that the index is filled and queried locally."""
+        mock_dcols.return_value = list(self.files)
+        mock_files.side_effect = lambda datacollections: [
+                (name, path) for name in datacollections for path in self.files[name]]
+        index = CatalogIndex(self.api, os.path.join(self.tmp.name, 'catalog.sqlite'))
+        assert index.last_sync is None
+        assert index.sync() == 2
+        assert mock_dcols.call_args[1]['time_limits'] == []
+        assert index.datacollections() == ['test_coll_0', 'test_coll_1']
+        assert index.files(extensions='txt') == ['/data/a/file_0.txt', '/data/b/file_1.TXT']
+        assert index.files(extensions='json, .h5') == ['/data/a/file_0.json', '/data/b/file_1.h5']
+        assert index.files(prefix='/data/b/') == ['/data/b/file_1.TXT', '/data/b/file_1.h5']
+        assert index.files('test_coll_0', limit=1) == ['/data/a/file_0.json']
+        assert len(index.files()) == 4
+
+        self.files['test_coll_1'] = ['/data/b/file_2.txt']
+        self.files['test_coll_2'] = ['/data/c/file_3.txt']
+        mock_dcols.return_value = ['test_coll_1', 'test_coll_2']
+        assert index.sync() == 2
+        time_limits = mock_dcols.call_args[1]['time_limits']
+        assert len(time_limits) == 2 and time_limits[0] <= time_limits[1]
+        assert index.files(extensions='txt') == ['/data/a/file_0.txt', '/data/b/file_2.txt',
+                                                 '/data/c/file_3.txt']
+
+        mock_dcols.side_effect = BdcApiException('No datacollections found.')
+        assert index.sync() == 0
+
+    @patch('bdc_api.BdcApi.iter_files')
+    @patch('bdc_api.BdcApi.get_datacollections')
+    def test_sync_restricted(self, mock_dcols, mock_files):
+        """Ensure that a restricted sync does not hide other datacollections from a
+        later unrestricted one."""
+        mock_dcols.return_value = ['test_coll_0']
+        mock_files.side_effect = lambda datacollections: [
+                (name, path) for name in datacollections for path in self.files[name]]
+        index = CatalogIndex(self.api, os.path.join(self.tmp.name, 'catalog.sqlite'))
+        assert index.sync(domains=['domain_0']) == 1
+        assert index.last_sync is None
+        mock_dcols.return_value = list(self.files)
+        assert index.sync() == 2
+        assert mock_dcols.call_args[1]['time_limits'] == []
+        assert index.datacollections() == ['test_coll_0', 'test_coll_1']
+        index.sync(domains='domain_0')
+        time_limits = mock_dcols.call_args[1]['time_limits']
+        assert time_limits[0] == index.last_sync
+
+    @patch('bdc_api.BdcApi.iter_files')
+    @patch('bdc_api.BdcApi.get_datacollections')
+    def test_files_distinct(self, mock_dcols, mock_files):
+        """Ensure that paths listed by several datacollections are returned once."""
+        self.files['test_coll_1'].append('/data/a/file_0.txt')
+        mock_dcols.return_value = list(self.files)
+        mock_files.side_effect = lambda datacollections: [
+                (name, path) for name in datacollections for path in self.files[name]]
+        index = CatalogIndex(self.api, os.path.join(self.tmp.name, 'catalog.sqlite'))
+        index.sync()
+        assert index.files(extensions='txt') == ['/data/a/file_0.txt', '/data/b/file_1.TXT']
+        assert index.files(extensions='txt', limit=1) == ['/data/a/file_0.txt']
+        assert index.files('test_coll_1', extensions='txt') == ['/data/a/file_0.txt',
+                                                                '/data/b/file_1.TXT']
+
+class TestBdcApiDownloads(unittest.TestCase):
+
+    def setUp(self):
+        self.api = BdcApi('test_user', 'somekey', 'localhost')
+        self.api.DOWNLOAD_CHUNK_SIZE = 1024
+        self.body = os.urandom(10 * 1024 + 17)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_save_file_streams_to_disk(self):
+        """Ensure that save_file streams the archive into place and reports statistics."""
+        self.api.session = FakeDownloadSession(self.body)
+        result = self.api.save_file(QUERY_ID, local_path=self.tmp.name)
+        full_path = os.path.join(self.tmp.name, 'download_{0}.zip'.format(QUERY_ID))
+        assert result['path'] == full_path
+        assert result['bytes'] == len(self.body)
+        assert result['throughput'] > 0
+        with open(full_path, 'rb') as f:
+            assert f.read() == self.body
+        assert os.listdir(self.tmp.name) == [os.path.basename(full_path)]
+
+    def test_save_file_stream_interrupted(self):
+        """Ensure that an interrupted transfer raises and leaves no archive behind."""
+        self.api.session = FakeDownloadSession(self.body, fail_after=4096)
+        self.assertRaises(BdcApiException, self.api.save_file, QUERY_ID,
+                local_path=self.tmp.name)
+        assert not os.path.exists(
+                os.path.join(self.tmp.name, 'download_{0}.zip'.format(QUERY_ID)))
+        assert os.path.getsize(
+                os.path.join(self.tmp.name, '{0}.partial'.format(QUERY_ID))) == 4096
+
+    def test_save_file_resume(self):
+        """Ensure that an interrupted transfer continues from the last received byte."""
+        session = FakeDownloadSession(self.body, fail_after=4096)
+        self.api.session = session
+        self.assertRaises(BdcApiException, self.api.save_file, QUERY_ID,
+                local_path=self.tmp.name)
+        result = self.api.save_file(QUERY_ID, local_path=self.tmp.name)
+        assert session.requests[-1]['Range'] == 'bytes=4096-'
+        assert session.requests[-1]['If-Range'] == '"v1"'
+        assert result['resumed_from'] == 4096
+        assert result['bytes'] == len(self.body) - 4096
+        with open(result['path'], 'rb') as f:
+            assert f.read() == self.body
+        assert os.listdir(self.tmp.name) == [os.path.basename(result['path'])]
+
+    def test_save_file_resume_ignored(self):
+        """Ensure that the full archive is fetched again when ranges are not supported."""
+        self.api.session = FakeDownloadSession(self.body, fail_after=4096, ranges=False)
+        self.assertRaises(BdcApiException, self.api.save_file, QUERY_ID,
+                local_path=self.tmp.name)
+        result = self.api.save_file(QUERY_ID, local_path=self.tmp.name)
+        assert result['resumed_from'] == 0
+        with open(result['path'], 'rb') as f:
+            assert f.read() == self.body
+
+    def test_save_file_no_resume(self):
+        """Ensure that resume=False starts the download over."""
+        session = FakeDownloadSession(self.body, fail_after=4096)
+        self.api.session = session
+        self.assertRaises(BdcApiException, self.api.save_file, QUERY_ID,
+                local_path=self.tmp.name)
+        result = self.api.save_file(QUERY_ID, local_path=self.tmp.name, resume=False)
+        assert 'Range' not in session.requests[-1]
+        assert result['bytes'] == len(self.body)
+
+    def test_save_file_segmented(self):
+        """Ensure that a segmented download reassembles the archive."""
+        with StandinServer(archive_size=10 * 1024 + 17) as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            api.DOWNLOAD_CHUNK_SIZE = 1024
+            result = api.save_file(server.QUERY_ID, local_path=self.tmp.name, segments=4)
+            ranges = [headers.get('Range') for _, _, headers in server.requests]
+        assert result['segments'] == 4
+        assert result['bytes'] == server.archive_size
+        assert 'bytes=0-0' in ranges and 'bytes=7692-10256' in ranges
+        with open(result['path'], 'rb') as f:
+            assert f.read() == server.archive()
+        assert os.listdir(self.tmp.name) == [os.path.basename(result['path'])]
+
+    def test_save_file_segmented_fallback(self):
+        """Ensure that a segmented download falls back to one stream without ranges."""
+        with StandinServer(archive_size=10 * 1024, ranges=False) as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            result = api.save_file(server.QUERY_ID, local_path=self.tmp.name, segments=4)
+        assert result['segments'] == 1
+        with open(result['path'], 'rb') as f:
+            assert f.read() == server.archive()
+
+    def test_save_file_streams_other_content_types(self):
+        """Ensure that downloads which are neither zip, HDF nor JSON are streamed
+        without reading the whole body."""
+        with StandinServer(archive_size=300000, content_type='application/octet-stream') \
+                as server, patch.object(requests.Response, 'content',
+                                        new_callable=unittest.mock.PropertyMock,
+                                        side_effect=AssertionError('body read')):
+            api = BdcApi('test_user', 'somekey', server.url)
+            result = api.save_file(server.QUERY_ID, local_path=self.tmp.name)
+        assert result['bytes'] == 300000
+        with open(result['path'], 'rb') as f:
+            assert f.read() == server.archive()
+
+class TestZipExtraction(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.members = {'run_1/events.json': b'{"events": []}' * 2000,
+                        'run_1/raw.bin': os.urandom(300 * 1024),
+                        'run_2/': b'',
+                        'README.txt': b'Query results.'}
+        self.archive = os.path.join(self.tmp.name, 'archive')
+        self.extracted = os.path.join(self.tmp.name, 'extracted')
+        os.mkdir(self.archive)
+
+    def check_members(self, members):
+        files = {name: data for name, data in self.members.items() if not name.endswith('/')}
+        assert sorted(members) == sorted(os.path.join(self.extracted, *name.split('/'))
+                                         for name in files)
+        for name, data in files.items():
+            with open(os.path.join(self.extracted, *name.split('/')), 'rb') as f:
+                assert f.read() == data
+
+    def test_extract_while_streaming(self):
+        """Ensure that members are extracted and reported during the download."""
+        paths = queue.Queue()
+        for seekable in (True, False):
+            with StandinServer(content=make_zip(self.members, seekable=seekable)) as server:
+                api = BdcApi('test_user', 'somekey', server.url)
+                api.DOWNLOAD_CHUNK_SIZE = 4096
+                result = api.save_file(server.QUERY_ID, local_path=self.archive,
+                                       extract_to=self.extracted, on_member=paths,
+                                       keep_archive=False)
+            self.check_members(result['members'])
+            assert [paths.get_nowait() for _ in range(3)] == result['members']
+            assert result['path'] is None and os.listdir(self.archive) == []
+            assert os.path.isdir(os.path.join(self.extracted, 'run_2'))
+
+    def test_extract_resumed_and_segmented(self):
+        """Ensure that resumed and segmented downloads are extracted completely."""
+        body = make_zip(self.members)
+        api = BdcApi('test_user', 'somekey', 'localhost')
+        api.DOWNLOAD_CHUNK_SIZE = 4096
+        api.session = FakeDownloadSession(body, fail_after=100000)
+        self.assertRaises(BdcApiException, api.save_file, QUERY_ID, local_path=self.archive,
+                          extract_to=self.extracted)
+        result = api.save_file(QUERY_ID, local_path=self.archive, extract_to=self.extracted)
+        assert result['resumed_from'] == 100000
+        self.check_members(result['members'])
+        with StandinServer(content=body) as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            api.DOWNLOAD_CHUNK_SIZE = 4096
+            result = api.save_file(server.QUERY_ID, local_path=self.archive, segments=3,
+                                   extract_to=self.extracted)
+        assert result['segments'] == 3
+        self.check_members(result['members'])
+
+    def test_extract_fallback(self):
+        """Ensure that members which cannot be streamed are extracted afterwards, and
+        that other archives are left alone."""
+        reported = []
+        with StandinServer(content=make_zip(self.members, zipfile.ZIP_BZIP2)) as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            result = api.save_file(server.QUERY_ID, local_path=self.archive,
+                                   extract_to=self.extracted, on_member=reported.append)
+        self.check_members(result['members'])
+        assert reported == result['members']
+        with StandinServer(content_type='application/x-hdf') as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            result = api.save_file(server.QUERY_ID, local_path=self.archive,
+                                   extract_to=self.extracted)
+            assert result['members'] == [] and os.path.exists(result['path'])
+            os.remove(result['path'])
+            result = api.save_file(server.QUERY_ID, local_path=self.archive,
+                                   extract_to=self.extracted, keep_archive=False)
+            assert result['members'] == []
+            with open(result['path'], 'rb') as f:
+                assert f.read() == server.archive()
+
+class TestFileStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = FileStore(os.path.join(self.tmp.name, 'store'))
+        self.output = os.path.join(self.tmp.name, 'output')
+        os.mkdir(self.output)
+
+    def test_store(self):
+        """Ensure that files are stored once per content and validated."""
+        source = os.path.join(self.tmp.name, 'source')
+        with open(source, 'wb') as f:
+            f.write(b'content')
+        stored = self.store.add('coll_0', '/a.txt', source)
+        assert self.store.add('coll_1', '/b.txt', source) == stored
+        assert len(self.store) == 2
+        files = {'coll_0': ['/a.txt', '/c.txt'], 'coll_1': ['/b.txt']}
+        assert self.store.missing(files) == {'coll_0': ['/c.txt']}
+        linked = self.store.materialize({'coll_1': ['/b.txt']}, self.output)
+        with open(linked['coll_1']['/b.txt'], 'rb') as f:
+            assert f.read() == b'content'
+        self.assertRaises(BdcApiException, self.store.materialize, files, self.output)
+        with open(stored, 'r+b') as f:
+            f.write(b'C')
+        assert self.store.get('coll_0', '/a.txt') == stored
+        assert self.store.get('coll_0', '/a.txt', verify=True) is None
+        self.store.discard('coll_0', '/a.txt')
+        assert self.store.missing(files, verify=True) == files
+
+    def test_fetch_files(self):
+        """Ensure that only files missing from the store are queried."""
+        with StandinServer(zip_results=True, files_per_datacollection=4) as server:
+            api = BdcApi('test_user', 'somekey', server.url, store=self.store)
+            api.POLL_MIN_INTERVAL = 0.05
+            first = {'datacollection_00000': server.files('datacollection_00000')[:3]}
+            paths = api.fetch_files(first, self.output)
+            second = {'datacollection_00000': server.files('datacollection_00000'),
+                      'datacollection_00001': server.files('datacollection_00001')[:1]}
+            paths = api.fetch_files(second, self.output)
+            assert api.fetch_files(second, self.output) == paths
+            queried = [sorted(files) for files in server.job_files.values()]
+        assert queried == [sorted(first['datacollection_00000']),
+                           sorted(server.files('datacollection_00000')[3:] +
+                                  server.files('datacollection_00001')[:1])]
+        for datacollection, local in paths.items():
+            for path, local_path in local.items():
+                with open(local_path, 'rb') as f:
+                    assert f.read() == server.file_content(path)
+        assert os.listdir(os.path.join(self.store.root, 'incoming')) == []
+        self.assertRaises(BdcApiException, BdcApi('test_user', 'somekey', 'localhost').fetch_files,
+                          second, self.output)
+
+    def test_fetch_files_shared_paths(self):
+        """Ensure that a path listed by several datacollections is stored with the
+        content of each."""
+        with StandinServer(zip_results=True, datacollections=2, files_per_datacollection=2,
+                           shared_paths=True) as server:
+            api = BdcApi('test_user', 'somekey', server.url, store=self.store)
+            api.POLL_MIN_INTERVAL = 0.05
+            files = api.get_files(['datacollection_00000', 'datacollection_00001'])
+            assert files['datacollection_00000'] == files['datacollection_00001']
+            paths = api.fetch_files(files, self.output)
+            queried = list(server.job_files.values())
+        assert queried == [files['datacollection_00000']]
+        for datacollection, local in paths.items():
+            for path, local_path in local.items():
+                with open(local_path, 'rb') as f:
+                    assert f.read() == server.file_content(path, datacollection)
+
+class TestQueryRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.registry = QueryRegistry(os.path.join(self.tmp.name, 'queries.sqlite'))
+
+    def test_key(self):
+        """Ensure that keys only depend on the host, the user and the set of inputs."""
+        key = self.registry.key('host', 'user', files=['/b', '/a', '/a'])
+        assert key == self.registry.key('host', 'user', files=['/a', '/b'])
+        assert key != self.registry.key('host', 'other', files=['/a', '/b'])
+        assert key != self.registry.key('host', 'user', datacollection='/a')
+        self.registry.record(key, QUERY_ID)
+        assert self.registry.get(key) == QUERY_ID
+        self.registry.max_age = 0
+        assert self.registry.get(key) is None
+
+    def test_reuse(self):
+        """Ensure that identical queries are reused while their results are available."""
+        with StandinServer(job_duration=0) as server:
+            api = BdcApi('test_user', 'somekey', server.url, registry=self.registry)
+            files = server.files('datacollection_00000')
+            first = api.start_files_query(files)
+            assert api.start_files_query(list(reversed(files))) == first
+            assert api.start_files_query(files, reuse=False) != first
+            query_id = api.start_datacollection_query('datacollection_00000')
+            assert query_id not in (first, api.start_files_query(files[:1]))
+            assert api.start_datacollection_query('datacollection_00000') == query_id
+            assert self.registry.status(query_id) == ('success', '100%')
+            # Expired on the server
+            del server.jobs[query_id]
+            assert api.start_datacollection_query('datacollection_00000') != query_id
+            assert self.registry.status(query_id) is None
+            other = BdcApi('other_user', 'somekey', server.url, registry=self.registry)
+            assert other.start_files_query(files) != first
+        assert len(server.jobs) == 5
+
+try:
+    import h5py
+    import numpy
+except ImportError:
+    h5py = None
+
+class TestQueryResults(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.raw = os.urandom(100 * 1024)
+        self.text = b'event,energy\n' * 1000
+        self.path = os.path.join(self.tmp.name, 'download_{0}.zip'.format(QUERY_ID))
+        with zipfile.ZipFile(self.path, 'w') as archive:
+            archive.writestr('run_1/raw.bin', self.raw, compress_type=zipfile.ZIP_STORED)
+            archive.writestr('run_1/events.csv', self.text, compress_type=zipfile.ZIP_DEFLATED)
+
+    def test_zip_members(self):
+        """Ensure that zip members are readable in place, without extraction."""
+        with open_query_result(self.path) as result:
+            assert result.names() == ['run_1/raw.bin', 'run_1/events.csv']
+            view = result.view('run_1/raw.bin')
+            assert isinstance(view, memoryview) and view.readonly and view == self.raw
+            self.assertRaises(BdcApiException, result.close)
+            view.release()
+            with result.open('run_1/raw.bin') as f:
+                f.seek(50000)
+                assert f.read(10) == self.raw[50000:50010]
+            assert result.read('run_1/events.csv') == self.text
+            self.assertRaises(BdcApiException, result.view, 'run_1/events.csv')
+            self.assertRaises(BdcApiException, result.info, 'missing')
+        assert os.listdir(self.tmp.name) == [os.path.basename(self.path)]
+        with open(os.path.join(self.tmp.name, 'other'), 'wb') as f:
+            f.write(b'not a result')
+        self.assertRaises(BdcApiException, open_query_result, f.name)
+
+    @unittest.skipUnless(h5py, 'h5py is not installed')
+    def test_hdf(self):
+        """Ensure that HDF5 results, and HDF5 files inside zip results, are read lazily."""
+        data = numpy.arange(100000, dtype='float64').reshape(1000, 100)
+        hdf_path = os.path.join(self.tmp.name, 'download_{0}.h5'.format(QUERY_ID))
+        with h5py.File(hdf_path, 'w') as f:
+            f.create_dataset('run_1/contiguous', data=data)
+            f.create_dataset('run_1/chunked', data=data, chunks=(100, 100), compression='gzip')
+        with open_query_result(hdf_path) as result:
+            assert sorted(result.names()) == ['run_1/chunked', 'run_1/contiguous']
+            array = result.array('run_1/contiguous')
+            assert isinstance(array, numpy.memmap)
+            assert (array[10:20] == data[10:20]).all()
+            chunked = result.array('run_1/chunked')
+            assert isinstance(chunked, h5py.Dataset)
+            assert (chunked[500, :5] == data[500, :5]).all()
+        with zipfile.ZipFile(self.path, 'a') as archive:
+            archive.write(hdf_path, 'run_1/data.h5')
+        with open_query_result(self.path) as result:
+            with result.hdf('run_1/data.h5') as f:
+                assert (f['run_1/contiguous'][999] == data[999]).all()
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def test_rate_limit(self):
+        """Ensure that each request class is limited to its rate."""
+        scheduler = RequestScheduler(rates={'metadata': (20, 1)})
+        with StandinServer() as server:
+            api = BdcApi('test_user', 'somekey', server.url, scheduler=scheduler)
+            started = time.monotonic()
+            for _ in range(6):
+                api.get_task_numbers()
+            assert time.monotonic() - started >= 0.24
+        self.assertRaises(BdcApiException, RequestScheduler, rates={'uploads': 1})
+        self.assertRaises(BdcApiException, RequestScheduler, rates={'query': 0})
+        assert pickle.loads(pickle.dumps(scheduler)).rates == scheduler.rates
+
+    def test_priority(self):
+        """Ensure that waiting requests are served by priority, then in order."""
+        scheduler = RequestScheduler(rates={'progress': (20, 1)})
+        scheduler.acquire('progress')
+        served = []
+
+        def request(name, priority):
+            with scheduler.priority(priority):
+                scheduler.acquire('progress')
+            served.append(name)
+        threads = []
+        for name, priority in [('bulk', RequestScheduler.BULK), ('first', None),
+                               ('second', None), ('urgent', -1)]:
+            threads.append(threading.Thread(target=request, args=(name, priority)))
+            threads[-1].start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        assert served == ['urgent', 'first', 'second', 'bulk']
+
+    def test_total_rate(self):
+        """Ensure that interactive requests overtake queued downloads under the total
+        rate."""
+        scheduler = RequestScheduler(rates={'total': (10, 1)})
+        scheduler.acquire('metadata')
+        served = []
+
+        def request(request_class):
+            scheduler.acquire(request_class)
+            served.append(request_class)
+        threads = []
+        for request_class in ['download', 'download', 'metadata', 'progress']:
+            threads.append(threading.Thread(target=request, args=(request_class,)))
+            threads[-1].start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        assert served == ['metadata', 'progress', 'download', 'download']
+        self.assertRaises(BdcApiException, RequestScheduler, priorities={'total': 1})
+
+    def test_bandwidth(self):
+        """Ensure that downloads are capped in bytes per second."""
+        scheduler = RequestScheduler(max_bytes_per_second=2 * 1024 * 1024)
+        with StandinServer(archive_size=3 * 1024 * 1024) as server, \
+                tempfile.TemporaryDirectory() as directory:
+            api = BdcApi('test_user', 'somekey', server.url, scheduler=scheduler)
+            api.DOWNLOAD_CHUNK_SIZE = 256 * 1024
+            started = time.monotonic()
+            api.save_file(server.QUERY_ID, local_path=directory)
+            assert time.monotonic() - started >= 0.45
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+@unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+class TestCatalogTables(unittest.TestCase):
+
+    def test_load_catalogs(self):
+        """Ensure that catalogs are loaded into one table, in the order of get_files."""
+        with StandinServer(zip_results=True, files_per_datacollection=6) as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            api.POLL_MIN_INTERVAL = 0.05
+            names = ['datacollection_00001', 'datacollection_00000']
+            table = api.load_catalogs(names)
+            catalogs = [path for name in names for path in api.get_files(name, 'json')[name]]
+            assert table.column_names == ['datacollection', 'catalog', 'detector.gain',
+                                          'detector.id', 'file', 'record', 'size', 'tags',
+                                          'valid']
+            assert table.num_rows == 2 * len(catalogs) == 8
+            assert table.column('catalog').to_pylist() == [path for path in catalogs
+                                                           for _ in range(2)]
+            assert table.column('file').to_pylist() == table.column('catalog').to_pylist()
+            assert str(table.schema.field('detector.id').type) == 'int64'
+            assert str(table.schema.field('detector.gain').type) == 'double'
+            assert table.column('valid').to_pylist() == [True, False] * 4
+            assert json.loads(table.column('tags')[1].as_py()) == ['standin', '1']
+            api.CATALOGS_PER_TASK = 1
+            frame = api.load_catalogs(names, output='pandas', fields=['record', 'missing'],
+                                      max_workers=2)
+            assert list(frame.columns) == ['datacollection', 'catalog', 'record', 'missing']
+            assert frame['record'].tolist() == [0, 1] * 4
+            assert frame['missing'].isnull().all()
+            self.assertRaises(BdcApiException, api.load_catalogs, names, output='csv')
+
+    def test_load_catalogs_shared_paths(self):
+        """Ensure that a catalog path listed by several datacollections is parsed from
+        the member of each."""
+        with StandinServer(zip_results=True, datacollections=2, files_per_datacollection=3,
+                           shared_paths=True) as server:
+            api = BdcApi('test_user', 'somekey', server.url)
+            api.POLL_MIN_INTERVAL = 0.05
+            names = ['datacollection_00000', 'datacollection_00001']
+            table = api.load_catalogs(names, fields=['detector.id'])
+        assert table.column('datacollection').to_pylist() == [names[0]] * 2 + [names[1]] * 2
+        assert table.column('catalog').to_pylist() == ['/file_00001.json'] * 4
+        assert table.column('detector.id').to_pylist() == [
+            json.loads(server.file_content('/file_00001.json', name))[i]['detector']['id']
+            for name in names for i in range(2)]
+
+@unittest.skipUnless(pyarrow, 'pyarrow is not installed')
+class TestConversionPipeline(unittest.TestCase):
+
+    def test_convert_download(self):
+        """Ensure that members are converted by extension while downloading."""
+        import pyarrow.parquet
+        members = {'run_1/catalog.json': json.dumps([{'id': 1, 'meta': {'gain': 0.5}},
+                                                     {'id': 2, 'meta': {'gain': 1.5}}]),
+                   'run_1/events.csv': 'event,energy\n' + '1,2.5\n' * 1000,
+                   'run_1/broken.json': '{"id": ',
+                   'run_1/raw.bin': os.urandom(1024)}
+        data = numpy.arange(3000, dtype='float32').reshape(1000, 3) if h5py else None
+        with tempfile.TemporaryDirectory() as directory:
+            if h5py:
+                with h5py.File(os.path.join(directory, 'data.h5'), 'w') as f:
+                    f.create_dataset('detector/grid', data=data)
+                with open(os.path.join(directory, 'data.h5'), 'rb') as f:
+                    members['run_2/data.h5'] = f.read()
+            extracted = os.path.join(directory, 'extracted')
+            converted = os.path.join(directory, 'converted')
+            with StandinServer(content=make_zip(members)) as server:
+                api = BdcApi('test_user', 'somekey', server.url)
+                with ConversionPipeline(extracted, converted, max_workers=2,
+                                        max_pending=1) as pipeline:
+                    api.save_file(server.QUERY_ID, local_path=directory,
+                                  extract_to=extracted, on_member=pipeline)
+            with open(os.path.join(converted, ConversionPipeline.MANIFEST)) as f:
+                manifest = {entry['source']: entry for entry in json.load(f)}
+            assert manifest == {entry['source']: entry for entry in pipeline.manifest}
+            expected = ['run_1/broken.json', 'run_1/catalog.json', 'run_1/events.csv']
+            assert sorted(manifest) == expected + (['run_2/data.h5'] if h5py else [])
+            assert manifest['run_1/broken.json']['error'].startswith('JSONDecodeError')
+            assert manifest['run_1/catalog.json']['outputs'] == ['run_1/catalog.parquet']
+            table = pyarrow.parquet.read_table(os.path.join(converted, 'run_1/catalog.parquet'))
+            assert table.column_names == ['id', 'meta.gain']
+            assert table.column('meta.gain').to_pylist() == [0.5, 1.5]
+            table = pyarrow.parquet.read_table(os.path.join(converted, 'run_1/events.parquet'))
+            assert table.num_rows == 1000 and table.column('energy')[0].as_py() == 2.5
+            if h5py:
+                assert manifest['run_2/data.h5']['outputs'] == ['run_2/data/detector/grid.npy']
+                assert (numpy.load(os.path.join(converted, 'run_2/data/detector/grid.npy'))
+                        == data).all()
+            self.assertRaises(BdcApiException, pipeline.submit,
+                              os.path.join(extracted, 'run_1/catalog.json'))
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+@unittest.skipUnless(aiohttp, 'aiohttp is not installed')
+class TestAsyncBdcApi(unittest.TestCase):
+
+    def setUp(self):
+        self.api = AsyncBdcApi('test_user', 'somekey', 'localhost')
+
+    @patch('bdc_api.AsyncBdcApi._send_get')
+    def test_get_datacollections(self, mock_get):
+        """Ensure that get_datacollections works as a coroutine."""
+        mock_get.return_value = [{'name': 'test_coll_0'}, {'name': 'test_coll_1'}]
+        dcols = asyncio.run(self.api.get_datacollections(domains='TEST_DOMAIN_2', limit=2))
+        assert dcols == ['test_coll_0', 'test_coll_1']
+        assert mock_get.call_args[1]['parameters'] == {'domains': 'TEST_DOMAIN_2', 'limit': 2}
+
+    @patch('bdc_api.AsyncBdcApi._send_get')
+    def test_check_query_progress_concurrent(self, mock_get):
+        """Ensure that many progress checks can be outstanding at once."""
+        async def progress(url):
+            await asyncio.sleep(0.05)
+            return {'progress': '100%', 'job_status': 'success'}
+        mock_get.side_effect = progress
+        async def check_all():
+            return await asyncio.gather(*[self.api.check_query_progress(QUERY_ID)
+                                          for _ in range(200)])
+        infos = asyncio.run(check_all())
+        assert len(infos) == 200
+        assert all(info.progress == AsyncBdcApi.COMPLETE_QUERY for info in infos)
+        self.assertRaises(BdcApiException, asyncio.run,
+                self.api.check_query_progress('not_an_ID'))
+
+    @patch('bdc_api.AsyncBdcApi._send_post')
+    def test_start_files_query(self, mock_post):
+        """Ensure that start_files_query works as a coroutine."""
+        mock_post.return_value = {'query_id': QUERY_ID}
+        assert asyncio.run(self.api.start_files_query(['file_1', 'file_2'])) == QUERY_ID
+        assert mock_post.call_args[0][1] == {'filepaths': 'file_1,file_2'}
+
+    def test_save_file(self):
+        """Ensure that save_file streams the archive to disk."""
+        async def download(server, directory):
+            async with AsyncBdcApi('test_user', 'somekey', server.url) as api:
+                return await api.save_file(server.QUERY_ID, local_path=directory)
+        with tempfile.TemporaryDirectory() as directory, \
+                StandinServer(archive_size=3 * 1024 * 1024 + 5) as server:
+            result = asyncio.run(download(server, directory))
+            with open(result['path'], 'rb') as f:
+                assert f.read() == server.archive()
+            assert os.listdir(directory) == [os.path.basename(result['path'])]
+            assert server.requests[0][2]['Authorization'].startswith('Basic ')
+
+    def test_html_replies(self):
+        """Ensure that replies which are not JSON raise BdcApiException."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status):
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', '13')
+                self.end_headers()
+                self.wfile.write(b'<html></html>')
+
+            def do_GET(self):
+                self.reply(200)
+
+            def do_POST(self):
+                self.reply(502)
+
+        async def call(url, method, *args):
+            async with AsyncBdcApi('test_user', 'somekey', url) as api:
+                return await getattr(api, method)(*args)
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.addCleanup(httpd.server_close)
+        self.addCleanup(httpd.shutdown)
+        url = 'http://127.0.0.1:{0}'.format(httpd.server_port)
+        for method, args in [('start_files_query', ['file_1']),
+                             ('start_datacollection_query', ['coll_1']),
+                             ('get_task_numbers', []), ('get_files', [['coll_1']])]:
+            with self.assertRaises(BdcApiException):
+                asyncio.run(call(url, method, *args))
+
+    def test_save_file_other_content_type(self):
+        """Ensure that save_file saves downloads which are neither zip nor HDF."""
+        async def download(server, directory):
+            async with AsyncBdcApi('test_user', 'somekey', server.url) as api:
+                return await api.save_file(server.QUERY_ID, local_path=directory)
+        with tempfile.TemporaryDirectory() as directory, \
+                StandinServer(archive_size=300000,
+                              content_type='application/octet-stream') as server:
+            result = asyncio.run(download(server, directory))
+            assert result['bytes'] == 300000
+            with open(result['path'], 'rb') as f:
+                assert f.read() == server.archive()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file